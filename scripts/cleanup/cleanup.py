@@ -0,0 +1,272 @@
+"""
+Clean-up pipeline: from the downloaded data in data/processing/ to the
+exported dataset tables in data/export/
+
+Usage (from the repository root):
+    python scripts/cleanup/cleanup.py --processing-path ./data/processing/ --export-path ./data/export/
+"""
+
+# standard library imports
+import argparse
+import os
+import sys
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import dataset
+import history
+import manifest
+import pipeline
+import steps
+import transforms
+from pipeline import Stage
+
+# Exported tables: export with the index
+EXPORT_TABLES = {
+    'steam': True,
+    'steam_optional': True,
+    'steam_description_data': True,
+    'steam_media_data': True,
+    'steam_packages_info': False,
+    'steam_requirements_data': True,
+    'steam_support_info': True,
+    'steamspy_tag_data': True,
+    'missing_ids': False,
+}
+
+
+def get_stages(processing_path, storefront_file='steam_app_data.csv', steamspy_file='steamspy_data.csv',
+               reviews_file='steamreviews_data.csv', missing_ids_file='missing_ids.csv',
+               collection_date=steps.COLLECTION_DATE, usd_eu_rate=steps.USD_EU_RATE, workers=None,
+               chunksize=None):
+    """
+    Return the clean-up stages reading the raw files from processing_path.
+
+    With chunksize, the Storefront file is streamed in chunks of rows, and
+    the heavy text columns are spilled to the cache on the way and exported
+    chunk by chunk, only the narrow columns are kept in memory.
+    """
+    path = lambda filename: os.path.join(processing_path, filename)
+    apps = {'apps': ['row']}
+    if chunksize:
+        storefront = [
+            Stage('storefront', steps.read_storefront_chunks, outputs=['storefront', *steps.SPILLED_COLUMNS],
+                  params={'path': path(storefront_file)}, files=['path'],
+                  options={'chunksize': chunksize, 'workers': workers}, chunked=True),
+            Stage('steam_requirements_data', steps.cleanRequirementsChunks,
+                  inputs={**apps, 'storefront_requirements': None}, streamed=['storefront_requirements'],
+                  chunked=True),
+            Stage('steam_description_data', steps.cleanDescriptionsChunks,
+                  inputs={**apps, 'storefront_descriptions': None}, streamed=['storefront_descriptions'],
+                  chunked=True),
+            Stage('steam_media_data', steps.cleanMediaChunks,
+                  inputs={**apps, 'storefront_media': None}, streamed=['storefront_media'], chunked=True),
+        ]
+    else:
+        storefront = [
+            Stage('storefront', steps.read_storefront, params={'path': path(storefront_file)}, files=['path'],
+                  options={'workers': workers}),
+            Stage('steam_requirements_data', steps.cleanRequirements,
+                  inputs={**apps, 'storefront': steps.SPILLED_COLUMNS['storefront_requirements']}),
+            Stage('steam_description_data', steps.cleanDescriptions,
+                  inputs={**apps, 'storefront': steps.SPILLED_COLUMNS['storefront_descriptions']}),
+            Stage('steam_media_data', steps.cleanMedia,
+                  inputs={**apps, 'storefront': steps.SPILLED_COLUMNS['storefront_media']}),
+        ]
+    return [
+        *storefront,
+        Stage('steamspy', steps.read_steamspy, params={'path': path(steamspy_file)}, files=['path']),
+        Stage('reviews_raw', steps.read_reviews, params={'path': path(reviews_file)}, files=['path']),
+        Stage('missing_ids_raw', steps.read_missing_ids, params={'path': path(missing_ids_file)}, files=['path']),
+
+        Stage('apps', steps.fix_apps, outputs=['apps', 'missing_ids'],
+              inputs={'storefront': ['steam_appid', 'download_appid', 'name', 'type', 'last_modified'],
+                      'missing_ids_raw': None}),
+        Stage('developers', steps.fixDevPub,
+              inputs={**apps, 'storefront': ['developers', 'publishers'],
+                      'steamspy': ['developers', 'publishers'], 'fullgame': ['fullgame']}),
+        Stage('details', steps.clean_details,
+              inputs={**apps, 'storefront': ['required_age', 'content_descriptors', 'platforms', 'genres',
+                                             'categories', 'achievements', 'demos', 'packages',
+                                             'ext_user_account_notice', 'drm_notice']}),
+        Stage('languages', steps.clean_languages,
+              inputs={**apps, 'storefront': ['supported_languages'], 'steamspy': ['supported_languages']}),
+        Stage('release', steps.cleanReleaseDate, params={'collection_date': collection_date},
+              inputs={**apps, 'storefront': ['release_date', 'coming_soon']}),
+        Stage('price', steps.cleanPrice, params={'usd_eu_rate': usd_eu_rate},
+              inputs={**apps, 'storefront': ['is_free', 'currency', 'price_initial']}),
+        Stage('fullgame', steps.fullgame_cleaning,
+              inputs={'apps': ['row', 'type'], 'storefront': ['fullgame', 'dlc']}),
+        Stage('reviews', steps.clean_reviews,
+              inputs={**apps, 'storefront': ['metacritic_score', 'metacritic_url'], 'reviews_raw': None}),
+        Stage('steamspy_data', steps.clean_steamspy,
+              inputs={'steamspy': ['owners', 'average_forever', 'median_forever', 'tags']}),
+
+        Stage('steamspy_tag_data', steps.clean_tags, inputs={'steamspy': ['tag_votes']}),
+        Stage('steam_packages_info', steps.cleanPackageGroups, inputs={**apps, 'storefront': ['package_groups']}),
+        Stage('steam_support_info', steps.cleanSupport,
+              inputs={**apps, 'storefront': ['website', 'support_url', 'support_email']}),
+        Stage('steam', steps.steam_export, outputs=['steam', 'steam_optional'],
+              inputs={'apps': ['type', 'name', 'last_modified'], 'developers': None, 'details': None,
+                      'languages': None, 'release': None, 'price': None, 'fullgame': None,
+                      'reviews': None, 'steamspy_data': None}),
+        Stage('history_snapshot', steps.history_snapshot,
+              inputs={**apps, **{output: [column for name, column in steps.HISTORY_COLUMNS if name == output]
+                                 for output in ('steam', 'storefront', 'steamspy')}}),
+    ]
+
+
+def export_data(df, export_path, filename, index=False, list_columns=[]):
+    """
+    Export dataframe to the csv file in the export folder.
+
+    Parameters
+    ----------
+    df : dataframe to export, or an iterable of dataframe chunks appended one by one
+    export_path : export folder
+    filename : file name string without file extension
+
+    Keyword arguments
+    -----------------
+    index : boolean, to export index as well or not
+    list_columns : list columns to transform from '['item']' to the simple ';' delimited list
+    """
+    filepath = os.path.join(export_path, filename + '.csv')
+
+    def list_convert(input_list):
+        if not isinstance(input_list, (list, tuple)):
+            return ''
+        return ';'.join(str(item) for item in input_list)
+
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+    with open(filepath, 'w', newline='') as f:
+        for i, chunk in enumerate(chunks):
+            chunk = chunk.copy()
+            for col in list_columns:
+                chunk[col] = chunk[col].apply(list_convert)
+            chunk.to_csv(f, index=index, header=(i == 0))
+    print(f'Exported {filename} to "{filepath}"')
+
+
+def get_appids(cleanup, table, index):
+    """
+    Return (appids, number of rows) of the exported table, read without the other columns.
+    """
+    if cleanup.stages[table].chunked:
+        chunks = list(cleanup.get_chunks(table, columns=[] if index else ['appid']))
+    else:
+        chunks = [cleanup.get(table)]
+    appids = [chunk.index.to_numpy() if index else chunk['appid'].to_numpy() for chunk in chunks]
+    appids = np.concatenate(appids) if appids else np.empty(0, dtype=np.int64)
+    return appids, len(appids)
+
+
+def combined_cleanup(processing_path='./data/processing/', export_path='./data/export/', cache_path=None,
+                     tables=None, formats=('csv',), workers=None, chunksize=None, history_path=None, verbose=False,
+                     **kwargs):
+    """
+    Run the clean-up stages and export the dataset tables.
+
+    Only the stages whose code, parameters or input files changed since the
+    previous run are recomputed, the others are loaded from the cache. The
+    manifest of the exported tables is updated and checked.
+
+    Keyword arguments
+    -----------------
+    processing_path : folder with the downloaded data (default './data/processing/')
+    export_path : folder to export the tables to (default './data/export/')
+    cache_path : folder of the stage cache (default None, 'cache/' in processing_path)
+    tables : tables to export (default None, all tables from EXPORT_TABLES)
+    formats : export formats, 'csv' and the typed dataset.FORMATS (default ('csv',))
+    workers : number of decoding processes (default None, number of CPUs)
+    chunksize : rows of the Storefront file read at once (default None, the whole
+        file), the heavy text columns are spilled and exported in chunks
+    history_path : folder of the history store to record the snapshot of
+        the collection date to (default None, no history), requires collection_date
+    verbose : print computed and loaded stages, default to False
+    **kwargs : file names, collection_date and usd_eu_rate passed to get_stages
+
+    Returns
+    -------
+    pipeline.Pipeline with the computed stages in 'computed'
+    """
+    if history_path and ('collection_date' not in kwargs):
+        raise ValueError('collection_date is required to record the history')
+    cache_path = cache_path or os.path.join(processing_path, 'cache')
+    transforms.set_cache(os.path.join(cache_path, 'transforms.sqlite'))
+    cleanup = pipeline.Pipeline(get_stages(processing_path, workers=workers, chunksize=chunksize, **kwargs),
+                                cache_path, verbose)
+    os.makedirs(export_path, exist_ok=True)
+    entries = {}
+    for table in tables or EXPORT_TABLES:
+        if cleanup.stages[table].chunked:
+            data = cleanup.get_chunks(table)
+        else:
+            data = cleanup.get(table)
+        files = []
+        for file_format in formats:
+            if file_format == 'csv':
+                export_data(data, export_path, table, index=EXPORT_TABLES[table])
+                files.append(os.path.join(export_path, table + '.csv'))
+            else:
+                dataset.export_table(data, export_path, table, file_format, index=EXPORT_TABLES[table])
+                files.append(dataset.get_path(export_path, table, file_format))
+        appids, rows = get_appids(cleanup, table, EXPORT_TABLES[table])
+        entries[table] = manifest.get_entry(appids, rows, EXPORT_TABLES[table], files)
+
+    storefront = cleanup.get('storefront', ['download_appid'])
+    missing_ids = cleanup.get('missing_ids_raw')
+    sources = {
+        'steam_app_data': manifest.get_entry(storefront['download_appid'], len(storefront)),
+        'missing_ids': manifest.get_entry(missing_ids['appid'], len(missing_ids)),
+    }
+    problems = manifest.check_manifest(manifest.update_manifest(export_path, entries, sources))
+    for problem in problems:
+        print(problem)
+    print('Integrity check', 'failed' if problems else 'passed')
+
+    if history_path:
+        collected = kwargs['collection_date']
+        store = history.HistoryStore(history_path)
+        if store.times()[-1:] == [pd.Timestamp(collected)]:
+            print(f'History of {collected} is already recorded')
+        else:
+            result = store.append(cleanup.get('history_snapshot'), collected)
+            print(f'Recorded {result["values"]} changed values of {result["changed_apps"]} apps and '
+                  f'{result["removed"]} removed apps to the history of {collected}')
+    return cleanup
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Steam data clean-up')
+    parser.add_argument('--processing-path', default='./data/processing/')
+    parser.add_argument('--export-path', default='./data/export/')
+    parser.add_argument('--cache-path', help="stage cache folder, default 'cache/' in the processing path")
+    parser.add_argument('--tables', nargs='*', choices=list(EXPORT_TABLES), help='tables to export, default all')
+    parser.add_argument('--formats', nargs='+', default=['csv'], choices=['csv', *dataset.FORMATS],
+                        help='export formats, default csv')
+    parser.add_argument('--workers', type=int, help='decoding processes, default number of CPUs')
+    parser.add_argument('--chunksize', type=int,
+                        help='stream the Storefront file in chunks of rows, default read it at once')
+    parser.add_argument('--history-path', help='history store folder to record the snapshot to, default none')
+    parser.add_argument('--collection-date',
+                        help=f'date of the data collection, required with --history-path, '
+                             f'default {steps.COLLECTION_DATE}')
+    parser.add_argument('--usd-eu-rate', type=float, default=steps.USD_EU_RATE,
+                        help=f'USD to EUR rate of the collection date, default {steps.USD_EU_RATE}')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(args)
+    if args.history_path and not args.collection_date:
+        parser.error('--collection-date is required with --history-path')
+    dates = {'collection_date': args.collection_date} if args.collection_date else {}
+    combined_cleanup(args.processing_path, args.export_path, args.cache_path, args.tables, args.formats,
+                     args.workers, args.chunksize, args.history_path, args.verbose,
+                     usd_eu_rate=args.usd_eu_rate, **dates)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Typed export of the dataset tables to Parquet or Feather, and the loader of
+the exported tables
+
+The tables are written with an explicit schema (Int32 appids, categorical
+types, nullable booleans, native list columns, datetime release dates), so
+they are read back without the dtype hints and the list parsing of the csv
+files.
+
+Usage:
+    import dataset
+    steam = dataset.load_dataset('steam', columns=['type', 'name', 'genres'])
+"""
+
+# standard library imports
+import json
+import os
+
+# third-party imports
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# File extensions of the typed formats
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+# Schema metadata keys: columns stored as json strings, and the index columns
+JSON_COLUMNS_KEY = b'json_columns'
+INDEX_COLUMNS_KEY = b'index_columns'
+
+# Marks the columns with the nested dicts stored as json strings
+JSON = 'json'
+
+APPID = pa.int32()
+CATEGORY = pa.dictionary(pa.int32(), pa.string())
+APPID_LIST = pa.list_(pa.int32())
+STRING_LIST = pa.list_(pa.string())
+
+# Column types of the exported tables
+SCHEMAS = {
+    'steam': {
+        'appid': APPID,
+        'type': CATEGORY,
+        'name': pa.string(),
+        'required_age': pa.int8(),
+        'dlc': APPID_LIST,
+        'fullgame': APPID,
+        'supported_languages': STRING_LIST,
+        'developers': STRING_LIST,
+        'publishers': STRING_LIST,
+        'packages': APPID_LIST,
+        'platforms': STRING_LIST,
+        'categories': STRING_LIST,
+        'genres': STRING_LIST,
+        'achievements': pa.int32(),
+        'release_date': pa.timestamp('ms'),
+        'last_modified': pa.int64(),
+        'supported_audio': STRING_LIST,
+        'coming_soon': pa.bool_(),
+        'price': pa.float64(),
+        'review_score': pa.int16(),
+        'total_positive': pa.int32(),
+        'total_negative': pa.int32(),
+        'rating': pa.float64(),
+        'owners': CATEGORY,
+        'average_forever': pa.float64(),
+        'median_forever': pa.float64(),
+        'tags': STRING_LIST,
+    },
+    'steam_optional': {
+        'appid': APPID,
+        'drm_notice': pa.string(),
+        'ext_user_account_notice': pa.string(),
+        'demos': APPID_LIST,
+        'content_descriptors': pa.string(),
+        'metacritic_score': pa.int16(),
+        'metacritic_url': pa.string(),
+    },
+    'steam_description_data': {
+        'appid': APPID,
+        'detailed_description': pa.string(),
+        'about_the_game': pa.string(),
+        'short_description': pa.string(),
+    },
+    'steam_media_data': {
+        'appid': APPID,
+        'header_image': pa.string(),
+        'screenshots': JSON,
+        'background': pa.string(),
+        'movies': JSON,
+    },
+    'steam_packages_info': {
+        'appid': APPID,
+        'type': CATEGORY,
+        'title': pa.string(),
+        'is_recurring_subscription': pa.bool_(),
+        'subs': JSON,
+    },
+    'steam_requirements_data': {
+        'appid': APPID,
+        'pc_minimum': pa.string(),
+        'pc_recommended': pa.string(),
+        'mac_minimum': pa.string(),
+        'mac_recommended': pa.string(),
+        'linux_minimum': pa.string(),
+        'linux_recommended': pa.string(),
+    },
+    'steam_support_info': {
+        'appid': APPID,
+        'website': pa.string(),
+        'support_url': pa.string(),
+        'support_email': pa.string(),
+    },
+    'steamspy_tag_data': {
+        'appid': APPID,
+    },
+    'missing_ids': {
+        'appid': APPID,
+        'reason': CATEGORY,
+    },
+}
+
+# Types of the columns not in the table schema (the tag vote columns)
+DEFAULT_TYPES = {
+    'steamspy_tag_data': pa.int32(),
+}
+
+# Nullable pandas dtypes of the loaded columns
+PANDAS_TYPES = {
+    pa.int8(): pd.Int8Dtype(),
+    pa.int16(): pd.Int16Dtype(),
+    pa.int32(): pd.Int32Dtype(),
+    pa.int64(): pd.Int64Dtype(),
+    pa.bool_(): pd.BooleanDtype(),
+}
+
+
+def _to_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return None
+
+
+def _to_json(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value)
+    return None
+
+
+def to_array(values, data_type):
+    """
+    Convert the series to the arrow array of the type, missing values are nulls.
+    """
+    if data_type == JSON:
+        return pa.array(values.map(_to_json), type=pa.string(), from_pandas=True)
+    if pa.types.is_dictionary(data_type):
+        values = values.astype('object').where(values.notna(), None)
+        return pa.array(values.map(lambda value: None if value is None else str(value)),
+                        type=pa.string()).dictionary_encode().cast(data_type)
+    if pa.types.is_list(data_type):
+        return pa.array(values.map(_to_list), type=data_type)
+    if pa.types.is_integer(data_type):
+        values = pd.to_numeric(values, errors='coerce').astype('Int64')
+    elif pa.types.is_floating(data_type):
+        values = pd.to_numeric(values, errors='coerce')
+    elif pa.types.is_boolean(data_type):
+        values = values.astype('boolean')
+    elif pa.types.is_timestamp(data_type):
+        values = pd.to_datetime(values, errors='coerce')
+    elif pa.types.is_string(data_type):
+        values = values.astype('object').where(values.notna(), None)
+        values = values.map(lambda value: value if value is None or isinstance(value, str) else str(value))
+    return pa.array(values, type=data_type, from_pandas=True)
+
+
+def get_schema(df, table):
+    """
+    Return the arrow schema of the exported table frame: the table schema
+    types, DEFAULT_TYPES or inferred types for the other columns.
+    """
+    types = SCHEMAS.get(table, {})
+    fields = []
+    json_columns = []
+    for column in df.columns:
+        if column in types:
+            data_type = types[column]
+        elif table in DEFAULT_TYPES:
+            data_type = DEFAULT_TYPES[table]
+        else:
+            data_type = pa.array(df[column], from_pandas=True).type
+        if data_type == JSON:
+            json_columns.append(column)
+            data_type = pa.string()
+        fields.append(pa.field(str(column), data_type))
+    return pa.schema(fields), json_columns
+
+
+def to_table(df, table, index=False):
+    """
+    Return the arrow table of the exported table frame.
+
+    Parameters
+    ----------
+    df : dataframe to export
+    table : table name, key of SCHEMAS
+
+    Keyword arguments
+    -----------------
+    index : export the index (appid) as the first column, default to False
+    """
+    index_columns = []
+    if index:
+        index_columns = [df.index.name or 'appid']
+        df = df.reset_index(names=index_columns)
+    schema, json_columns = get_schema(df, table)
+    types = SCHEMAS.get(table, {})
+    arrays = [to_array(df[column], types.get(column, field.type)) for column, field in zip(df.columns, schema)]
+    metadata = {
+        JSON_COLUMNS_KEY: json.dumps(json_columns).encode('utf-8'),
+        INDEX_COLUMNS_KEY: json.dumps(index_columns).encode('utf-8'),
+    }
+    return pa.Table.from_arrays(arrays, schema=schema.with_metadata(metadata))
+
+
+def get_path(export_path, table, file_format):
+    return os.path.join(export_path, table + FORMATS[file_format])
+
+
+def export_table(df, export_path, table, file_format='parquet', index=False):
+    """
+    Export dataframe to the typed table file in the export folder.
+
+    Parameters
+    ----------
+    df : dataframe to export, or an iterable of dataframe chunks appended one by one
+    export_path : export folder
+    table : table name, the file name without file extension
+
+    Keyword arguments
+    -----------------
+    file_format : 'parquet' or 'feather' (default 'parquet'). Feather files
+        are uncompressed, to be memory-mapped without copying
+    index : export the index (appid) as the first column, default to False
+    """
+    filepath = get_path(export_path, table, file_format)
+    temp_path = filepath + '.tmp'
+    chunks = [df] if isinstance(df, pd.DataFrame) else df
+
+    writer = None
+    try:
+        for chunk in chunks:
+            arrow_table = to_table(chunk, table, index)
+            if writer is None:
+                # the schema of the first chunk, the next ones are cast to it
+                schema = arrow_table.schema
+                if file_format == 'parquet':
+                    writer = pq.ParquetWriter(temp_path, schema)
+                else:
+                    writer = pa.ipc.new_file(temp_path, schema)
+            writer.write_table(arrow_table.cast(schema))
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        return
+    os.replace(temp_path, filepath)
+    print(f'Exported {table} to "{filepath}"')
+
+
+def read_table(path, columns=None, memory_map=True):
+    """
+    Read the arrow table of the exported file, only the columns (the ones
+    missing in the file are skipped) and the index columns if columns are set.
+    """
+    if path.endswith(FORMATS['parquet']):
+        schema = pq.read_schema(path)
+    else:
+        source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+        reader = pa.ipc.open_file(source)
+        schema = reader.schema
+    if columns is not None:
+        index_columns = json.loads((schema.metadata or {}).get(INDEX_COLUMNS_KEY, b'[]'))
+        columns = [column for column in index_columns if column not in columns] + [
+            column for column in columns if column in schema.names]
+    if path.endswith(FORMATS['parquet']):
+        return pq.read_table(path, columns=columns, memory_map=memory_map)
+    table = reader.read_all()
+    return table if columns is None else table.select(columns)
+
+
+def to_frame(table):
+    """
+    Return the dataframe of the arrow table, with nullable dtypes, list
+    columns as lists and the index columns set as the index.
+    """
+    metadata = table.schema.metadata or {}
+    json_columns = json.loads(metadata.get(JSON_COLUMNS_KEY, b'[]'))
+    index_columns = json.loads(metadata.get(INDEX_COLUMNS_KEY, b'[]'))
+    df = table.to_pandas(types_mapper=PANDAS_TYPES.get)
+    for name in table.column_names:
+        if pa.types.is_list(table.schema.field(name).type):
+            df[name] = pd.Series(table.column(name).to_pylist(), index=df.index, dtype='object')
+        elif name in json_columns:
+            df[name] = df[name].map(lambda value: json.loads(value) if isinstance(value, str) else None)
+    index_columns = [column for column in index_columns if column in df.columns]
+    if index_columns:
+        df = df.set_index(index_columns)
+    return df
+
+
+def load_dataset(tables=None, columns=None, export_path='./data/export/', file_format=None, memory_map=True):
+    """
+    Load the exported tables, reading only the requested columns.
+
+    Keyword arguments
+    -----------------
+    tables : table name or list of table names (default None, all tables
+        of SCHEMAS with an exported file)
+    columns : list of columns to read from each table (the missing ones are
+        skipped), or {table: list of columns} (default None, all columns).
+        The appid index is always read
+    export_path : export folder (default './data/export/')
+    file_format : 'parquet' or 'feather' (default None, the format of the
+        existing file, Parquet first)
+    memory_map : memory-map the files, default to True
+
+    Returns
+    -------
+    dataframe of the table if tables is a table name, otherwise {table: dataframe}
+    """
+    single = isinstance(tables, str)
+    formats = [file_format] if file_format else list(FORMATS)
+    if tables is None:
+        tables = [table for table in SCHEMAS
+                  if any(os.path.isfile(get_path(export_path, table, f)) for f in formats)]
+    elif single:
+        tables = [tables]
+
+    frames = {}
+    for table in tables:
+        paths = [get_path(export_path, table, f) for f in formats]
+        paths = [path for path in paths if os.path.isfile(path)]
+        if not paths:
+            raise FileNotFoundError(f'No exported {table} file in "{export_path}"')
+        table_columns = columns.get(table) if isinstance(columns, dict) else columns
+        frames[table] = to_frame(read_table(paths[0], table_columns, memory_map))
+    return frames[tables[0]] if single else frames
@@ -0,0 +1,304 @@
+"""
+Parse-once decoding of the literal-encoded Storefront and SteamSpy columns
+
+The collection scripts write dicts and lists to csv as their Python repr
+("{'coming_soon': False, 'date': '1 Nov, 2000'}"). Each of these raw columns
+is parsed here exactly once with ast.literal_eval and split into typed
+columns, instead of every cleanup helper running literal_eval/eval on the
+same strings again. Values read from NDJSON or the app store are already
+decoded and are used as is.
+"""
+
+# standard library imports
+import ast
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# third-party imports
+import pandas as pd
+
+# project imports
+import transforms
+
+# Rows decoded by one process pool task
+CHUNKSIZE = 10000
+
+# HTML cleanup of the requirements, same as in the cleanup notebook
+REQUIREMENTS_REPLACE = [
+    (re.compile(r'[\r\t\n]'), ''),
+    (re.compile(r'<[pbr]{1,2}>'), ' '),
+    (re.compile(r'<[\/"=\w\s]+>'), ''),
+]
+
+
+def parse_literal(value):
+    """
+    Safely parse the Python literal or json string, None for missing or
+    malformed values. Non-string values are returned as is.
+    """
+    if not isinstance(value, str):
+        return None if _is_missing(value) else value
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        pass
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def _is_missing(value):
+    if isinstance(value, (list, dict, tuple)):
+        return False
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def decode_list(value):
+    """
+    Return the list value ('dlc', 'packages', 'developers'), None if not a list.
+    Empty strings are removed.
+    """
+    if not isinstance(value, (list, tuple)):
+        return None
+    return [item for item in value if item != '']
+
+
+def decode_dict_list(value, key):
+    """
+    Return the list of the key values of the dicts in the list, or of the single
+    dict (replaces extractDictList).
+    """
+    if isinstance(value, dict):
+        value = [value]
+    if not isinstance(value, (list, tuple)):
+        return None
+    return [item[key] for item in value if isinstance(item, dict) and not _is_missing(item.get(key))]
+
+
+def decode_dict_item(value, key):
+    """
+    Return the key value of the dict, None if missing (replaces extractDictItem).
+    """
+    if isinstance(value, dict):
+        item = value.get(key)
+        return None if _is_missing(item) else item
+    return None
+
+
+def decode_bool_dict(value):
+    """
+    Return the list of the keys with True values (replaces extractBoolDict).
+    """
+    if not isinstance(value, dict):
+        return None
+    return [key for key, flag in value.items() if flag is True or flag == 'true']
+
+
+def decode_price(value):
+    """
+    Return (currency, initial, final, discount_percent) of price_overview, prices
+    in the currency units (replaces parse_price).
+    """
+    if not isinstance(value, dict):
+        return None, None, None, None
+    initial, final = value.get('initial'), value.get('final')
+    return (value.get('currency'),
+            initial / 100 if isinstance(initial, (int, float)) else None,
+            final / 100 if isinstance(final, (int, float)) else None,
+            value.get('discount_percent'))
+
+
+def decode_release_date(value):
+    """
+    Return (coming_soon, date string) of release_date, parsed once for both
+    (replaces getComingSoon and processReleaseDateValues).
+    """
+    if not isinstance(value, dict):
+        return False, None
+    date = value.get('date')
+    return value.get('coming_soon') is True, date if date else None
+
+
+def decode_metacritic(value):
+    """
+    Return (score, url) of metacritic (replaces metacritic_parse).
+    """
+    if not isinstance(value, dict):
+        return None, None
+    return value.get('score'), value.get('url')
+
+
+def decode_support(value):
+    """
+    Return (url, email) of support_info, None for the empty strings.
+    """
+    if not isinstance(value, dict):
+        return None, None
+    return value.get('url') or None, value.get('email') or None
+
+
+def decode_requirements(value):
+    """
+    Return (minimum, recommended) requirements with the HTML removed.
+    """
+    if not isinstance(value, dict):
+        return None, None
+    result = []
+    for key, prefix in [('minimum', 'Minimum:'), ('recommended', 'Recommended:')]:
+        text = value.get(key)
+        if not isinstance(text, str):
+            result.append(None)
+            continue
+        for pattern, replacement in REQUIREMENTS_REPLACE:
+            text = pattern.sub(replacement, text)
+        result.append(text.replace(prefix, '').strip() or None)
+    return tuple(result)
+
+
+def decode_tags(value):
+    """
+    Return (tag names, {tag: votes}) of the SteamSpy tags (replaces parse_tags
+    and parse_export_tags). SteamSpy returns an empty list for apps without tags.
+    """
+    if isinstance(value, dict):
+        return list(value.keys()), value
+    if isinstance(value, (list, tuple)):
+        return None, {}
+    return None, None
+
+
+# Raw literal column: (decoder, output columns). Decoders with several output
+# columns return tuples.
+LITERAL_COLUMNS = {
+    'developers': (decode_list, ['developers']),
+    'publishers': (decode_list, ['publishers']),
+    'dlc': (decode_list, ['dlc']),
+    'packages': (decode_list, ['packages']),
+    'package_groups': (decode_list, ['package_groups']),
+    'genres': (partial(decode_dict_list, key='description'), ['genres']),
+    'categories': (partial(decode_dict_list, key='description'), ['categories']),
+    'demos': (partial(decode_dict_list, key='appid'), ['demos']),
+    'platforms': (decode_bool_dict, ['platforms']),
+    'fullgame': (partial(decode_dict_item, key='appid'), ['fullgame']),
+    'achievements': (partial(decode_dict_item, key='total'), ['achievements']),
+    'recommendations': (partial(decode_dict_item, key='total'), ['recommendations']),
+    'content_descriptors': (partial(decode_dict_item, key='notes'), ['content_descriptors']),
+    'price_overview': (decode_price, ['currency', 'price_initial', 'price_final', 'discount_percent']),
+    'release_date': (decode_release_date, ['coming_soon', 'release_date']),
+    'metacritic': (decode_metacritic, ['metacritic_score', 'metacritic_url']),
+    'support_info': (decode_support, ['support_url', 'support_email']),
+    'pc_requirements': (decode_requirements, ['pc_minimum', 'pc_recommended']),
+    'mac_requirements': (decode_requirements, ['mac_minimum', 'mac_recommended']),
+    'linux_requirements': (decode_requirements, ['linux_minimum', 'linux_recommended']),
+    'tags': (decode_tags, ['tags', 'tag_votes']),
+}
+
+# Types of the decoded columns
+DTYPES = {
+    'fullgame': 'Int64',
+    'achievements': 'Int64',
+    'recommendations': 'Int64',
+    'price_initial': 'float64',
+    'price_final': 'float64',
+    'discount_percent': 'Int64',
+    'coming_soon': 'boolean',
+    'metacritic_score': 'Int64',
+}
+
+
+def decode_chunk(chunk):
+    """
+    Decode the literal columns of the dataframe chunk.
+
+    Equal raw strings (platforms, genres, most release dates) are decoded
+    once per chunk, so the rows with equal values share the decoded lists
+    and dicts: copy them before changing in place.
+
+    Returns
+    -------
+    dict with the list of values for each output column
+    """
+    result = {}
+    for column in chunk.columns:
+        decoder, outputs = LITERAL_COLUMNS[column]
+        decoded = {}
+        values = []
+        for value in chunk[column]:
+            if not isinstance(value, str):
+                values.append(decoder(parse_literal(value)))
+                continue
+            if value not in decoded:
+                decoded[value] = decoder(parse_literal(value))
+            values.append(decoded[value])
+        if len(outputs) == 1:
+            result[outputs[0]] = values
+        else:
+            for i, output in enumerate(outputs):
+                result[output] = [value[i] for value in values]
+    return result
+
+
+def decode_frame(df, columns=None, workers=None, chunksize=CHUNKSIZE):
+    """
+    Decode the literal-encoded columns of the dataframe into typed columns.
+
+    Each raw column is replaced by its output columns in place, the other
+    columns are kept as is. Only the literal columns are sent to the worker
+    processes.
+
+    Parameters
+    ----------
+    df : raw Storefront or SteamSpy dataframe
+
+    Keyword arguments
+    -----------------
+    columns : raw columns to decode (default None, all columns from LITERAL_COLUMNS)
+    workers : number of worker processes (default None, number of CPUs; 1 decodes in this process)
+    chunksize : rows per worker task (default 10000)
+
+    Returns
+    -------
+    decoded dataframe
+    """
+    if columns is None:
+        columns = [column for column in df.columns if column in LITERAL_COLUMNS]
+    workers = workers or os.cpu_count() or 1
+    literal_df = df[columns]
+    chunks = [literal_df.iloc[start:start + chunksize] for start in range(0, len(literal_df), chunksize)]
+
+    if (workers == 1) or (len(chunks) <= 1):
+        results = [decode_chunk(chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            results = list(executor.map(decode_chunk, chunks))
+
+    decoded = {}
+    for column in columns:
+        for output in LITERAL_COLUMNS[column][1]:
+            values = [value for result in results for value in result[output]]
+            values = pd.Series(values, index=df.index, dtype='object')
+            if output == 'release_date':
+                values = transforms.parse_dates(values)
+            elif output in DTYPES:
+                # appids and scores can be strings in the older downloads
+                if DTYPES[output] != 'boolean':
+                    values = pd.to_numeric(values, errors='coerce')
+                values = values.astype(DTYPES[output])
+            decoded[output] = values
+
+    # keeping the column order, with the outputs in place of the raw column
+    data = {}
+    for column in df.columns:
+        if column in columns:
+            for output in LITERAL_COLUMNS[column][1]:
+                data[output] = decoded[output]
+        elif column not in decoded:
+            data[column] = df[column]
+    return pd.DataFrame(data, index=df.index)
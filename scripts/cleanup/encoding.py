@@ -0,0 +1,164 @@
+"""
+Sparse multi-hot encoding of the list-valued columns (genres, categories,
+platforms, languages, SteamSpy tags with votes)
+
+A column is encoded in one pass into CSR arrays (indptr, indices, data)
+over a stable vocabulary: items keep their position between encodings
+and the new ones are appended at the end.
+"""
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+try:
+    import scipy.sparse
+except ImportError:
+    scipy = None
+
+
+def _get_items(value):
+    """
+    Return (items, weights) of the list or {item: weight} dict value.
+    """
+    if isinstance(value, dict):
+        return list(value.keys()), list(value.values())
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return list(value), None
+    return [], None
+
+
+class MultiHot:
+    """
+    Multi-hot encoded column: CSR arrays with a row for each app and a column
+    for each vocabulary item.
+
+    Parameters
+    ----------
+    indptr, indices, data : CSR arrays
+    vocabulary : list of the items, in column order
+    index : index of the rows (appids)
+    """
+    def __init__(self, indptr, indices, data, vocabulary, index):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.vocabulary = vocabulary
+        self.index = index
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.vocabulary)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def to_sparse(self):
+        """
+        Return scipy.sparse.csr_matrix of the encoding.
+        """
+        if scipy is None:
+            raise ImportError('scipy package is required for the sparse matrices, use to_frame() instead')
+        return scipy.sparse.csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    def to_dense(self):
+        """
+        Return dense numpy array of the encoding.
+        """
+        dense = np.zeros(self.shape, dtype=self.data.dtype)
+        rows = np.repeat(np.arange(len(self.index)), np.diff(self.indptr))
+        dense[rows, self.indices] = self.data
+        return dense
+
+    def to_frame(self, sparse=False, columns=None):
+        """
+        Return dataframe with a column for each vocabulary item.
+
+        Keyword arguments
+        -----------------
+        sparse : return the frame with pandas sparse columns, default to False
+        columns : column names (default None, the vocabulary items)
+        """
+        columns = self.vocabulary if columns is None else columns
+        if sparse:
+            if scipy is not None:
+                return pd.DataFrame.sparse.from_spmatrix(self.to_sparse().tocsc(), index=self.index, columns=columns)
+            dense = self.to_dense()
+            return pd.DataFrame({column: pd.arrays.SparseArray(dense[:, i], fill_value=0)
+                                 for i, column in enumerate(columns)}, index=self.index)
+        return pd.DataFrame(self.to_dense(), index=self.index, columns=columns)
+
+    def counts(self):
+        """
+        Return series with the number of rows having each item.
+        """
+        return pd.Series(np.bincount(self.indices, minlength=len(self.vocabulary)), index=self.vocabulary)
+
+    def items(self, row):
+        """
+        Return the items of the row number.
+        """
+        return [self.vocabulary[i] for i in self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+
+def encode(values, vocabulary=None, dtype=None):
+    """
+    Encode the column of lists, or of {item: weight} dicts, in one pass.
+
+    Parameters
+    ----------
+    values : series with lists or dicts (missing values are empty rows)
+
+    Keyword arguments
+    -----------------
+    vocabulary : list of the known items, kept in their order with the new
+        items appended sorted (default None, sorted items of the column)
+    dtype : type of the values (default None, bool for lists and int32 for dicts)
+
+    Returns
+    -------
+    MultiHot
+    """
+    item_lists = []
+    weight_lists = []
+    weighted = False
+    for value in values:
+        items, weights = _get_items(value)
+        item_lists.append(items)
+        if weights is not None:
+            weighted = True
+            weight_lists.append(weights)
+        else:
+            weight_lists.append([True] * len(items))
+
+    lengths = np.fromiter((len(items) for items in item_lists), dtype=np.int64, count=len(item_lists))
+    indptr = np.zeros(len(item_lists) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    flat = [item for items in item_lists for item in items]
+
+    vocabulary = list(vocabulary) if vocabulary is not None else []
+    positions = {item: i for i, item in enumerate(vocabulary)}
+    new_items = sorted(set(flat).difference(positions), key=str)
+    for item in new_items:
+        positions[item] = len(vocabulary)
+        vocabulary.append(item)
+
+    indices = np.fromiter((positions[item] for item in flat), dtype=np.int32, count=len(flat))
+    dtype = dtype or (np.int32 if weighted else bool)
+    data = np.fromiter((weight for weights in weight_lists for weight in weights), dtype=dtype, count=len(flat))
+    return MultiHot(indptr, indices, data, vocabulary, values.index)
+
+
+def boolean_df(item_lists, unique_items):
+    """
+    Create boolean dataframe from the item list series and a list of unique
+    item values (the notebook helper, now encoded in one pass).
+
+    Parameters
+    ----------
+    item_lists : pandas series with item lists
+    unique_items : list with the unique item values
+    """
+    encoded = encode(item_lists, vocabulary=unique_items)
+    return encoded.to_frame().iloc[:, :len(unique_items)]
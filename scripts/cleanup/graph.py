@@ -0,0 +1,69 @@
+"""
+Parent/DLC index of the apps, built once from the fullgame and dlc columns
+"""
+
+# third-party imports
+import pandas as pd
+
+
+def get_parent_index(fullgame, dlc, types=None):
+    """
+    Return the parent app of each app: the fullgame value, or for the apps
+    without it the first app listing it in its dlc list.
+
+    Parameters
+    ----------
+    fullgame : appid-indexed series with the parent appids, NA if missing
+    dlc : appid-indexed series with the lists of DLC appids
+
+    Keyword arguments
+    -----------------
+    types : appid-indexed series with the app types, only 'dlc' apps are
+        recovered from the dlc lists (default None, all apps)
+
+    Returns
+    -------
+    appid-indexed Int64 series with the parent appids
+    """
+    parents = pd.to_numeric(fullgame, errors='coerce').astype('Int64')
+
+    # dlc appid -> appid of the first app listing it
+    listed = dlc[dlc.map(lambda x: isinstance(x, list) and len(x) > 0)].explode()
+    listed = pd.Series(listed.index, index=pd.to_numeric(listed.values, errors='coerce'))
+    listed = listed[listed.index.notna() & ~listed.index.duplicated(keep='first')]
+
+    missing = parents.isna()
+    if types is not None:
+        missing &= (types.reindex(parents.index) == 'dlc')
+    parents[missing] = listed.reindex(parents.index[missing]).astype('Int64').values
+    return parents
+
+
+def get_dlc_index(parents):
+    """
+    Return parent appid-indexed series with the sorted lists of its DLC appids.
+    """
+    parents = parents.dropna()
+    return pd.Series(parents.index, index=parents.values).groupby(level=0).agg(sorted)
+
+
+def get_parent_values(values, parents):
+    """
+    Return the values of the parent apps, aligned to the apps.
+
+    Parameters
+    ----------
+    values : appid-indexed series
+    parents : appid-indexed series with the parent appids
+    """
+    parent_values = values.reindex(parents.reindex(values.index).astype('float64'))
+    parent_values.index = values.index
+    return parent_values
+
+
+def fill_from_parent(values, parents):
+    """
+    Return the values with the missing ones taken from the parent apps
+    (replaces getParentValue).
+    """
+    return values.where(values.notna(), get_parent_values(values, parents))
@@ -0,0 +1,272 @@
+"""
+Append-only history of the prices, reviews and SteamSpy metrics of the
+collection runs, keyed by (appid, collection time)
+
+Each run appends a delta file with only the apps whose values changed
+since the previous snapshot, and only their changed values: the changed
+bits of each row mark the stored columns. last_modified (and
+price_change_number, when the snapshot has it) is a column like the
+others, so its change records the app too. The dataset at any date is
+rebuilt by as_of.
+
+Usage:
+    import history
+    store = history.HistoryStore('./data/history/')
+    store.append(snapshot, '2022-06-22')
+    prices = store.as_of('2022-01-01', columns=['price'])
+"""
+
+# standard library imports
+import json
+import os
+
+# third-party imports
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+METADATA_FILE = 'history.json'
+STATE_FILE = 'state.parquet'
+
+# State file metadata key with the time of the snapshot it holds
+STATE_SNAPSHOT_KEY = b'snapshot'
+
+# Columns of the delta files besides the values
+KEY_COLUMNS = ['appid', 'removed', 'changed']
+
+# The changed bits are an int64 mask over the store columns
+MAX_COLUMNS = 63
+
+
+def _equal(old, new):
+    """
+    Return boolean array, True where the values are equal or both missing.
+    """
+    old_na = old.isna().to_numpy()
+    new_na = new.isna().to_numpy()
+    if pd.api.types.is_numeric_dtype(old) and pd.api.types.is_numeric_dtype(new):
+        equal = old.to_numpy(dtype=np.float64, na_value=np.nan) == new.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        old = old.astype('object').where(~old_na, None).to_numpy()
+        new = new.astype('object').where(~new_na, None).to_numpy()
+        equal = np.fromiter((a == b for a, b in zip(old, new)), dtype=bool, count=len(old))
+    return (equal & ~old_na & ~new_na) | (old_na & new_na)
+
+
+def _to_stored(values):
+    # integer columns stay integers with the unchanged cells missing
+    if pd.api.types.is_integer_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return values.astype('Int64')
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype('object')
+    return values
+
+
+class HistoryStore:
+    """
+    History store directory: history.json with the columns and the
+    snapshots, a delta Parquet file for each snapshot and state.parquet with
+    the latest values.
+
+    Parameters
+    ----------
+    path : store directory, created if it doesn't exist
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        self.metadata = {'columns': [], 'snapshots': []}
+        if os.path.isfile(metadata_path):
+            with open(metadata_path, 'r') as f:
+                self.metadata = json.load(f)
+
+    @property
+    def columns(self):
+        return self.metadata['columns']
+
+    def times(self):
+        """
+        Return the collection times of the snapshots.
+        """
+        return [pd.Timestamp(snapshot['time']) for snapshot in self.metadata['snapshots']]
+
+    def _write_metadata(self):
+        metadata_path = os.path.join(self.path, METADATA_FILE)
+        with open(metadata_path + '.tmp', 'w') as f:
+            json.dump(self.metadata, f, indent=1)
+        os.replace(metadata_path + '.tmp', metadata_path)
+
+    def _write_parquet(self, df, filename, metadata=None):
+        path = os.path.join(self.path, filename)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if metadata:
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), **metadata})
+        pq.write_table(table, path + '.tmp', compression='zstd')
+        os.replace(path + '.tmp', path)
+
+    def get_state(self):
+        """
+        Return the latest values of the apps, indexed by appid.
+        """
+        path = os.path.join(self.path, STATE_FILE)
+        if not self.metadata['snapshots']:
+            return pd.DataFrame(columns=self.columns, index=pd.Index([], name='appid', dtype=np.int64))
+        last = self.metadata['snapshots'][-1]['time']
+        snapshot = (pq.read_schema(path).metadata or {}).get(STATE_SNAPSHOT_KEY) if os.path.isfile(path) else None
+        if snapshot != last.encode():
+            # the state is derived from the deltas, rebuilt when it's missing or not of the last snapshot
+            return self.as_of(last)
+        return pq.read_table(path).to_pandas().set_index('appid')
+
+    def append(self, df, collected):
+        """
+        Record the snapshot of the collection run: the values that changed
+        since the previous snapshot, and the removed apps. The snapshot of
+        the last collection time is already recorded and is skipped.
+
+        Parameters
+        ----------
+        df : snapshot dataframe indexed by appid
+        collected : collection time, later than the previous snapshot
+
+        Returns
+        -------
+        {'apps': number of the apps, 'changed_apps': number of the changed
+        apps, 'values': number of the changed values, 'removed': number of
+        the removed apps}
+        """
+        collected = pd.Timestamp(collected)
+        times = self.times()
+        if times and collected == times[-1]:
+            # a re-run of the last collection, its recorded result is returned
+            snapshot = self.metadata['snapshots'][-1]
+            return {key: snapshot[key] for key in ('apps', 'changed_apps', 'values', 'removed')}
+        if times and collected < times[-1]:
+            raise ValueError(f'Snapshot of {collected} is not later than the last one of {times[-1]}')
+        if not df.index.is_unique:
+            raise ValueError('Snapshot appids must be unique')
+
+        state = self.get_state()
+        columns = self.columns + [column for column in df.columns if column not in self.columns]
+        if len(columns) > MAX_COLUMNS:
+            raise ValueError(f'History store keeps up to {MAX_COLUMNS} columns')
+        df = df.reindex(columns=columns)
+        df.index = df.index.astype(np.int64)
+        old = state.reindex(index=df.index, columns=columns)
+        present = df.index.isin(state.index)
+
+        changed = np.zeros(len(df), dtype=np.int64)
+        delta = pd.DataFrame(index=df.index)
+        for bit, column in enumerate(columns):
+            mask = ~_equal(old[column], df[column]) | ~present
+            changed |= mask.astype(np.int64) << bit
+            delta[column] = _to_stored(df[column]).where(mask)
+        delta.insert(0, 'changed', changed)
+        delta.insert(0, 'removed', False)
+        delta = delta[changed != 0]
+
+        removed = state.index.difference(df.index)
+        removed_rows = pd.DataFrame({'removed': True, 'changed': np.int64(0)}, index=removed)
+        delta = pd.concat([delta, removed_rows]) if len(removed) else delta
+        delta.index.name = 'appid'
+        delta = delta.reset_index().sort_values('appid')
+        delta['appid'] = delta['appid'].astype(np.int64)
+        delta['removed'] = delta['removed'].astype(bool)
+
+        filename = f'delta-{collected:%Y%m%dT%H%M%S}.parquet'
+        self._write_parquet(delta, filename)
+        result = {
+            'apps': len(df),
+            'changed_apps': int(np.count_nonzero(changed)),
+            'values': int(sum(np.count_nonzero(changed & (1 << bit)) for bit in range(len(columns)))),
+            'removed': len(removed),
+        }
+        self.metadata['columns'] = columns
+        self.metadata['snapshots'].append({'time': collected.isoformat(), 'file': filename, **result})
+        self._write_metadata()
+
+        # written after the snapshot is recorded, a state of another snapshot is ignored by get_state
+        state = df.copy()
+        state.index.name = 'appid'
+        self._write_parquet(state.reset_index().astype({column: 'object' for column in columns
+                                                        if isinstance(state[column].dtype, pd.CategoricalDtype)}),
+                            STATE_FILE, {STATE_SNAPSHOT_KEY: collected.isoformat().encode()})
+        return result
+
+    def read_deltas(self, date=None, columns=None, appids=None):
+        """
+        Return the delta rows of the snapshots up to the date (default None,
+        all), with the collected time of each row, in the collection order.
+        """
+        columns = self.columns if columns is None else columns
+        unknown = set(columns) - set(self.columns)
+        if unknown:
+            raise KeyError(f'Columns {sorted(unknown)} are not in the history store')
+        frames = []
+        for snapshot in self.metadata['snapshots']:
+            collected = pd.Timestamp(snapshot['time'])
+            if date is not None and collected > pd.Timestamp(date):
+                break
+            path = os.path.join(self.path, snapshot['file'])
+            schema = pq.read_schema(path)
+            filters = None if appids is None else [('appid', 'in', list(map(int, appids)))]
+            table = pq.read_table(path, columns=[column for column in KEY_COLUMNS + columns if column in schema.names],
+                                  filters=filters)
+            frame = table.to_pandas().reindex(columns=KEY_COLUMNS + columns)
+            frame.insert(1, 'collected', collected)
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame(columns=['appid', 'collected', *KEY_COLUMNS[1:], *columns])
+        return pd.concat(frames, ignore_index=True)
+
+    def _latest_values(self, deltas, columns):
+        # the last changed value of each column, per appid
+        values = {}
+        for column in columns:
+            bit = np.int64(1) << self.columns.index(column)
+            rows = deltas[(deltas['changed'].to_numpy(dtype=np.int64) & bit) != 0]
+            values[column] = rows.drop_duplicates('appid', keep='last').set_index('appid')[column]
+        return values
+
+    def as_of(self, date, columns=None):
+        """
+        Return the dataset of the apps as of the date: the values of the
+        last snapshot collected up to the date, indexed by appid.
+
+        Parameters
+        ----------
+        date : date or time of the dataset
+
+        Keyword arguments
+        -----------------
+        columns : columns to rebuild (default None, all columns)
+        """
+        columns = self.columns if columns is None else list(columns)
+        deltas = self.read_deltas(date, columns)
+        last = deltas.drop_duplicates('appid', keep='last')
+        appids = pd.Index(np.sort(last.loc[~last['removed'].astype(bool), 'appid'].to_numpy(dtype=np.int64)),
+                          name='appid')
+        values = self._latest_values(deltas, columns)
+        return pd.DataFrame({column: values[column].reindex(appids) for column in columns}, index=appids)
+
+    def get_history(self, appids, columns=None):
+        """
+        Return the values of the apps at each snapshot they changed in,
+        indexed by (appid, collected), the removals have the removed flag.
+        """
+        columns = self.columns if columns is None else list(columns)
+        deltas = self.read_deltas(columns=columns, appids=appids)
+        deltas = deltas.sort_values(['appid', 'collected'], kind='stable').reset_index(drop=True)
+        rows = pd.Series(np.arange(len(deltas), dtype=np.float64))
+        result = deltas[['appid', 'collected', 'removed']].copy()
+        for column in columns:
+            bit = np.int64(1) << self.columns.index(column)
+            changed = (deltas['changed'].to_numpy(dtype=np.int64) & bit) != 0
+            # the row of the last change of the column, carried forward per app
+            source = rows.where(changed).groupby(deltas['appid']).ffill()
+            values = deltas[column].to_numpy(dtype=object)
+            result[column] = [values[int(i)] if not np.isnan(i) else None for i in source]
+            result[column] = result[column].infer_objects()
+        return result.set_index(['appid', 'collected'])
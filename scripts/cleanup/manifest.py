@@ -0,0 +1,316 @@
+"""
+Export manifest and the integrity checks of the exported tables (replaces
+row_check of the clean-up notebook)
+
+Every export writes manifest.json to the export folder with the row count,
+the file sizes and checksums and the compressed appid set of each table,
+and the appid sets of the source data. The checks run on the manifest
+alone, without reading the tables.
+
+Usage (from the repository root):
+    python scripts/cleanup/manifest.py --export-path ./data/export/ [--checksums]
+"""
+
+# standard library imports
+import argparse
+import base64
+import datetime
+import json
+import os
+import struct
+import sys
+import zlib
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import pipeline
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+# Tables whose appids must be in the referenced table
+REFERENCES = {
+    'steam_optional': 'steam',
+    'steam_description_data': 'steam',
+    'steam_media_data': 'steam',
+    'steam_packages_info': 'steam',
+    'steam_requirements_data': 'steam',
+    'steam_support_info': 'steam',
+}
+
+# AppidSet serialization: header, container header and the largest array container
+APPID_SET_MAGIC = b'APS1'
+HEADER = struct.Struct('<4sI')
+CONTAINER_HEADER = struct.Struct('<HBI')
+ARRAY_LIMIT = 4096
+ARRAY, BITMAP = 0, 1
+
+
+class AppidSet:
+    """
+    Set of appids, serialized in roaring bitmap style: the appids are split
+    by the upper 16 bits into containers, stored as sorted arrays of the
+    lower 16 bits, or as 8 KB bitmaps for the containers with more than
+    4096 appids, and compressed with zlib.
+
+    Parameters
+    ----------
+    values : iterable of the appids, integers in 0..2**32-1 (missing
+        values and duplicates are dropped)
+    """
+    def __init__(self, values=()):
+        if not isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+            values = list(values)
+        values = pd.to_numeric(pd.Series(values), errors='coerce').dropna()
+        values = np.unique(values.to_numpy(dtype=np.int64))
+        if len(values) and (values[0] < 0 or values[-1] >= 2 ** 32):
+            raise ValueError('Appids must be in 0..2**32-1')
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, appid):
+        i = np.searchsorted(self.values, appid)
+        return bool(i < len(self.values) and self.values[i] == appid)
+
+    def __eq__(self, other):
+        return isinstance(other, AppidSet) and np.array_equal(self.values, other.values)
+
+    def __repr__(self):
+        return f'AppidSet({len(self)} appids)'
+
+    @classmethod
+    def _from_sorted(cls, values):
+        appid_set = cls()
+        appid_set.values = values
+        return appid_set
+
+    def union(self, other):
+        return self._from_sorted(np.union1d(self.values, other.values))
+
+    def intersection(self, other):
+        return self._from_sorted(np.intersect1d(self.values, other.values, assume_unique=True))
+
+    def difference(self, other):
+        return self._from_sorted(np.setdiff1d(self.values, other.values, assume_unique=True))
+
+    def issubset(self, other):
+        return len(self.difference(other)) == 0
+
+    def to_bytes(self):
+        """
+        Return the serialized set.
+        """
+        values = self.values.astype(np.uint32)
+        lows = (values & 0xFFFF).astype('<u2')
+        keys, starts, counts = np.unique(values >> 16, return_index=True, return_counts=True)
+        parts = [HEADER.pack(APPID_SET_MAGIC, len(keys))]
+        for key, start, count in zip(keys, starts, counts):
+            low = lows[start:start + count]
+            if count <= ARRAY_LIMIT:
+                parts.append(CONTAINER_HEADER.pack(key, ARRAY, count))
+                parts.append(low.tobytes())
+            else:
+                bits = np.zeros(1 << 16, dtype=bool)
+                bits[low] = True
+                parts.append(CONTAINER_HEADER.pack(key, BITMAP, count))
+                parts.append(np.packbits(bits, bitorder='little').tobytes())
+        return zlib.compress(b''.join(parts))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the set serialized by to_bytes.
+        """
+        data = zlib.decompress(data)
+        magic, size = HEADER.unpack_from(data)
+        if magic != APPID_SET_MAGIC:
+            raise ValueError('Not a serialized AppidSet')
+        offset = HEADER.size
+        arrays = []
+        for _ in range(size):
+            key, kind, count = CONTAINER_HEADER.unpack_from(data, offset)
+            offset += CONTAINER_HEADER.size
+            if kind == ARRAY:
+                low = np.frombuffer(data, dtype='<u2', count=count, offset=offset)
+                offset += 2 * count
+            else:
+                bits = np.frombuffer(data, dtype=np.uint8, count=(1 << 13), offset=offset)
+                low = np.flatnonzero(np.unpackbits(bits, bitorder='little'))
+                offset += 1 << 13
+            arrays.append((np.int64(key) << 16) | low.astype(np.int64))
+        return cls._from_sorted(np.concatenate(arrays) if arrays else np.empty(0, dtype=np.int64))
+
+    def to_string(self):
+        return base64.b64encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def from_string(cls, string):
+        return cls.from_bytes(base64.b64decode(string))
+
+
+def get_file_entry(path):
+    """
+    Return {'size', 'sha256'} of the file.
+    """
+    return {'size': os.path.getsize(path), 'sha256': pipeline.get_file_hash(path)}
+
+
+def get_entry(appids, rows, index=False, files=None):
+    """
+    Return manifest entry of a table or a source.
+
+    Parameters
+    ----------
+    appids : appids of the rows
+    rows : number of rows
+
+    Keyword arguments
+    -----------------
+    index : appid is the table index, unique for each row (default False)
+    files : list of the exported file paths (default None, no files)
+    """
+    appid_set = AppidSet(appids)
+    entry = {'rows': int(rows), 'index': index, 'appid_count': len(appid_set), 'appids': appid_set.to_string()}
+    if files is not None:
+        entry['files'] = {os.path.basename(path): get_file_entry(path) for path in files}
+    return entry
+
+
+def read_manifest(export_path):
+    """
+    Return the manifest of the export folder, empty if there is none.
+    """
+    path = os.path.join(export_path, MANIFEST_FILE)
+    if not os.path.isfile(path):
+        return {'version': MANIFEST_VERSION, 'tables': {}, 'sources': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def update_manifest(export_path, tables, sources=None):
+    """
+    Write the entries of the exported tables (and the sources) to the
+    manifest, keeping the entries of the other tables.
+
+    Parameters
+    ----------
+    export_path : export folder
+    tables : {table: entry}
+
+    Keyword arguments
+    -----------------
+    sources : {source: entry} (default None, keep the sources)
+    """
+    manifest = read_manifest(export_path)
+    manifest['version'] = MANIFEST_VERSION
+    manifest['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+    manifest['tables'].update(tables)
+    if sources is not None:
+        manifest['sources'] = sources
+    path = os.path.join(export_path, MANIFEST_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+def check_files(manifest, export_path, checksums=False):
+    """
+    Return problems of the exported files: missing files, changed sizes and,
+    with checksums, changed content.
+    """
+    problems = []
+    for table, entry in manifest['tables'].items():
+        for filename, file_entry in entry.get('files', {}).items():
+            path = os.path.join(export_path, filename)
+            if not os.path.isfile(path):
+                problems.append(f'{table}: {filename} is missing')
+            elif os.path.getsize(path) != file_entry['size']:
+                problems.append(f'{table}: {filename} size changed')
+            elif checksums and pipeline.get_file_hash(path) != file_entry['sha256']:
+                problems.append(f'{table}: {filename} checksum changed')
+    return problems
+
+
+def check_manifest(manifest, export_path=None, checksums=False):
+    """
+    Check the consistency of the exported tables from the manifest.
+
+    Checks the unique appids of the appid-indexed tables, the appids of the
+    tables referencing steam, that the removed apps are not in steam and
+    that each source appid is either in steam or in missing_ids, and the
+    row counts like the notebook row_check.
+
+    Keyword arguments
+    -----------------
+    export_path : check the exported files in the folder too (default None)
+    checksums : check the file checksums, not only the sizes (default False)
+
+    Returns
+    -------
+    list of the problem descriptions, empty if the export is consistent
+    """
+    tables = manifest.get('tables', {})
+    sources = manifest.get('sources', {})
+    sets = {table: AppidSet.from_string(entry['appids']) for table, entry in tables.items()}
+    problems = []
+
+    for table, entry in tables.items():
+        if entry['index'] and entry['appid_count'] != entry['rows']:
+            problems.append(f'{table}: {entry["rows"] - entry["appid_count"]} duplicated or missing appids')
+    for table, referenced in REFERENCES.items():
+        if table in sets and referenced in sets:
+            orphans = sets[table].difference(sets[referenced])
+            if len(orphans):
+                problems.append(f'{table}: {len(orphans)} appids not in {referenced}, e.g. {orphans.values[:5].tolist()}')
+
+    if 'steam' in sets and 'missing_ids' in sets:
+        removed = sets['steam'].intersection(sets['missing_ids'])
+        if len(removed):
+            problems.append(f'steam: {len(removed)} appids are in missing_ids, e.g. {removed.values[:5].tolist()}')
+        covered = sets['steam'].union(sets['missing_ids'])
+        for source, entry in sources.items():
+            uncovered = AppidSet.from_string(entry['appids']).difference(covered)
+            if len(uncovered):
+                problems.append(f'{source}: {len(uncovered)} appids neither in steam nor in missing_ids, '
+                                f'e.g. {uncovered.values[:5].tolist()}')
+        if not row_check(manifest):
+            problems.append('Less rows after processing than before')
+
+    if export_path is not None:
+        problems.extend(check_files(manifest, export_path, checksums))
+    return problems
+
+
+def row_check(manifest):
+    """
+    Return True if the number of the processed and missing rows is not less
+    than the number of the source and source missing rows.
+    """
+    tables = manifest['tables']
+    sources = manifest.get('sources', {})
+    pre_count = sum(entry['rows'] for entry in sources.values())
+    post_count = tables['steam']['rows'] + tables['missing_ids']['rows']
+    return pre_count <= post_count
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Check the exported dataset from its manifest')
+    parser.add_argument('--export-path', default='./data/export/')
+    parser.add_argument('--checksums', action='store_true', help='check the file checksums, not only the sizes')
+    args = parser.parse_args(args)
+
+    problems = check_manifest(read_manifest(args.export_path), args.export_path, args.checksums)
+    for problem in problems:
+        print(problem)
+    print('Integrity check', 'failed' if problems else 'passed')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
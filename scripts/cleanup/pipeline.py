@@ -0,0 +1,342 @@
+"""
+Stage DAG runner with the stage outputs memoized to Parquet
+
+Each stage declares the outputs of the other stages (and their columns) it
+reads. The cache key of an output is a hash of the stage code, its
+parameters and the keys of its inputs, with the source files hashed by
+content. Changing a stage or a raw file changes the keys of the stages
+downstream of it only, the rest are loaded from the cache.
+"""
+
+# standard library imports
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import time
+import types
+
+# third-party imports
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Parquet schema metadata key listing the columns stored as json strings
+JSON_COLUMNS_KEY = b'json_columns'
+
+
+class Stage:
+    """
+    Pipeline stage.
+
+    Parameters
+    ----------
+    name : stage name
+    function : function called with the input frames as keyword arguments
+        and the params, returning a dataframe or a tuple of dataframes
+        (one for each output)
+
+    Keyword arguments
+    -----------------
+    inputs : {output name: list of columns or None for all columns} of the
+        frames the stage reads (default None, source stage)
+    outputs : names of the stage outputs (default None, [name])
+    params : keyword arguments of the function, part of the cache key (default None)
+    files : params with the paths of the files the stage reads, hashed by content (default None)
+    options : keyword arguments of the function that don't change the result
+        (number of workers), not a part of the cache key (default None)
+    chunked : the function yields the output chunks (a dataframe or a tuple
+        of dataframes), written to the cache one by one without keeping the
+        outputs in memory (default False)
+    streamed : inputs passed as Chunks instead of dataframes (default None)
+    """
+    def __init__(self, name, function, inputs=None, outputs=None, params=None, files=None, options=None,
+                 chunked=False, streamed=None):
+        self.name = name
+        self.function = function
+        self.inputs = inputs or {}
+        self.outputs = outputs or [name]
+        self.params = params or {}
+        self.files = files or []
+        self.options = options or {}
+        self.chunked = chunked
+        self.streamed = streamed or []
+
+
+def get_code_hash(function, seen=None):
+    """
+    Return hash of the function source, of the functions from the same
+    module it calls and of the project modules it uses, so changing a helper
+    invalidates the stages using it.
+    """
+    seen = set() if seen is None else seen
+    seen.add(function)
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(function).encode('utf-8'))
+    except (OSError, TypeError):
+        digest.update(function.__code__.co_code)
+
+    names = set()
+    codes = [function.__code__]
+    while codes:
+        code = codes.pop()
+        names.update(code.co_names)
+        codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+    for name in sorted(names):
+        value = function.__globals__.get(name)
+        if (isinstance(value, types.FunctionType) and value not in seen
+                and value.__module__ == function.__module__):
+            digest.update(get_code_hash(value, seen).encode('ascii'))
+        elif isinstance(value, types.ModuleType) and value not in seen and _is_project_module(value, function):
+            seen.add(value)
+            digest.update(inspect.getsource(value).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _is_project_module(module, function):
+    module_file = getattr(module, '__file__', None)
+    function_file = inspect.getsourcefile(function)
+    return bool(module_file and function_file) and (
+        os.path.dirname(os.path.abspath(module_file)) == os.path.dirname(os.path.abspath(function_file)))
+
+
+def get_file_hash(path, blocksize=1 << 20):
+    """
+    Return sha256 of the file content, '' if the file doesn't exist.
+    """
+    if not os.path.isfile(path):
+        return ''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_json_column(series):
+    values = series.dropna()
+    if len(values) == 0:
+        return False
+    first = values.iloc[0]
+    if isinstance(first, dict):
+        return True
+    return isinstance(first, (list, tuple)) and any(isinstance(item, dict) for item in first)
+
+
+def write_frame(df, path):
+    """
+    Write the dataframe to Parquet, with the dict columns and the mixed type
+    columns stored as json strings.
+    """
+    df = df.copy()
+    json_columns = []
+    for column in df.columns[df.dtypes == object]:
+        if not _is_json_column(df[column]):
+            try:
+                pa.array(df[column], from_pandas=True)
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        df[column] = df[column].map(lambda value: None if value is None or value is pd.NA
+                                    else json.dumps(value, default=str))
+        json_columns.append(column)
+
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    metadata = dict(table.schema.metadata or {})
+    metadata[JSON_COLUMNS_KEY] = json.dumps(json_columns).encode('utf-8')
+    temp_path = path + '.tmp'
+    pq.write_table(table.replace_schema_metadata(metadata), temp_path)
+    os.replace(temp_path, path)
+
+
+def read_frame(path, columns=None):
+    """
+    Read the dataframe written by write_frame, with the list columns as lists.
+    Only the columns are read from the file (default None, all columns).
+    """
+    table = pq.read_table(path, columns=columns, use_pandas_metadata=True)
+    json_columns = json.loads((table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]'))
+    df = table.to_pandas()
+    for name in table.column_names:
+        if name not in df.columns:
+            continue
+        if pa.types.is_list(table.schema.field(name).type):
+            df[name] = pd.Series(table.column(name).to_pylist(), index=df.index, dtype='object')
+        elif name in json_columns:
+            df[name] = df[name].map(lambda value: json.loads(value) if isinstance(value, str) else None)
+    if columns is not None:
+        df = df[columns]
+    return df
+
+
+def get_parts(path):
+    """
+    Return the Parquet files of the cached output: the part files of the
+    chunked outputs directory, or the file itself.
+    """
+    if os.path.isdir(path):
+        return [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                if filename.endswith('.parquet')]
+    return [path]
+
+
+class Chunks:
+    """
+    Re-iterable reader of a cached output, one dataframe for each part file.
+
+    Parameters
+    ----------
+    path : path of the cached output
+
+    Keyword arguments
+    -----------------
+    columns : columns to read (default None, all columns)
+    """
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+
+    def __iter__(self):
+        for part in get_parts(self.path):
+            yield read_frame(part, self.columns)
+
+
+class Pipeline:
+    """
+    Runs the stages needed for the requested outputs, loading the outputs
+    with unchanged keys from the cache directory.
+
+    Parameters
+    ----------
+    stages : list of Stage
+    cache_path : directory of the cached stage outputs
+
+    Keyword arguments
+    -----------------
+    verbose : print computed and loaded stages, default to False
+    """
+    def __init__(self, stages, cache_path, verbose=False):
+        self.stages = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in self.stages:
+                    raise ValueError(f'Output {output} is produced by several stages')
+                self.stages[output] = stage
+        self.cache_path = cache_path
+        self.verbose = verbose
+        self.keys = {}
+        self.frames = {}
+        self.computed = []
+        os.makedirs(cache_path, exist_ok=True)
+
+    def get_key(self, output):
+        """
+        Return the cache key of the output.
+        """
+        if output in self.keys:
+            return self.keys[output]
+        stage = self.stages[output]
+        digest = hashlib.sha256()
+        digest.update(stage.name.encode('utf-8'))
+        digest.update(get_code_hash(stage.function).encode('ascii'))
+        digest.update(repr(sorted(stage.params.items())).encode('utf-8'))
+        for param in stage.files:
+            digest.update(get_file_hash(stage.params[param]).encode('ascii'))
+        for name, columns in sorted(stage.inputs.items()):
+            digest.update(f'{name}:{self.get_key(name)}:{columns}'.encode('utf-8'))
+        for name in stage.outputs:
+            self.keys[name] = digest.hexdigest()[:16]
+        return self.keys[output]
+
+    def get_cache_file(self, output):
+        return os.path.join(self.cache_path, f'{output}-{self.get_key(output)}.parquet')
+
+    def is_cached(self, output):
+        return os.path.exists(self.get_cache_file(output))
+
+    def status(self):
+        """
+        Return {output: True if cached} for all the outputs.
+        """
+        return {output: self.is_cached(output) for output in self.stages}
+
+    def get(self, output, columns=None):
+        """
+        Return the output frame, from memory, the cache or by running its stage.
+        """
+        if output not in self.frames:
+            cached = self.is_cached(output)
+            if not cached:
+                self._run_stage(self.stages[output])
+            if output not in self.frames:
+                parts = [read_frame(part) for part in get_parts(self.get_cache_file(output))]
+                self.frames[output] = pd.concat(parts) if parts else pd.DataFrame()
+                if self.verbose and cached:
+                    print(f'Loaded {output} from the cache')
+        frame = self.frames[output]
+        return frame if columns is None else frame[columns]
+
+    def get_chunks(self, output, columns=None):
+        """
+        Return Chunks of the output, read from the cache part by part.
+        """
+        if not self.is_cached(output):
+            self._run_stage(self.stages[output])
+        return Chunks(self.get_cache_file(output), columns)
+
+    def _run_stage(self, stage):
+        frames = {name: self.get_chunks(name, columns) if name in stage.streamed else self.get(name, columns)
+                  for name, columns in stage.inputs.items()}
+        start = time.time()
+        result = stage.function(**frames, **stage.params, **stage.options)
+        if stage.chunked:
+            self._write_chunks(stage.outputs, result)
+        else:
+            if len(stage.outputs) == 1:
+                result = (result,)
+            for output, frame in zip(stage.outputs, result):
+                self.frames[output] = frame
+                self._write_cache(output, frame)
+        self.computed.append(stage.name)
+        if self.verbose:
+            print(f'Computed {stage.name} in {time.time() - start:.1f}s')
+
+    def _remove_cache(self, output):
+        # keeping only the latest version of the output
+        pattern = re.compile(re.escape(output) + r'-[0-9a-f]{16}\.parquet')
+        for filename in os.listdir(self.cache_path):
+            if pattern.fullmatch(filename):
+                path = os.path.join(self.cache_path, filename)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+
+    def _write_cache(self, output, frame):
+        self._remove_cache(output)
+        write_frame(frame, self.get_cache_file(output))
+
+    def _write_chunks(self, outputs, chunks):
+        # each output is a directory with a part file for each chunk
+        temp_paths = [self.get_cache_file(output) + '.tmp' for output in outputs]
+        for path in temp_paths:
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        for i, chunk in enumerate(chunks):
+            if len(outputs) == 1:
+                chunk = (chunk,)
+            for path, frame in zip(temp_paths, chunk):
+                write_frame(frame, os.path.join(path, f'part-{i:05d}.parquet'))
+        for output, path in zip(outputs, temp_paths):
+            self._remove_cache(output)
+            os.replace(path, self.get_cache_file(output))
+
+    def run(self, outputs=None):
+        """
+        Return {output: dataframe} for the outputs (default None, all outputs).
+        """
+        outputs = list(self.stages) if outputs is None else outputs
+        return {output: self.get(output) for output in outputs}
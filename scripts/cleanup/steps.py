@@ -0,0 +1,610 @@
+"""
+Clean-up steps of the Storefront, SteamSpy and reviews data, ported from the
+2-cleanup-restructure notebook to work on the decoded columns
+
+Stage functions take and return appid-indexed dataframes, the Storefront
+frames are aligned to the apps with align().
+"""
+
+# standard library imports
+import re
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import decode
+import encoding
+import graph
+import transforms
+
+# usd/eu exchange rate at the time of collection
+USD_EU_RATE = 0.95
+# date of the dataset collection
+COLLECTION_DATE = '2022-06-22'
+
+BADNAMES = ['none', 'None', 'na', 'Na', 'False', 'false', 0, '', 'invalid', 'Invalid']
+
+NDJSON_EXTENSIONS = ('.ndjson', '.ndjson.gz', '.ndjson.zst')
+
+# Rows of the Storefront file read at once in the chunked clean-up
+STOREFRONT_CHUNKSIZE = 20000
+
+# Heavy Storefront columns (decoded) spilled by read_storefront_chunks, by the output
+SPILLED_COLUMNS = {
+    'storefront_descriptions': ['detailed_description', 'about_the_game', 'short_description'],
+    'storefront_media': ['header_image', 'screenshots', 'background', 'movies'],
+    'storefront_requirements': ['pc_minimum', 'pc_recommended', 'mac_minimum', 'mac_recommended',
+                                'linux_minimum', 'linux_recommended'],
+}
+
+# Columns of the exported steam table, in the notebook order
+STEAM_COLUMNS = [
+    'type', 'name', 'required_age', 'dlc', 'fullgame', 'supported_languages', 'drm_notice',
+    'ext_user_account_notice', 'developers', 'publishers', 'demos', 'packages', 'platforms',
+    'categories', 'genres', 'achievements', 'release_date', 'content_descriptors', 'last_modified',
+    'supported_audio', 'coming_soon', 'price',
+]
+
+# Columns of the history snapshots: (output, column)
+HISTORY_COLUMNS = [
+    ('steam', 'last_modified'), ('steam', 'price'), ('storefront', 'currency'), ('storefront', 'price_initial'),
+    ('storefront', 'price_final'), ('storefront', 'discount_percent'), ('steam', 'review_score'),
+    ('steam', 'total_positive'), ('steam', 'total_negative'), ('steam', 'owners'), ('steam', 'average_forever'),
+    ('steam', 'median_forever'), ('steamspy', 'ccu'),
+]
+
+# Columns moved from steam to steam_optional
+OPTIONAL_COLUMNS = [
+    'drm_notice', 'ext_user_account_notice', 'demos', 'content_descriptors', 'metacritic_score', 'metacritic_url',
+]
+
+
+def _isna(value):
+    if isinstance(value, (list, dict, tuple)):
+        return False
+    return value is None or bool(pd.isna(value))
+
+
+def read_data(path, dtype=None):
+    """
+    Read csv or NDJSON data file to a dataframe.
+    """
+    if str(path).endswith(NDJSON_EXTENSIONS):
+        return pd.read_json(path, lines=True, dtype=False)
+    return pd.read_csv(path, dtype=dtype)
+
+
+def read_data_chunks(path, chunksize, dtype=None):
+    """
+    Return reader of the csv or NDJSON data file yielding dataframes of chunksize rows.
+    """
+    if str(path).endswith(NDJSON_EXTENSIONS):
+        return pd.read_json(path, lines=True, dtype=False, chunksize=chunksize)
+    return pd.read_csv(path, dtype=dtype, chunksize=chunksize)
+
+
+def read_storefront(path, workers=None):
+    """
+    Read and decode Storefront data, indexed by the row number.
+    """
+    df = read_data(path, dtype={'required_age': 'str', 'download_appid': 'int'})
+    return decode.decode_frame(df.reset_index(drop=True), workers=workers)
+
+
+def read_storefront_chunks(path, chunksize=STOREFRONT_CHUNKSIZE, workers=None):
+    """
+    Read and decode Storefront data in chunks, indexed by the row number.
+
+    Yields
+    ------
+    (storefront, *spilled) :
+        chunk without the heavy columns, and a frame with the columns of
+        each SPILLED_COLUMNS output
+    """
+    start = 0
+    spilled_columns = [column for columns in SPILLED_COLUMNS.values() for column in columns]
+    with read_data_chunks(path, chunksize, dtype={'required_age': 'str', 'download_appid': 'int'}) as reader:
+        for df in reader:
+            df.index = pd.RangeIndex(start, start + len(df))
+            start += len(df)
+            df = decode.decode_frame(df, workers=workers)
+            spilled = [df.reindex(columns=columns) for columns in SPILLED_COLUMNS.values()]
+            yield (df.drop(columns=spilled_columns, errors='ignore'), *spilled)
+
+
+def read_steamspy(path):
+    """
+    Read SteamSpy data with the columns renamed to the Storefront ones, indexed by appid.
+    """
+    df = read_data(path)
+    df = df.drop_duplicates(subset='appid', keep='last')
+    df = df.rename(columns={'genre': 'genres', 'developer': 'developers', 'publisher': 'publishers',
+                            'languages': 'supported_languages', 'userscore': 'review_score',
+                            'positive': 'total_positive', 'negative': 'total_negative'})
+    if 'tags' not in df.columns:
+        df['tags'] = None
+    df = decode.decode_frame(df, columns=['tags'], workers=1)
+    return df.set_index('appid')
+
+
+def read_reviews(path):
+    """
+    Read reviews data, indexed by appid.
+    """
+    df = read_data(path, dtype={'download_appid': 'int'})
+    return df.drop_duplicates(subset='appid', keep='last').set_index('appid')
+
+
+def read_missing_ids(path):
+    """
+    Read missing ids, empty if there is no file.
+    """
+    try:
+        return read_data(path)[['appid', 'reason']]
+    except FileNotFoundError:
+        return pd.DataFrame(columns=['appid', 'reason'])
+
+
+def align(df, apps):
+    """
+    Return the rows of the Storefront frame for the apps, indexed by appid.
+    """
+    df = df.loc[apps['row'].values]
+    df.index = apps.index
+    return df
+
+
+def chunk_apps(apps, chunk):
+    """
+    Return the apps with their Storefront rows in the chunk.
+    """
+    return apps[apps['row'].isin(chunk.index)]
+
+
+def removeIDs(df, ids_list, reason, missing_ids):
+    """
+    Remove ids and add them to the missing_ids with the reason.
+
+    Returns
+    -------
+    (df, missing_ids)
+    """
+    df = df.loc[~df.index.isin(ids_list)]
+
+    temp_df = pd.DataFrame(ids_list, columns=['appid'])
+    temp_df['reason'] = reason
+    missing_ids = pd.concat([missing_ids, temp_df]).reset_index(drop=True)
+    return df, missing_ids
+
+
+def appid_fix(df, missing_df):
+    """
+    Replace the Storefront appids that differ from the requested ones with
+    download_appid, moving the replaced ids to the missing ids.
+    """
+    df = df.copy()
+    mask = (df['steam_appid'] != df['download_appid'])
+    removed_ids = df.loc[mask, 'steam_appid'].tolist()
+    fixed_ids = df.loc[mask, 'download_appid'].tolist()
+    df.loc[mask, 'steam_appid'] = df.loc[mask, 'download_appid']
+
+    temp_df = pd.DataFrame(removed_ids, columns=['appid'])
+    temp_df['reason'] = 'Storefront appid fix'
+    missing_df = missing_df.loc[~missing_df['appid'].isin(fixed_ids)]
+    missing_df = pd.concat([missing_df, temp_df]).reset_index(drop=True)
+    df = df.drop('download_appid', axis=1)
+    return df, missing_df
+
+
+def cleanName(df, missing_ids, remove_data=False):
+    """
+    Remove the apps with missing names, or set the names to NA.
+    """
+    mask = df['name'].isin(BADNAMES) | df['name'].isna()
+    if remove_data:
+        return removeIDs(df, df[mask].index.tolist(), 'Missing app name', missing_ids)
+    df = df.copy()
+    df.loc[mask, 'name'] = pd.NA
+    return df, missing_ids
+
+
+def cleanType(df, missing_ids, remove_data=False):
+    """
+    Remove the apps with missing types, or set the types to NA.
+    """
+    mask = df['type'].isin(BADNAMES) | df['type'].isna()
+    if remove_data:
+        return removeIDs(df, df[mask].index.tolist(), 'Missing app type', missing_ids)
+    df = df.copy()
+    df.loc[mask, 'type'] = pd.NA
+    return df, missing_ids
+
+
+def fix_apps(storefront, missing_ids_raw):
+    """
+    Fix the appids and remove duplicates and the apps without name or type.
+
+    Returns
+    -------
+    (apps, missing_ids) :
+        apps indexed by appid with their Storefront row number, and the
+        missing ids with the removed apps added
+    """
+    df = storefront.copy()
+    df['row'] = df.index
+    df, missing_ids = appid_fix(df, missing_ids_raw)
+    df = df.drop_duplicates(subset='steam_appid', keep='last')
+    df = df.rename(columns={'steam_appid': 'appid'}).set_index('appid')
+    df, missing_ids = cleanName(df, missing_ids, remove_data=True)
+    df, missing_ids = cleanType(df, missing_ids, remove_data=True)
+    return df, missing_ids.reset_index(drop=True)
+
+
+def updateFromAlternateSource(maindf, subdf):
+    """
+    Fill the missing values from the same columns of the other dataframe.
+    """
+    df = maindf.copy()
+    for column in subdf.columns.intersection(df.columns):
+        alternate = subdf[column].reindex(df.index)
+        mask = df[column].map(_isna) & ~alternate.map(_isna)
+        df.loc[mask, column] = alternate[mask]
+    return df
+
+
+def getOtherOrParentColumnValue(df, current, alternate, parents):
+    """
+    Get the values from the other column and if they are not available - from the parent apps.
+    """
+    values = df[current].where(df[current].notna(), df[alternate])
+    return values.where(values.notna(), graph.get_parent_values(df[current], parents))
+
+
+def fixDevPub(apps, storefront, steamspy, fullgame):
+    """
+    Fill missing developers/publishers from SteamSpy, from each other and from
+    the parent app.
+    """
+    df = align(storefront, apps)[['developers', 'publishers']].copy()
+    for column in ['developers', 'publishers']:
+        df[column] = df[column].map(lambda x: x if isinstance(x, list) and x else None)
+    # SteamSpy lists developers and publishers as comma separated strings
+    alternate = steamspy[['developers', 'publishers']].apply(
+        lambda column: column.map(lambda x: x.split(', ') if isinstance(x, str) and x else None))
+    df = updateFromAlternateSource(df, alternate)
+
+    parents = fullgame['fullgame']
+    developers = getOtherOrParentColumnValue(df, 'developers', 'publishers', parents)
+    df['publishers'] = getOtherOrParentColumnValue(df, 'publishers', 'developers', parents)
+    df['developers'] = developers
+    return df[['developers', 'publishers']]
+
+
+def getAge(age):
+    """
+    Get the required age number from the string.
+    """
+    age = str(age)
+    try:
+        x = re.search(r'\d+', age).group()
+        x = int(x)
+    except AttributeError:
+        return pd.NA
+    return x
+
+
+def cleanContentDesc(df):
+    """
+    Set the empty content descriptors notes to NA.
+    """
+    badstrings = BADNAMES + ['\r\n']
+    df['content_descriptors'] = df['content_descriptors'].mask(df['content_descriptors'].isin(badstrings), None)
+    return df
+
+
+def processAchievements(df):
+    """
+    Parse as total number of achievements.
+    """
+    df['achievements'] = df['achievements'].fillna(0)
+    return df
+
+
+def clean_details(apps, storefront):
+    """
+    Clean required age, content descriptors, platforms and achievements,
+    keeping the other details as decoded.
+    """
+    df = align(storefront, apps).copy()
+    df['required_age'] = transforms.map_unique(df['required_age'], getAge).astype('Int64')
+    df = cleanContentDesc(df)
+    df['platforms'] = df['platforms'].map(lambda x: x if isinstance(x, list) else [])
+    df = processAchievements(df)
+    return df
+
+
+def audioParse(string):
+    """
+    Parsing audio part of the language string into the separate column
+    """
+    if string != string or not isinstance(string, str):
+        return pd.NA
+    # This regex is not too complicated: just matching the text groups ending with <strong>*</strong>
+    pattern = r'(?:([A-Za-z -]+)(?:<strong>\*<\/strong>)(?:, )*)'
+    items = re.findall(pattern, string)
+    # Replacing empty lists with NaN. For the group operations, keeping empty lists would actually
+    # be better but they will be transformed to NaN on export anyways.
+    if len(items) == 0:
+        return pd.NA
+    return sorted(items)
+
+
+def parseLanguages(string):
+    """
+    Return [text languages, audio languages] lists of the Storefront languages string
+    """
+    if not isinstance(string, str):
+        return [None, None]
+    # removing tags and unnecessary endings and splitting the string into the text support list
+    text = re.sub(r'<br><strong>\*<\/strong>languages with full audio support', '', string)
+    text = re.sub(r'<strong>\*</strong>', '', text)
+    return [sorted(text.split(', ')), audioParse(string)]
+
+
+def cleanLanguages(df):
+    """
+    Clean and split supported_languages into two columns: supported_languages and supported_audio
+    """
+    df = df.copy()
+    languages = transforms.map_unique(df['supported_languages'], parseLanguages)
+    df['supported_languages'] = languages.str[0]
+    df['supported_audio'] = languages.str[1]
+    return df
+
+
+def clean_languages(apps, storefront, steamspy):
+    """
+    Clean the Storefront languages, filled from SteamSpy if missing.
+    """
+    df = align(storefront, apps)[['supported_languages']]
+    df = updateFromAlternateSource(df, steamspy[['supported_languages']])
+    return cleanLanguages(df)
+
+
+def cleanReleaseDate(apps, storefront, collection_date=COLLECTION_DATE):
+    """
+    Cleaning release date, marking the apps released after the collection as coming soon
+    """
+    df = align(storefront, apps)[['release_date', 'coming_soon']].copy()
+    df['coming_soon'] = df['coming_soon'].fillna(False)
+    df.loc[df['release_date'] > pd.Timestamp(collection_date), 'coming_soon'] = True
+    return df
+
+
+def cleanPrice(apps, storefront, usd_eu_rate=USD_EU_RATE):
+    """
+    Cleaning price column, checking for currencies and free games
+    """
+    df = align(storefront, apps)[['is_free', 'currency', 'price_initial']].copy()
+    df['price'] = df['price_initial']
+    # set price of free games to 0
+    df.loc[df['is_free'].isin([True, 'True', 'true']), 'price'] = 0
+    # convert the price from USD to EU
+    usd = (df['currency'] == 'USD') & (df['price'] > 0)
+    df.loc[usd, 'price'] = df.loc[usd, 'price'] * usd_eu_rate
+    return df[['price']]
+
+
+def fullgame_cleaning(apps, storefront):
+    """
+    Cleaning fullgame, filling it from the dlc lists of the other apps when missing
+    """
+    df = align(storefront, apps)[['fullgame', 'dlc']].copy()
+    df['fullgame'] = graph.get_parent_index(df['fullgame'], df['dlc'], apps['type'])
+    return df
+
+
+def metacritic_clean(df1, df2):
+    """
+    Copy the decoded metacritic_score and metacritic_url columns to reviews
+    (creating new rows if necessary).
+    """
+    df2 = pd.concat([df2, df1[['metacritic_score', 'metacritic_url']]], ignore_index=False, axis=1)
+    # filling the new rows
+    review_fills = {'review_score': 0, 'review_score_desc': 'No user reviews', 'total_positive': 0,
+                    'total_reviews': 0, 'total_negative': 0}
+    return df2.fillna(value=review_fills)
+
+
+def df_remove_excesses(df_primary, df_secondary):
+    excesses = df_secondary.index.difference(df_primary.index)
+    df_secondary = df_secondary.drop(excesses, axis=0)
+    return df_secondary
+
+
+def clean_reviews(apps, storefront, reviews_raw):
+    """
+    Add metacritic data and SteamDB rating to reviews, keeping only the apps.
+    """
+    df = align(storefront, apps)
+    reviews = metacritic_clean(df, reviews_raw)
+    # SteamDB rating, 50% for the apps without reviews
+    reviews['rating'] = (
+        reviews['total_positive'] / reviews['total_reviews'] -
+        (reviews['total_positive'] / reviews['total_reviews'] - 0.5) * np.power(2, -np.log10(reviews['total_reviews'] + 1))
+    ) * 100
+    reviews['rating'] = reviews['rating'].fillna(50.0)
+    reviews = df_remove_excesses(apps, reviews)
+    reviews = reviews.drop(['total_reviews', 'review_score_desc', 'download_appid'], axis=1, errors='ignore')
+    reviews.index.name = 'appid'
+    return reviews
+
+
+def ownersFormat(owners):
+    """
+    Reformatting '20,000 .. 50,000' owners string to '20000-50000'
+    """
+    if not isinstance(owners, str):
+        return None
+    return owners.replace(',', '').replace(' .. ', '-')
+
+
+def owners_clean(df):
+    """
+    Reformatting owners column to lower-upper format
+    """
+    df['owners'] = transforms.map_unique(df['owners'], ownersFormat)
+    return df
+
+
+def average_forever_clean(df):
+    """
+    Cleaning average_forever in SteamSpy
+    """
+    df['average_forever'] = df['average_forever'].fillna(0)
+    return df
+
+
+def median_forever_clean(df):
+    """
+    Cleaning median_forever in SteamSpy
+    """
+    df['median_forever'] = df['median_forever'].fillna(0)
+    return df
+
+
+def clean_steamspy(steamspy):
+    """
+    Clean the SteamSpy columns kept in the steam table.
+    """
+    df = steamspy[['owners', 'average_forever', 'median_forever', 'tags']].copy()
+    df = owners_clean(df)
+    df = average_forever_clean(df)
+    df = median_forever_clean(df)
+    return df
+
+
+def clean_tags(steamspy):
+    """
+    Spread the SteamSpy tags to columns with the number of users using the said tag
+    as a value. Tags are renamed to comply with pandas column names requirements.
+    """
+    encoded = encoding.encode(steamspy['tag_votes'])
+    columns = [tag.lower().replace(' ', '_').replace('-', '_').replace("'", '') for tag in encoded.vocabulary]
+    tag_data = encoded.to_frame(columns=columns)
+    # tags that differ only in case or separators end up in the same column, keeping the last one
+    return tag_data.loc[:, ~tag_data.columns.duplicated(keep='last')]
+
+
+def cleanPackageGroups(apps, storefront):
+    """
+    Return package groups information, one row for each group.
+    """
+    df = align(storefront, apps)
+    rows = []
+    for appid, groups in df['package_groups'].items():
+        if not isinstance(groups, list):
+            continue
+        for group in groups:
+            rows.append({
+                'appid': appid,
+                'type': group.get('name'),
+                'title': group.get('title'),
+                # parsing boolean field to python boolean
+                'is_recurring_subscription': group.get('is_recurring_subscription') != 'false',
+                'subs': group.get('subs'),
+            })
+    return pd.DataFrame(rows, columns=['appid', 'type', 'title', 'is_recurring_subscription', 'subs'])
+
+
+def cleanRequirements(apps, storefront):
+    """
+    Return the decoded requirements, without the apps with no requirements.
+    """
+    df = align(storefront, apps)
+    requirements = df[['pc_minimum', 'pc_recommended', 'mac_minimum', 'mac_recommended',
+                       'linux_minimum', 'linux_recommended']]
+    return requirements.dropna(how='all')
+
+
+def cleanDescriptions(apps, storefront):
+    """
+    Return descriptions. Empty descriptions are not included.
+    """
+    df = align(storefront, apps)
+    return df[['detailed_description', 'about_the_game', 'short_description']].dropna(how='all')
+
+
+def cleanMedia(apps, storefront):
+    """
+    Return media columns of the apps with screenshots.
+    """
+    df = align(storefront, apps)
+    return df.loc[df['screenshots'].notnull(), ['header_image', 'screenshots', 'background', 'movies']]
+
+
+def cleanRequirementsChunks(apps, storefront_requirements):
+    """
+    Yield requirements for each chunk of the spilled Storefront requirements.
+    """
+    for chunk in storefront_requirements:
+        yield cleanRequirements(chunk_apps(apps, chunk), chunk)
+
+
+def cleanDescriptionsChunks(apps, storefront_descriptions):
+    """
+    Yield descriptions for each chunk of the spilled Storefront descriptions.
+    """
+    for chunk in storefront_descriptions:
+        yield cleanDescriptions(chunk_apps(apps, chunk), chunk)
+
+
+def cleanMediaChunks(apps, storefront_media):
+    """
+    Yield media columns for each chunk of the spilled Storefront media.
+    """
+    for chunk in storefront_media:
+        yield cleanMedia(chunk_apps(apps, chunk), chunk)
+
+
+def cleanSupport(apps, storefront):
+    """
+    Return website and support links, only rows with at least one piece of information.
+    """
+    df = align(storefront, apps)
+    return df[['website', 'support_url', 'support_email']].dropna(how='all')
+
+
+def steam_export(apps, developers, details, languages, release, price, fullgame, reviews, steamspy_data):
+    """
+    Combine the cleaned columns to the steam table and split steam_optional from it.
+
+    Returns
+    -------
+    (steam, steam_optional)
+    """
+    df = pd.concat([apps[['type', 'name', 'last_modified']], developers, details, languages, release,
+                    price, fullgame], axis=1)
+    df = pd.concat([df[STEAM_COLUMNS], reviews.reindex(apps.index), steamspy_data.reindex(apps.index)], axis=1)
+    df.index.name = 'appid'
+
+    steam_optional_df = df[OPTIONAL_COLUMNS].copy()
+    # removing empty rows
+    steam_optional_df = steam_optional_df.dropna(how='all')
+    # dropping unneeded columns from the main dataframe
+    df = df.drop(OPTIONAL_COLUMNS, axis=1)
+    return df, steam_optional_df
+
+
+def history_snapshot(apps, steam, storefront, steamspy):
+    """
+    Return the HISTORY_COLUMNS of the apps, the snapshot of the collection
+    run recorded to the history store.
+    """
+    frames = {'steam': steam, 'storefront': align(storefront, apps), 'steamspy': steamspy.reindex(apps.index)}
+    df = pd.DataFrame({column: frames[output][column].reindex(apps.index) for output, column in HISTORY_COLUMNS},
+                      index=apps.index)
+    df.index.name = 'appid'
+    return df
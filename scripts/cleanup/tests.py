@@ -0,0 +1,99 @@
+"""
+Clean-up tests
+"""
+
+# standart library imports
+import random
+import shutil
+import tempfile
+
+# third party imports
+import pandas as pd
+
+# project imports
+import history
+
+def get_snapshots(count = 5, app_count = 300, seed = 0):
+    """
+    Return list of (collected, snapshot dataframe indexed by appid) of the
+    collection runs, with changed prices and reviews, added and removed apps
+
+    Parameters
+    ----------
+    count : number of the snapshots
+    app_count : number of the apps in the first snapshot
+    seed : random seed
+    """
+    rng = random.Random(seed)
+    appids = list(range(10, 10 * app_count + 10, 10))
+    df = pd.DataFrame({
+        'price': [rng.choice([None, round(rng.uniform(0, 60), 2)]) for _ in appids],
+        'positive': [rng.randint(0, 5000) for _ in appids],
+        'owners': [rng.choice(['0-20000', '20000-50000']) for _ in appids],
+        'last_modified': [1600000000 + rng.randint(0, 10 ** 7) for _ in appids],
+    }, index = pd.Index(appids, name = 'appid'))
+    snapshots = []
+    for i in range(count):
+        df = df.copy()
+        changed = rng.sample(list(df.index), len(df) // 10)
+        df.loc[changed, 'positive'] += 1
+        df.loc[changed[::2], 'price'] = None
+        df.loc[changed[1::2], 'last_modified'] += 100
+        df = df.drop(rng.sample(list(df.index), 3))
+        added = [df.index.max() + 10 * (j + 1) for j in range(5)]
+        df = pd.concat([df, pd.DataFrame({'price': 9.99, 'positive': 0, 'owners': '0-20000',
+                                          'last_modified': 1700000000}, index = pd.Index(added, name = 'appid'))])
+        snapshots.append((pd.Timestamp('2022-06-22') + pd.Timedelta(days = 7 * i), df))
+    return snapshots
+
+def history_as_of(verbose = False):
+    """
+    Testing the history store: as_of at each snapshot time (and between the
+    snapshots) rebuilds the snapshot, re-appending the last snapshot is a no-op
+
+    Parameters
+    ----------
+    verbose : verbose output
+
+    Returns
+    bool :
+        True if no errors, otherwise False
+    """
+    temp_path = tempfile.mkdtemp(prefix = 'steam_history_')
+    snapshots = get_snapshots()
+    mismatches = []
+    try:
+        store = history.HistoryStore(temp_path)
+        results = [store.append(df, collected) for collected, df in snapshots]
+        repeated = store.append(*reversed(snapshots[-1]))
+        store = history.HistoryStore(temp_path)
+        for collected, df in snapshots:
+            for date in (collected, collected + pd.Timedelta(days = 1)):
+                try:
+                    # the integer columns are rebuilt as nullable integers
+                    pd.testing.assert_frame_equal(store.as_of(date), df.sort_index(), check_dtype = False)
+                except AssertionError:
+                    mismatches.append(str(date))
+        state = store.get_state().sort_index()
+        times = len(store.times())
+    except Exception as e:
+        if (verbose):
+            print(e)
+        return False
+    finally:
+        shutil.rmtree(temp_path, ignore_errors = True)
+    if (verbose):
+        print(f'Changed values per snapshot: {[result["values"] for result in results]}')
+        print(f'Snapshots not rebuilt: {mismatches}')
+    return (not mismatches) and (repeated == results[-1]) and (times == len(snapshots)) \
+        and (state.index.tolist() == sorted(snapshots[-1][1].index))
+
+def all(verbose = False):
+    # History store snapshots
+    if (history_as_of(verbose)):
+        print('History as_of test PASSED')
+    else:
+        print('History as_of test FAILED')
+    return True
+
+all(verbose = True)
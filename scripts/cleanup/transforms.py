@@ -0,0 +1,205 @@
+"""
+Unique-value memoized transforms of the repetitive string columns
+(languages, required ages, owners, release dates)
+
+A column is factorized, the parser runs once for each distinct value and
+the results are broadcast back through the codes. Parsed values can be
+kept between runs in a SQLite cache, keyed by the parser code.
+"""
+
+# standard library imports
+import json
+import os
+import sqlite3
+import threading
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import pipeline
+
+# Release date formats of the Storefront, tried in order
+DATE_FORMATS = [
+    '%d %b, %Y',
+    '%b %d, %Y',
+    '%d %B, %Y',
+    '%B %d, %Y',
+    '%d %b %Y',
+    '%b %d %Y',
+    '%Y-%m-%d',
+    '%b %Y',
+    '%B %Y',
+    '%Y',
+]
+
+
+class TransformCache:
+    """
+    Persistent cache of the parsed values, one namespace for each parser
+    version.
+
+    Parameters
+    ----------
+    path : path to the SQLite cache file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.loaded = {}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS transforms (
+                transform TEXT,
+                key TEXT,
+                value TEXT,
+                PRIMARY KEY (transform, key)
+            )''')
+        self.connection.commit()
+
+    def get(self, transform):
+        """
+        Return {value: parsed value} of the transform.
+        """
+        with self.lock:
+            if transform not in self.loaded:
+                rows = self.connection.execute('SELECT key, value FROM transforms WHERE transform = ?', (transform,))
+                self.loaded[transform] = {key: json.loads(value) for key, value in rows}
+            return self.loaded[transform]
+
+    def add(self, transform, values):
+        """
+        Add {value: parsed value} of the transform, parsed values must be json serializable.
+        """
+        if not values:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO transforms (transform, key, value) VALUES (?, ?, ?)',
+                [(transform, key, json.dumps(value)) for key, value in values.items()])
+            self.loaded.setdefault(transform, {}).update(values)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Cache used by map_unique, set with set_cache
+cache = None
+
+
+def set_cache(path):
+    """
+    Keep the parsed values in the SQLite file at path, None to disable.
+    """
+    global cache
+    if cache is not None:
+        cache.close()
+    cache = TransformCache(path) if path else None
+    return cache
+
+
+def _to_cached(value):
+    if isinstance(value, tuple):
+        value = list(value)
+    if isinstance(value, list):
+        return [_to_cached(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    try:
+        return None if pd.isna(value) else value
+    except (TypeError, ValueError):
+        return value
+
+
+def map_unique(values, function, persistent=True):
+    """
+    Apply the function to each distinct value of the series once and
+    broadcast the results back.
+
+    Parameters
+    ----------
+    values : series of strings (or other hashable values)
+    function : parser of a single value
+
+    Keyword arguments
+    -----------------
+    persistent : keep the string results in the transform cache, if it is
+        set; results must be json serializable (default True)
+
+    Returns
+    -------
+    object series of the parsed values, aligned to values; missing results
+    are None and tuples are returned as lists
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = list(uniques)
+    parsed = [None] * len(uniques)
+
+    known = {}
+    transform = None
+    if persistent and cache is not None:
+        transform = f'{function.__module__}.{function.__name__}:{pipeline.get_code_hash(function)[:16]}'
+        known = cache.get(transform)
+    new_values = {}
+    for i, value in enumerate(uniques):
+        key = value if isinstance(value, str) else None
+        if key is not None and key in known:
+            parsed[i] = known[key]
+            continue
+        parsed[i] = _to_cached(function(value))
+        if key is not None and transform is not None:
+            new_values[key] = parsed[i]
+    if transform is not None:
+        cache.add(transform, new_values)
+
+    # the missing values are parsed too, they are the last item
+    parsed.append(_to_cached(function(np.nan)))
+    results = np.empty(len(parsed), dtype=object)
+    results[:] = parsed
+    return pd.Series(results[codes], index=values.index, dtype='object')
+
+
+def parse_dates(dates, formats=DATE_FORMATS):
+    """
+    Parse the release date strings with the known formats, each distinct
+    string once. The strings of the other formats are parsed by
+    pd.to_datetime one by one, the unparseable ones ('Coming soon', 'TBA')
+    become NaT.
+
+    Parameters
+    ----------
+    dates : series of date strings
+
+    Returns
+    -------
+    datetime series aligned to dates
+    """
+    dates = pd.Series(dates, dtype='object')
+    codes, uniques = pd.factorize(dates)
+    uniques = pd.Series(uniques, dtype='object').str.strip()
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[ns]')
+
+    remaining = uniques.notna()
+    for date_format in formats:
+        if not remaining.any():
+            break
+        result = pd.to_datetime(uniques[remaining], format=date_format, errors='coerce')
+        found = result.notna()
+        parsed[found[found].index] = result[found]
+        remaining[found[found].index] = False
+
+    for i in remaining[remaining].index:
+        try:
+            parsed[i] = pd.to_datetime(uniques[i])
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+    values = np.append(parsed.values, np.datetime64('NaT', 'ns'))
+    return pd.Series(values[codes], index=dates.index)
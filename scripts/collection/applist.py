@@ -7,6 +7,7 @@ import csv
 import datetime as dt
 import json
 import os
+import shutil
 import statistics
 import time
 
@@ -19,7 +20,24 @@ import requests.auth
 # project imports
 import common
 
-def get_app_list_batch(url, parameters):
+# Columns and fixed dtypes of the application list
+APP_LIST_DTYPES = {
+    'download_appid': 'int64',
+    'last_modified': 'Int64',
+    'price_change_number': 'Int64',
+}
+
+# Formats of the application list file, the first one is the default
+APP_LIST_FORMATS = ['csv', 'parquet']
+
+# IStoreService returns at most 50000 apps per request
+MAX_RESULTS = 50000
+
+# Checkpoint with the last_appid of the written pages, kept next to the listing file
+CHECKPOINT_SUFFIX = '.checkpoint.json'
+
+
+def get_app_list_batch(url, parameters, proxies = None):
     """
     Getting application list data in batches, since IStoreService
     has limited max output
@@ -28,6 +46,7 @@ def get_app_list_batch(url, parameters):
     ----------
     url : string
     parameters : dictionary of the request parameters
+    proxies : {'protocol': 'connection_string'} to use with the request
 
     Returns
     -------
@@ -38,13 +57,12 @@ def get_app_list_batch(url, parameters):
         "appid":10,"name":"Counter-Strike","last_modified":1602535893,"price_change_number":13853601
     last_appid : last application id in the batch
     """
-    proxies = common.get_proxies()
     json_data = common.get_request(
         url,
         parameters=parameters,
         proxies = proxies
         )
-    steam_id = pd.DataFrame.from_dict(json_data['response']['apps'])
+    steam_id = pd.DataFrame.from_dict(json_data['response'].get('apps', []))
     try:
         more_results = json_data['response']['have_more_results']
         last_appid =  json_data['response']['last_appid']
@@ -53,40 +71,172 @@ def get_app_list_batch(url, parameters):
         last_appid = False
     return more_results, steam_id, last_appid
 
-def get_app_list():
+def format_app_list(steam_ids):
     """
-    Getting the list of applications using Steam IStoreService
+    Return the IStoreService apps with download_appid, last_modified and
+    price_change_number columns in APP_LIST_DTYPES
+    """
+    steam_ids = steam_ids.rename(columns = {'appid': 'download_appid'})
+    steam_ids = steam_ids.reindex(columns = list(APP_LIST_DTYPES))
+    return steam_ids.astype(APP_LIST_DTYPES)
+
+def iter_app_list(max_results = MAX_RESULTS, last_appid = None):
+    """
+    Generating the list of applications from Steam IStoreService page by page
     Use https://steamapi.xpaw.me/#IStoreService/GetAppInfo as a reference
     for additional parameters 
 
     Parameters
     ----------
-    none
+    max_results : number of apps requested per page (default MAX_RESULTS)
+    last_appid : continue the listing after this appid (default None, from the start)
 
-    Returns
-    -------
-    Application data in dataframe:
-        Example of a single app data:
-        "appid":10,"name":"Counter-Strike","last_modified":1602535893,"price_change_number":13853601
-   
+    Yields
+    ------
+    (page, last_appid) :
+        dataframe of the page apps in APP_LIST_DTYPES and the last appid to continue from
     """
     url = 'https://api.steampowered.com/IStoreService/GetAppList/v1/?'
     APIKey = common.get_api_key()
+    proxies = common.get_proxies()
     parameters = {'key': APIKey,
-                 'include_dlc': 'true'}
+                 'include_dlc': 'true',
+                 'max_results': max_results}
+    if (last_appid):
+        parameters['last_appid'] = last_appid
     more_results = True
-    begin = True
     # from the request we get the more_results flag and also the last_appid, so we use them for the next requests.
     while (more_results):
-        more_results, steam_ids, last_appid = get_app_list_batch(url, parameters)
+        more_results, steam_ids, last_appid = get_app_list_batch(url, parameters, proxies)
         parameters['last_appid'] = last_appid
-        if (begin):
-            steam_allids = steam_ids
-            begin = False
-        else:
-            steam_allids = steam_allids.append(steam_ids)
-    steam_allids.rename(columns = {'appid': 'download_appid'}, inplace = True)
-    return steam_allids.loc[:,['download_appid', 'last_modified', 'price_change_number']]
+        yield format_app_list(steam_ids), last_appid
+
+def get_app_list(max_results = MAX_RESULTS):
+    """
+    Getting the list of applications using Steam IStoreService
+
+    Parameters
+    ----------
+    max_results : number of apps requested per page (default MAX_RESULTS)
+
+    Returns
+    -------
+    Application data in dataframe:
+        Example of a single app data:
+        "appid":10,"name":"Counter-Strike","last_modified":1602535893,"price_change_number":13853601
+   
+    """
+    pages = [page for page, _ in iter_app_list(max_results)]
+    return pd.concat(pages, ignore_index = True) if pages else format_app_list(pd.DataFrame())
+
+def read_checkpoint(path):
+    """
+    Return last_appid saved for the listing file, None if there's no checkpoint
+    """
+    try:
+        with open(path + CHECKPOINT_SUFFIX) as f:
+            return json.load(f)['last_appid']
+    except FileNotFoundError:
+        return None
+
+def write_checkpoint(path, last_appid):
+    """
+    Save last_appid of the written pages, replacing the checkpoint atomically
+    """
+    checkpoint_path = path + CHECKPOINT_SUFFIX
+    with open(checkpoint_path + '.tmp', 'w') as f:
+        json.dump({'last_appid': last_appid}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+def write_app_list_page(path, page, number):
+    """
+    Write the listing page: appended to the csv file, or as a separate part of
+    the parquet dataset directory
+    """
+    if (path.endswith('.parquet')):
+        os.makedirs(path, exist_ok = True)
+        page.to_parquet(os.path.join(path, f'part-{number:05d}.parquet'), index = False)
+    else:
+        page.to_csv(path, mode = 'a', header = not os.path.isfile(path), index = False)
+
+def read_app_list(path):
+    """
+    Read the application list saved by save_app_list (csv or parquet) in APP_LIST_DTYPES
+    """
+    if (path.endswith('.parquet')):
+        full_ids = pd.read_parquet(path)
+    else:
+        full_ids = pd.read_csv(path)
+    return full_ids.astype(APP_LIST_DTYPES).drop_duplicates(subset = 'download_appid', keep = 'last')
+
+def get_app_list_path(download_path):
+    """
+    Return path of the application list in download_path: full_steam_ids.csv or the
+    full_steam_ids.parquet dataset, the last modified if both exist, csv if none
+    """
+    paths = [os.path.join(download_path, f'full_steam_ids.{file_format}') for file_format in APP_LIST_FORMATS]
+    existing = [path for path in paths if os.path.exists(path)]
+    return max(existing, key = os.path.getmtime) if existing else paths[0]
+
+def write_app_list(full_ids, path):
+    """
+    Replace the application list file with the dataframe: csv file or a parquet
+    dataset directory with a single part
+    """
+    if (path.endswith('.parquet')):
+        if (os.path.isdir(path)):
+            shutil.rmtree(path)
+        write_app_list_page(path, full_ids, 0)
+    else:
+        full_ids.to_csv(path, index = False)
+
+def save_app_list(path, max_results = MAX_RESULTS, resume = True, verbose = False):
+    """
+    Stream the application list to a csv file or a parquet dataset directory
+    (path ending with '.parquet'), page by page.
+
+    After each written page its last_appid is checkpointed, so an interrupted
+    listing continues with the next page.
+
+    Parameters
+    ----------
+    path : path to the listing file
+    max_results : number of apps requested per page (default MAX_RESULTS)
+    resume : continue from the checkpoint if it exists, otherwise start over (default True)
+    verbose : verbose output, default to False
+
+    Returns
+    -------
+    int :
+        number of apps written
+    """
+    last_appid = read_checkpoint(path) if resume else None
+    if (last_appid is None):
+        # starting over, removing the previous listing
+        if (os.path.isdir(path)):
+            for filename in os.listdir(path):
+                os.remove(os.path.join(path, filename))
+        elif (os.path.isfile(path)):
+            os.remove(path)
+    number = len(os.listdir(path)) if os.path.isdir(path) else 0
+
+    rows = 0
+    for page, last_appid in iter_app_list(max_results, last_appid):
+        if (len(page) > 0):
+            write_app_list_page(path, page, number)
+            number += 1
+        rows += len(page)
+        if (last_appid):
+            write_checkpoint(path, last_appid)
+        if (verbose):
+            print(f'Written {rows} apps, last appid {last_appid}')
+
+    # listing complete, next run starts over
+    if (os.path.isfile(path + CHECKPOINT_SUFFIX)):
+        os.remove(path + CHECKPOINT_SUFFIX)
+    return rows
 
 def get_update_ids(new_list, old_list):
     """
@@ -106,7 +256,64 @@ def get_update_ids(new_list, old_list):
     updated_list = new_list[~new_list['download_appid'].isin(old_list['download_appid'])].copy().drop_duplicates().reset_index(drop=True)
     return updated_list
 
-def download_app_list(download_path, verbose = False):
+def get_changed_ids(new_list, old_list):
+    """
+    Getting the apps to refresh by comparing the new app list with the stored one
+    on last_modified and price_change_number
+
+    Parameters
+    ----------
+    new_list : dataframe of apps from IStoreService
+    old_list : dataframe of the stored app list. Requires to have 'download_appid',
+        'last_modified' and 'price_change_number' columns
+
+    Returns
+    -------
+    dict of dataframes with the new_list columns:
+        'new' : apps missing from the old list
+        'metadata' : apps with changed last_modified (full appdetails refetch)
+        'price' : apps with only price_change_number changed (price-only refetch)
+    """
+    new_list = new_list.drop_duplicates(subset='download_appid', keep='last')
+    old_list = old_list[['download_appid', 'last_modified', 'price_change_number']].drop_duplicates(
+        subset='download_appid', keep='last')
+    merged = new_list.merge(old_list, on='download_appid', how='left', suffixes=('', '_old'), indicator=True)
+
+    is_new = (merged['_merge'] == 'left_only')
+    # nulls are compared as -1, so missing values on both sides don't count as changes
+    metadata_changed = ~is_new & merged['last_modified'].fillna(-1).ne(merged['last_modified_old'].fillna(-1))
+    price_changed = (~is_new & ~metadata_changed
+                     & merged['price_change_number'].fillna(-1).ne(merged['price_change_number_old'].fillna(-1)))
+
+    columns = list(new_list.columns)
+    return {
+        'new': merged.loc[is_new, columns].reset_index(drop=True),
+        'metadata': merged.loc[metadata_changed, columns].reset_index(drop=True),
+        'price': merged.loc[price_changed, columns].reset_index(drop=True),
+    }
+
+def restore_failed_ids(new_list, old_list, failed_ids):
+    """
+    Return the new app list with the failed apps reverted to their stored
+    last_modified and price_change_number, and the failed new apps dropped,
+    so the next incremental run detects them as changed again
+
+    Parameters
+    ----------
+    new_list : dataframe of apps from IStoreService
+    old_list : dataframe of the stored app list
+    failed_ids : download_appids of the apps that failed to download
+    """
+    old_list = old_list.drop_duplicates(subset='download_appid', keep='last').set_index('download_appid')
+    new_list = new_list.copy()
+    failed = new_list['download_appid'].isin(failed_ids)
+    restored = failed & new_list['download_appid'].isin(old_list.index)
+    for column in ['last_modified', 'price_change_number']:
+        new_list.loc[restored, column] = new_list.loc[restored, 'download_appid'].map(old_list[column])
+    return new_list[~failed | restored].reset_index(drop=True)
+
+def download_app_list(download_path, verbose = False, file_format = 'csv', resume = True,
+                      max_results = MAX_RESULTS):
     """
     Downloading application list
     
@@ -114,6 +321,9 @@ def download_app_list(download_path, verbose = False):
     ----------
     download_path : the path where the data is downloaded to
     verbose : verbose output, default to False
+    file_format : 'csv' or 'parquet', default to 'csv'
+    resume : continue the interrupted listing, default to True
+    max_results : number of apps requested per page (default MAX_RESULTS)
 
     Returns
     -------
@@ -122,12 +332,12 @@ def download_app_list(download_path, verbose = False):
    
     """
     try:
-        full_ids = get_app_list()
-        full_ids.to_csv(f'{download_path}full_steam_ids.csv', index=False)
+        rows = save_app_list(f'{download_path}full_steam_ids.{file_format}', max_results = max_results,
+                             resume = resume, verbose = verbose)
     except Exception as e:
         if (verbose):
             print(e)
         return False
     if (verbose):
-        print(f'Downloaded {full_ids.shape[0]} rows of data')
+        print(f'Downloaded {rows} rows of data')
     return True
\ No newline at end of file
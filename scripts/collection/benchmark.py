@@ -0,0 +1,168 @@
+"""
+Offline collection benchmarks against the local mock Steam API server
+"""
+
+# standard library imports
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+# third-party imports
+import pandas as pd
+
+# project imports
+import applist
+import common
+import metrics
+import mockserver
+import storefront
+
+
+def measure(function, *args, **kwargs):
+    """
+    Run the function with its output suppressed.
+
+    Returns
+    -------
+    (result, seconds, peak_memory) :
+        function result, run time and peak traced memory in MB
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 1024 ** 2
+
+
+def disable_rate_limits():
+    """
+    Remove the endpoint rate limits, the mock server injects the 429 responses instead.
+
+    Returns
+    -------
+    {endpoint: (rate, burst)} of the removed limits, for restore_rate_limits
+    """
+    limits = dict(common.RATE_LIMITS)
+    for endpoint in limits:
+        common.set_rate_limit(endpoint, None)
+    return limits
+
+
+def restore_rate_limits(limits):
+    """
+    Set the endpoint rate limits returned by disable_rate_limits.
+    """
+    for endpoint, limit in limits.items():
+        if limit is None:
+            common.set_rate_limit(endpoint, None)
+        else:
+            common.set_rate_limit(endpoint, *limit)
+
+
+def bench_app_list(max_results=(1000, 10000)):
+    """
+    Benchmark applist.get_app_list for the page sizes.
+    """
+    results = []
+    for page_size in max_results:
+        full_ids, seconds, peak = measure(applist.get_app_list, max_results=page_size)
+        results.append({'benchmark': 'get_app_list', 'max_results': page_size, 'apps': len(full_ids),
+                        'seconds': seconds, 'apps_per_second': len(full_ids) / seconds, 'peak_mb': peak})
+    return results
+
+
+def bench_process_batches(download_path, app_list, batchsizes=(100, 500), workers=(1, 4, 16)):
+    """
+    Benchmark common.process_batches with the Storefront parser for the batch
+    sizes and numbers of workers.
+    """
+    results = []
+    for batchsize in batchsizes:
+        for worker_count in workers:
+            common.prepare_data_file(download_path, 'bench_data.csv', 0, storefront.steam_columns)
+            errors = []
+            metrics.registry.reset()
+            _, seconds, peak = measure(
+                common.process_batches, storefront.parse_steam_request, app_list, download_path,
+                'bench_data.csv', 'bench_journal.sqlite', errors, storefront.steam_columns,
+                batchsize=batchsize, pause=0, download_appid=True, last_modified=True,
+                workers=worker_count, reset=True)
+            results.append({'benchmark': 'process_batches', 'batchsize': batchsize, 'workers': worker_count,
+                            'apps': len(app_list), 'errors': len(errors), 'seconds': seconds,
+                            'apps_per_second': len(app_list) / seconds, 'peak_mb': peak,
+                            'retries': metrics.registry.total('retries_total')})
+    return results
+
+
+def bench_storefront(download_path, workers=(1, 16), data_formats=('csv', 'ndjson.gz')):
+    """
+    Benchmark the full storefront.download_storefront run (download, merge to
+    the store and export) for the numbers of workers and the data formats.
+    """
+    full_steam_ids = pd.read_csv(os.path.join(download_path, 'full_steam_ids.csv'))
+    results = []
+    for data_format in data_formats:
+        for worker_count in workers:
+            for filename in os.listdir(download_path):
+                if filename.startswith('steam_'):
+                    os.remove(os.path.join(download_path, filename))
+            _, seconds, peak = measure(
+                storefront.download_storefront, download_path, workers=worker_count, pause=0,
+                data_format=data_format, export_data=True)
+            results.append({'benchmark': 'download_storefront', 'data_format': data_format,
+                            'workers': worker_count, 'apps': len(full_steam_ids), 'seconds': seconds,
+                            'apps_per_second': len(full_steam_ids) / seconds, 'peak_mb': peak})
+    return results
+
+
+def run(app_count=1000, latency=(0.005, 0.02), rate_limit_rate=0.01, error_rate=0, fixtures_path=None,
+        output_path=None):
+    """
+    Run all the benchmarks against a local mock server.
+
+    Keyword arguments
+    -----------------
+    app_count : number of apps in the mock app list (default 1000)
+    latency : mock response latency in seconds or (min, max) (default (0.005, 0.02))
+    rate_limit_rate : share of 429 responses (default 0.01)
+    error_rate : share of 500 responses (default 0)
+    fixtures_path : directory with recorded fixtures (default None, synthetic responses)
+    output_path : csv to save the results to (default None)
+
+    Returns
+    -------
+    dataframe with the results
+    """
+    download_path = tempfile.mkdtemp(prefix='steam_benchmark_') + os.sep
+    server = mockserver.MockSteamServer(fixtures_path, app_count=app_count, latency=latency,
+                                        rate_limit_rate=rate_limit_rate, error_rate=error_rate, seed=0)
+    rate_limits = disable_rate_limits()
+    try:
+        common.set_base_url(server.start())
+        results = bench_app_list()
+        full_steam_ids = applist.get_app_list()
+        full_steam_ids.to_csv(os.path.join(download_path, 'full_steam_ids.csv'), index=False)
+        results += bench_process_batches(download_path, full_steam_ids)
+        results += bench_storefront(download_path)
+    finally:
+        common.set_base_url(None)
+        restore_rate_limits(rate_limits)
+        server.stop()
+        shutil.rmtree(download_path, ignore_errors=True)
+
+    results = pd.DataFrame(results)
+    if output_path:
+        results.to_csv(output_path, index=False)
+    return results
+
+
+if __name__ == '__main__':
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(run().round(3))
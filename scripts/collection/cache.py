@@ -0,0 +1,151 @@
+"""
+On-disk cache for the raw API responses
+"""
+
+# standard library imports
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+# Time to live of the cached responses for each endpoint in seconds, None to never expire
+CACHE_TTL = {
+    'appdetails': 7 * 24 * 3600,
+    'appreviews': 24 * 3600,
+    # SteamSpy data is updated once a day
+    'steamspy': 24 * 3600,
+    'steamspy_all': 24 * 3600,
+    'applist': 3600,
+}
+
+# Request parameters that are not a part of the cache key
+IGNORED_PARAMETERS = ('key',)
+
+
+class ResponseCache:
+    """
+    Cache of the json responses stored as gzip-compressed blobs in SQLite.
+
+    Entries expire after the endpoint TTL and the least recently used ones are
+    evicted when the total compressed size goes over max_size.
+
+    Parameters
+    ----------
+    path : path to the SQLite cache file
+
+    Keyword arguments
+    -----------------
+    max_size : maximum total size of compressed responses in bytes (default 2 GB)
+    ttl : {'endpoint': seconds} overrides for CACHE_TTL
+    """
+    def __init__(self, path, max_size=2 * 1024 ** 3, ttl=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = dict(CACHE_TTL, **(ttl or {}))
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT,
+                url TEXT,
+                created REAL,
+                accessed REAL,
+                size INTEGER,
+                body BLOB
+            )''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.connection.commit()
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    @staticmethod
+    def get_key(url, parameters=None):
+        """
+        Return cache key for the request: url without the scheme and
+        sorted parameters without the API key.
+        """
+        parsed = urlparse(url)
+        location = parsed.netloc + parsed.path.rstrip('/')
+        items = sorted(
+            (str(name), str(value)) for name, value in (parameters or {}).items()
+            if name not in IGNORED_PARAMETERS
+        )
+        return hashlib.sha1(json.dumps([location, items]).encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, url, parameters=None):
+        """
+        Return cached json response, None if it's missing or expired.
+        """
+        key = self.get_key(url, parameters)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT created, size, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            created, size, body = row
+            ttl = self.ttl.get(endpoint)
+            if (ttl is not None) and (now - created > ttl):
+                self.connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.connection.commit()
+                self.size -= size
+                return None
+            self.connection.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+        return json.loads(gzip.decompress(body))
+
+    def put(self, endpoint, url, parameters, json_data):
+        """
+        Store json response, evicting least recently used entries if over max_size.
+        """
+        key = self.get_key(url, parameters)
+        body = gzip.compress(json.dumps(json_data).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, endpoint, url, now, now, len(body), body))
+            self.connection.commit()
+            self.size += len(body)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        # removing least recently used entries down to 90% of max_size to avoid evicting on every put
+        target = self.max_size * 0.9
+        removed = []
+        for key, size in self.connection.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            if self.size <= target:
+                break
+            removed.append((key,))
+            self.size -= size
+        self.connection.executemany('DELETE FROM responses WHERE key = ?', removed)
+        self.connection.commit()
+
+    def clear(self, endpoint=None):
+        """
+        Remove all cached responses, or only the ones for the endpoint.
+        """
+        with self.lock:
+            if endpoint is None:
+                self.connection.execute('DELETE FROM responses')
+            else:
+                self.connection.execute('DELETE FROM responses WHERE endpoint = ?', (endpoint,))
+            self.connection.commit()
+            self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
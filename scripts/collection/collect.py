@@ -0,0 +1,209 @@
+"""
+Command line entry point for the sharded Storefront collection
+
+Usage (from the repository root):
+    python scripts/collection/collect.py run --shards 4 --download-path ./data/download/
+    python scripts/collection/collect.py shard --shards 4 --shard 0 --download-path ./data/download/
+    python scripts/collection/collect.py merge --shards 4 --download-path ./data/download/
+"""
+
+# standard library imports
+import argparse
+import os
+import subprocess
+import sys
+import zlib
+
+# project imports
+import applist
+import common
+import store
+import storefront
+
+CREDENTIALS_PATH = './data/_credentials/'
+
+
+def get_shard(appid, shards):
+    """
+    Return the shard number of the appid, stable between runs and machines.
+    """
+    return zlib.crc32(str(int(appid)).encode('ascii')) % shards
+
+
+def split_shard(app_list, shards, shard):
+    """
+    Return the app_list rows of the shard.
+
+    Parameters
+    ----------
+    app_list : dataframe with download_appid
+    shards : number of shards
+    shard : shard number, from 0 to shards - 1
+    """
+    mask = app_list['download_appid'].map(lambda appid: get_shard(appid, shards) == shard)
+    return app_list[mask].reset_index(drop=True)
+
+
+def get_shard_path(download_path, shard):
+    """
+    Return the download path of the shard.
+    """
+    return os.path.join(download_path, f'shard_{shard:03d}', '')
+
+
+def get_shard_credentials(shard, credentials_path=CREDENTIALS_PATH):
+    """
+    Return (api_key, proxies) of the shard: from 'steam_key_<shard>.txt' and
+    'proxies_<shard>.txt' if present, otherwise from the default files.
+    """
+    key_path = os.path.join(credentials_path, f'steam_key_{shard}.txt')
+    if not os.path.isfile(key_path):
+        key_path = os.path.join(credentials_path, 'steam_key.txt')
+    proxies_path = os.path.join(credentials_path, f'proxies_{shard}.txt')
+    if not os.path.isfile(proxies_path):
+        proxies_path = os.path.join(credentials_path, 'proxies.txt')
+    return common.get_api_key(key_path), common.get_proxies(proxies_path)
+
+
+def collect_shard(download_path, shards, shard, workers=1, pause=1, full_download=False,
+                  data_format='csv', credentials_path=CREDENTIALS_PATH):
+    """
+    Download Storefront data for the shard of the apps from the application
+    list ('full_steam_ids.csv' or 'full_steam_ids.parquet') in download_path,
+    with the shard credentials. The shard data, store and journal are kept in
+    the shard directory, so the shard can be resumed or run on another machine.
+
+    Returns
+    -------
+    bool :
+        True if no errors, False if errors raised
+    """
+    shard_path = get_shard_path(download_path, shard)
+    os.makedirs(shard_path, exist_ok=True)
+
+    full_steam_ids = applist.read_app_list(applist.get_app_list_path(download_path))
+    shard_ids = split_shard(full_steam_ids, shards, shard)
+    shard_ids.to_csv(os.path.join(shard_path, 'full_steam_ids.csv'), index=False)
+    print(f'Shard {shard} of {shards}: {len(shard_ids)} apps\n')
+
+    storefront.APIKey, storefront.proxies = get_shard_credentials(shard, credentials_path)
+    return storefront.download_storefront(
+        shard_path, full_download=full_download, workers=workers, pause=pause, data_format=data_format)
+
+
+def merge_shards(download_path, shards, export_data=False, data_format='csv'):
+    """
+    Merge the shard stores to 'steam_app_data.sqlite' in download_path.
+
+    Shards are merged in order and for each appid the record with the latest
+    last_modified is kept, so the result doesn't depend on where and when the
+    shards were collected.
+
+    Returns
+    -------
+    int :
+        number of apps in the merged store
+    """
+    app_store = store.AppStore(os.path.join(download_path, 'steam_app_data.sqlite'))
+    for shard in range(shards):
+        shard_store_path = os.path.join(get_shard_path(download_path, shard), 'steam_app_data.sqlite')
+        if not os.path.isfile(shard_store_path):
+            print(f'Shard {shard} store not found, skipping')
+            continue
+        shard_store = store.AppStore(shard_store_path)
+        print(f'Merging shard {shard}: {app_store.merge(shard_store)} apps')
+        shard_store.close()
+
+    if export_data:
+        columns = storefront.steam_columns if data_format == 'csv' else None
+        app_store.export(os.path.join(download_path, f'steam_app_data.{data_format}'), columns)
+    count = app_store.count()
+    app_store.close()
+    print(f'Merged store: {count} apps')
+    return count
+
+
+def run_shards(download_path, shards, workers=1, pause=1, full_download=False, data_format='csv',
+               refresh_ids=False, export_data=False, credentials_path=CREDENTIALS_PATH, base_url=None):
+    """
+    Collect all the shards in parallel local processes and merge them.
+
+    Returns
+    -------
+    bool :
+        True if all shards finished without errors
+    """
+    app_list_path = applist.get_app_list_path(download_path)
+    if refresh_ids or not os.path.exists(app_list_path):
+        applist.write_app_list(applist.get_app_list(), app_list_path)
+
+    processes = []
+    for shard in range(shards):
+        command = [sys.executable, os.path.abspath(__file__), 'shard',
+                   '--download-path', download_path, '--shards', str(shards), '--shard', str(shard),
+                   '--workers', str(workers), '--pause', str(pause), '--data-format', data_format,
+                   '--credentials-path', credentials_path]
+        if full_download:
+            command.append('--full')
+        if base_url:
+            command += ['--base-url', base_url]
+        log = open(os.path.join(download_path, f'shard_{shard:03d}.log'), 'w')
+        processes.append((subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT), log))
+
+    success = True
+    for shard, (process, log) in enumerate(processes):
+        return_code = process.wait()
+        log.close()
+        if return_code != 0:
+            print(f'Shard {shard} failed with code {return_code}, see shard_{shard:03d}.log')
+            success = False
+
+    merge_shards(download_path, shards, export_data, data_format)
+    return success
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description='Sharded Steam Storefront collection')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for command, help_text in [('run', 'collect all shards in local processes and merge them'),
+                               ('shard', 'collect one shard'),
+                               ('merge', 'merge the shard stores')]:
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument('--download-path', default='./data/download/')
+        subparser.add_argument('--shards', type=int, required=True, help='number of shards')
+        subparser.add_argument('--data-format', default='csv', help="'csv', 'ndjson.gz' or 'ndjson.zst'")
+        if command == 'shard':
+            subparser.add_argument('--shard', type=int, required=True, help='shard number, from 0')
+        if command in ('run', 'shard'):
+            subparser.add_argument('--workers', type=int, default=1, help='concurrent requests per shard')
+            subparser.add_argument('--pause', type=float, default=1, help='pause between requests with 1 worker')
+            subparser.add_argument('--full', action='store_true', help='download all apps from scratch')
+            subparser.add_argument('--credentials-path', default=CREDENTIALS_PATH)
+            subparser.add_argument('--base-url', help='send the requests to this server (e.g. mockserver)')
+        if command == 'run':
+            subparser.add_argument('--refresh-ids', action='store_true', help='refresh the application list')
+        if command in ('run', 'merge'):
+            subparser.add_argument('--export', action='store_true', help='export the merged steam_app_data file')
+    return parser
+
+
+def main(args=None):
+    args = get_parser().parse_args(args)
+    if getattr(args, 'base_url', None):
+        common.set_base_url(args.base_url)
+    if args.command == 'shard':
+        success = collect_shard(args.download_path, args.shards, args.shard, args.workers, args.pause,
+                                args.full, args.data_format, args.credentials_path)
+    elif args.command == 'merge':
+        merge_shards(args.download_path, args.shards, args.export, args.data_format)
+        success = True
+    else:
+        success = run_shards(args.download_path, args.shards, args.workers, args.pause, args.full,
+                             args.data_format, args.refresh_ids, args.export, args.credentials_path,
+                             args.base_url)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,23 +5,35 @@ Common data collection functions
 # standard library imports
 import csv
 import datetime as dt
+import email.utils
 import json
 import os
+import random
 import statistics
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 # third-party imports
 import numpy as np
 import pandas as pd
 import requests
+import requests.adapters
 import requests.auth
 
-def get_api_key():
+# project imports
+import cache
+import journal
+import metrics
+import ndjson
+
+def get_api_key(path='./data/_credentials/steam_key.txt'):
     """Return the Steam dev API key from _credentials
 
     Parameters
     ----------
-    none
+    path : path to the key file (default './data/_credentials/steam_key.txt')
 
     Returns
     -------
@@ -29,18 +41,19 @@ def get_api_key():
         String containing Steam dev API key. Empty if none parsed.
     """
     try:
-        with open('./data/_credentials/steam_key.txt') as f:
+        with open(path) as f:
             api_key = f.read()
-    except:
-        raise("Error getting API Key")
-    return api_key
+    except OSError:
+        print('Error getting API Key, requests are made without the key')
+        api_key = ''
+    return api_key.strip()
 
-def get_proxies():
+def get_proxies(path='./data/_credentials/proxies.txt'):
     """Return the dictionary of proxies from _credentials
 
     Parameters
     ----------
-    none
+    path : path to the proxies file (default './data/_credentials/proxies.txt')
 
     Returns
     -------
@@ -48,7 +61,7 @@ def get_proxies():
         dictionary of proxies. None if none parsed
     """
     try:
-        with open('./data/_credentials/proxies.txt', 'r') as f:
+        with open(path, 'r') as f:
             proxies = eval(f.read())
         if not isinstance(proxies, dict):
             proxies = None
@@ -59,7 +72,282 @@ def get_proxies():
 def get_download_path():
     return './scripts/temp/'
 
-def get_request(url, parameters=None, steamspy=False, proxies = None):
+"""
+Endpoints and rate limits
+"""
+
+# Endpoints used for the collection, matched by the url (without the scheme)
+ENDPOINTS = {
+    'appdetails': 'store.steampowered.com/api/appdetails',
+    'appreviews': 'store.steampowered.com/appreviews',
+    'steamspy': 'steamspy.com/api.php',
+    'applist': 'api.steampowered.com/IStoreService/GetAppList',
+}
+
+# Token bucket settings for each endpoint: (requests per second, burst size)
+RATE_LIMITS = {
+    # around 200 requests per 5 minutes per IP address
+    'appdetails': (200 / 300, 10),
+    'appreviews': (4, 10),
+    # SteamSpy allows 1 request per second, and 1 request per minute for request=all
+    'steamspy': (1, 1),
+    'steamspy_all': (1 / 60, 1),
+    'applist': (1, 5),
+}
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting the request rate to an endpoint.
+
+    Parameters
+    ----------
+    rate : float
+        tokens (requests) added per second
+    burst : int
+        maximum number of tokens stored in the bucket
+    """
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def get_endpoint(url, parameters=None):
+    """Return the endpoint name for the request, None if the url is unknown.
+
+    Parameters
+    ----------
+    url : string
+    parameters : {'parameter': 'value'}
+
+    Returns
+    -------
+    string
+        key of ENDPOINTS (or 'steamspy_all' for the paged SteamSpy listing)
+    """
+    parsed = urlparse(url)
+    location = parsed.netloc + parsed.path
+    for endpoint, prefix in ENDPOINTS.items():
+        if location.startswith(prefix):
+            if (endpoint == 'steamspy') and parameters and (parameters.get('request') == 'all'):
+                return 'steamspy_all'
+            return endpoint
+    return None
+
+
+def set_rate_limit(endpoint, rate, burst=1):
+    """Override the rate limit for the endpoint. rate=None disables limiting.
+
+    Parameters
+    ----------
+    endpoint : string
+    rate : float, requests per second
+    burst : int, maximum burst of requests
+    """
+    with _rate_limiters_lock:
+        RATE_LIMITS[endpoint] = None if rate is None else (rate, burst)
+        _rate_limiters.pop(endpoint, None)
+
+
+def get_rate_limiter(endpoint):
+    """Return the shared TokenBucket for the endpoint, None if it's not limited."""
+    if endpoint is None:
+        return None
+    with _rate_limiters_lock:
+        if endpoint not in _rate_limiters:
+            limit = RATE_LIMITS.get(endpoint)
+            _rate_limiters[endpoint] = TokenBucket(*limit) if limit else None
+        return _rate_limiters[endpoint]
+
+"""
+HTTP transport
+"""
+
+# Statuses that are worth retrying: rate limiting and temporary server errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Maximum number of keep-alive connections kept for each host
+POOL_SIZE = 16
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# Optional cache.ResponseCache used by get_request
+_response_cache = None
+
+# Optional 'scheme://host:port' all the requests are sent to instead of the Steam hosts
+_base_url = None
+
+
+class RequestError(Exception):
+    """Request failed after all retries.
+
+    Parameters
+    ----------
+    kind : string
+        error class: 'ssl', 'connection', 'timeout', 'rate_limit', 'server',
+        'client' or 'empty'
+    url : string
+    status_code : int, HTTP status if there was a response
+    message : string, error details
+    """
+    def __init__(self, kind, url, status_code=None, message=''):
+        self.kind = kind
+        self.url = url
+        self.status_code = status_code
+        self.message = message
+        status = ' (status {})'.format(status_code) if status_code else ''
+        super().__init__('{} error for {}{} {}'.format(kind, url, status, message).strip())
+
+
+def get_session(url, proxies=None):
+    """Return keep-alive session shared for the url host and proxies.
+
+    Parameters
+    ----------
+    url : string
+    proxies: {'protocol': 'connection_string'}
+
+    Returns
+    -------
+    requests.Session
+    """
+    key = (urlparse(url).netloc, tuple(sorted(proxies.items())) if proxies else None)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update({'Accept': 'application/json'})
+            if proxies:
+                session.proxies.update(proxies)
+            _sessions[key] = session
+    return session
+
+
+def set_base_url(base_url):
+    """Send all the requests to base_url (for example the local mockserver)
+    instead of the hosts from the urls. base_url=None restores the hosts.
+
+    Rate limits and the cache still use the original urls.
+
+    Parameters
+    ----------
+    base_url : 'scheme://host:port' string
+    """
+    global _base_url
+    _base_url = base_url.rstrip('/') if base_url else None
+
+
+def get_request_url(url):
+    """Return url with the host replaced by the base_url from set_base_url."""
+    if _base_url is None:
+        return url
+    parsed = urlparse(url)
+    return _base_url + url[len(parsed.scheme + '://' + parsed.netloc):]
+
+
+def set_response_cache(path, max_size=2 * 1024 ** 3, ttl=None):
+    """Enable on-disk cache of the responses for get_request. path=None disables it.
+
+    Parameters
+    ----------
+    path : path to the cache file
+
+    Keyword arguments
+    -----------------
+    max_size : maximum total size of the cache in bytes (default 2 GB)
+    ttl : {'endpoint': seconds} overrides for cache.CACHE_TTL
+
+    Returns
+    -------
+    cache.ResponseCache or None
+    """
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.close()
+    _response_cache = cache.ResponseCache(path, max_size, ttl) if path else None
+    return _response_cache
+
+
+def set_metrics_file(path, interval=10):
+    """Write the collection metrics in Prometheus text format to the file,
+    updated at most once per interval. path=None disables writing.
+
+    Parameters
+    ----------
+    path : path to the metrics file
+
+    Keyword arguments
+    -----------------
+    interval : minimum seconds between the file updates (default 10)
+
+    Returns
+    -------
+    metrics.Metrics
+    """
+    metrics.registry.path = path
+    metrics.registry.interval = interval
+    return metrics.registry
+
+
+def get_retry_delay(attempt, response=None, backoff=1, max_backoff=60, max_retry_after=300):
+    """Return seconds to wait before the next attempt.
+
+    Retry-After header of the response is honoured if present, up to
+    max_retry_after, otherwise exponential backoff with jitter is used.
+
+    Parameters
+    ----------
+    attempt : number of the failed attempt, starting from 0
+    response : requests.Response or None
+
+    Keyword arguments
+    -----------------
+    backoff : base delay in seconds (default 1)
+    max_backoff : maximum exponential delay in seconds (default 60)
+    max_retry_after : maximum Retry-After delay in seconds (default 300)
+
+    Returns
+    -------
+    float
+    """
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            try:
+                return min(max_retry_after, max(0.0, float(retry_after)))
+            except ValueError:
+                try:
+                    retry_date = email.utils.parsedate_to_datetime(retry_after)
+                    return min(max_retry_after, max(0.0, retry_date.timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+    delay = min(max_backoff, backoff * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def get_request(url, parameters=None, steamspy=False, proxies = None, max_retries = 5, timeout = 30):
     """Return json-formatted response of a get request using optional parameters.
     
     Parameters
@@ -71,114 +359,241 @@ def get_request(url, parameters=None, steamspy=False, proxies = None):
         request processing for SteamSpy
     proxies: {'protocol': 'connection_string'}
         dictionary conntaining proxies to be used with the request
+    max_retries : int
+        number of retries for the temporary errors (default 5)
+    timeout : float
+        connect/read timeout in seconds (default 30)
     
     Returns
     -------
     json_data
-        json-formatted response (dict-like)
+        json-formatted response (dict-like). 'stop' if SteamSpy has no more data
+
+    Raises
+    ------
+    RequestError
+        if the request failed after max_retries or can't be retried
     """
-    try:
-        headers = {'Accept': 'application/json'}
-        response = requests.get(url=url, params=parameters, headers = headers, proxies = proxies)
-    except requests.exceptions.SSLError as s:
-        print('SSL Error:', s)
-        
-        for i in range(5, 0, -1):
-            print('\rWaiting... ({})'.format(i), end='')
-            time.sleep(1)
-        print('\rRetrying.' + ' '*10)
-        
-        # recursively try again
-        return get_request(url, parameters, steamspy, proxies)
-    
-    if response:
-        return response.json()
-    else:
-        # We do not know how many pages steamspy has... and it seems to work well, so we will use no response to stop.
-        if steamspy:
-            return 'stop'
-        else :
-            # response is none usually means too many requests. Wait and try again 
-            print('No response, waiting 15 seconds...')
-            time.sleep(15)
-            print('Retrying.')
-            return get_request(url, parameters, steamspy) 
+    endpoint = get_endpoint(url, parameters)
+    endpoint_name = endpoint or 'other'
+    if _response_cache is not None:
+        json_data = _response_cache.get(endpoint, url, parameters)
+        if json_data is not None:
+            metrics.registry.inc('cache_hits_total', endpoint=endpoint_name)
+            return json_data
+
+    limiter = get_rate_limiter(endpoint)
+    request_url = get_request_url(url)
+    session = get_session(request_url, proxies)
+
+    for attempt in range(max_retries + 1):
+        # waiting for the endpoint rate limit, shared between all threads
+        if limiter:
+            wait_start = time.monotonic()
+            limiter.acquire()
+            metrics.registry.inc('rate_limit_wait_seconds_total', time.monotonic() - wait_start, endpoint=endpoint_name)
+
+        response = None
+        metrics.registry.inc('in_flight_requests')
+        request_start = time.monotonic()
+        try:
+            response = session.get(url=request_url, params=parameters, proxies=proxies, timeout=timeout)
+        except requests.exceptions.SSLError as s:
+            error = RequestError('ssl', url, message=str(s))
+        except requests.exceptions.Timeout as t:
+            error = RequestError('timeout', url, message=str(t))
+        except requests.exceptions.ConnectionError as c:
+            error = RequestError('connection', url, message=str(c))
+        except requests.exceptions.RequestException as r:
+            # broken or undecodable response bodies (ChunkedEncodingError, ContentDecodingError...)
+            error = RequestError('connection', url, message=str(r))
+        finally:
+            metrics.registry.inc('in_flight_requests', -1)
+            metrics.registry.observe_request(
+                endpoint_name, time.monotonic() - request_start,
+                response.status_code if response is not None else 'none',
+                len(response.content) if response is not None else 0)
+
+        if response is not None:
+            if response.ok:
+                try:
+                    json_data = response.json()
+                except ValueError:
+                    json_data = None
+                if json_data is not None:
+                    if _response_cache is not None:
+                        _response_cache.put(endpoint, url, parameters, json_data)
+                    return json_data
+                # Storefront returns 'null' when it's overloaded
+                if steamspy:
+                    return 'stop'
+                error = RequestError('empty', url, response.status_code)
+            elif response.status_code in RETRY_STATUSES:
+                kind = 'rate_limit' if response.status_code == 429 else 'server'
+                error = RequestError(kind, url, response.status_code)
+            elif steamspy:
+                # We do not know how many pages steamspy has... and it seems to work well, so we will use no response to stop.
+                return 'stop'
+            else:
+                metrics.registry.inc('errors_total', endpoint=endpoint_name, kind='client')
+                raise RequestError('client', url, response.status_code)
+
+        metrics.registry.inc('errors_total', endpoint=endpoint_name, kind=error.kind)
+        if attempt < max_retries:
+            metrics.registry.inc('retries_total', endpoint=endpoint_name)
+            delay = get_retry_delay(attempt, response)
+            print('{}, retrying in {:.1f} seconds...'.format(error, delay))
+            time.sleep(delay)
+
+    raise error
 
 """
-Indexes
+Data files and journal
 """
 
-def reset_index(download_path, index_filename):
+def prepare_data_file(download_path, filename, index, columns):
     """
-    Reset index in file to 0.
+    Create file and write headers if index is 0.
+
+    NDJSON files (.ndjson, .ndjson.gz, .ndjson.zst) are created empty.
 
     Parameters
     ----------
     download_path : string
-    index_filename : string
+    filename : string
+    index : 0 to wipe the file and write the headers
+    columns : column names for file
 
     Returns
     -------
     none
     """
-    rel_path = os.path.join(download_path, index_filename)
-    
-    f = open(rel_path, 'w')
-    f.write('0')
-        
+    if index == 0:
+        rel_path = os.path.join(download_path, filename)
+
+        if ndjson.is_ndjson(filename):
+            open(rel_path, 'wb').close()
+            return
+
+        with open(rel_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+
 
-def get_index(download_path, index_filename):
+def reset_journal(download_path, journal_filename):
     """
-    Retrieve index from file, returning 0 if file not found.
+    Clear the collection journal to start the download over.
 
     Parameters
     ----------
     download_path : string
-    index_filename : string
+    journal_filename : string
+
     Returns
     -------
-    integer
-        index written in the first line of the index_filename.
-        0 if error
+    none
     """
-    try:
-        rel_path = os.path.join(download_path, index_filename)
-        with open(rel_path, 'r') as f:
-            index = int(f.readline())
-            #This just reads the initial line
-    
-    except FileNotFoundError:
-        index = 0
-        
-    return index
+    collection_journal = journal.Journal(os.path.join(download_path, journal_filename))
+    collection_journal.reset()
+    collection_journal.close()
 
 
-def prepare_data_file(download_path, filename, index, columns):
+def append_data_file(download_path, filename, app_data, columns):
     """
-    Create file and write headers if index is 0.
+    Append rows to the data file and flush them to disk.
 
     Parameters
     ----------
     download_path : string
-    index_filename : string
+    filename : string, csv or NDJSON file
+    app_data : list of dict-like rows
+    columns : column names for file (ignored for NDJSON files)
 
     Returns
     -------
     none
     """
-    if index == 0:
-        rel_path = os.path.join(download_path, filename)
+    rel_path = os.path.join(download_path, filename)
 
-        with open(rel_path, 'w', newline='') as f:
-            writer = csv.DictWriter(f, fieldnames=columns)
-            writer.writeheader()
+    if ndjson.is_ndjson(filename):
+        ndjson.write_records(rel_path, app_data)
+        return
+
+    with open(rel_path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writerows(app_data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def append_download_log(download_path, log_time, summary=None):
+    """
+    Append the operation timestamps and the run summary to 'download_log.csv'.
+
+    Parameters
+    ----------
+    download_path : string
+    log_time : list of [operation, timestamp]
+
+    Keyword arguments
+    -----------------
+    summary : dict from metrics.Metrics.summary to add to the last row (default None)
+
+    Returns
+    -------
+    none
+    """
+    log_columns = ['operation', 'timestamp']
+    log_path = os.path.join(download_path, 'download_log.csv')
+    try:
+        log_df = pd.read_csv(log_path, header=0)
+    except FileNotFoundError:
+        log_df = pd.DataFrame(columns=log_columns)
+
+    new_rows = pd.DataFrame(columns=log_columns, data=log_time)
+    if summary:
+        for name, value in summary.items():
+            new_rows.loc[new_rows.index[-1], name] = value
+    log_df = pd.concat([log_df, new_rows], ignore_index=True)
+    log_df.to_csv(log_path, index=False)
 
 
 """
 App Data
 """
+def get_row_data(row, parser, download_appid=False, last_modified=False):
+    """Return app data for a single app_list row generated from parser.
+
+    Parameters
+    ----------
+    row : app_list row with download_appid (and last_modified)
+    parser : custom function to format request
+
+    Keyword arguments
+    -----------------
+    download_appid : add id from app_list for the downloaded app
+    last_modified : add last_modified for the downloaded app
+
+    Returns
+    -------
+    (data, error) :
+        dict with application data and None, or None and the error class on errors
+    """
+    try:
+        data = parser(row['download_appid'])
+    except Exception as ex:
+        print('\nError getting data for {} with exception {}\n'.format(row['download_appid'], type(ex).__name__))
+        return None, getattr(ex, 'kind', type(ex).__name__)
+    if download_appid:
+        data['download_appid'] = row['download_appid']
+    if last_modified:
+        data['last_modified'] = row['last_modified']
+    return data, None
+
+
 def get_app_data(app_list, start, stop, parser, pause, errors_list,
-                 download_appid = False, last_modified = False):
+                 download_appid = False, last_modified = False, workers = 1,
+                 done_list = None, collection_journal = None):
     """Return list of app data generated from parser.
     
     Parameters
@@ -194,39 +609,61 @@ def get_app_data(app_list, start, stop, parser, pause, errors_list,
     -----------------
     download_appid : add id from app_list for the downloaded app
     last_modified : add last_modified for the downloaded app
+    workers : number of requests kept in flight. With more than one worker
+        pause is not used and the request rate is limited by RATE_LIMITS
+    done_list : list to store appids collected successfully
+    collection_journal : journal.Journal to record the errors in
     
     Returns
     -------
     list with application data
     """
-    app_data = []
-    # iterate through each row of app_list, confined by start and stop
-    for index, row in app_list[start:stop].iterrows():
-        print('Current index: {}'.format(index), end='\r')
+    rows = [row for _, row in app_list[start:stop].iterrows()]
 
-        # retrive app data for a row, handled by supplied parser, and append to list
-        try:
-            data = parser(row['download_appid'])
-        except Exception as ex:
-            errors_list.append(row['download_appid'])
-            print('\nError getting data for {} with exception {}\n'.format(row['download_appid'], type(ex).__name__))
-        if download_appid:
-            data['download_appid'] = row['download_appid']
-        if last_modified:
-            data['last_modified'] = row['last_modified']
-        app_data.append(data)
-
-        time.sleep(pause) # prevent overloading api with requests
+    if workers > 1:
+        # parsers are called concurrently, get_request keeps each endpoint within its rate limit
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                lambda row: get_row_data(row, parser, download_appid, last_modified), rows))
+    else:
+        results = []
+        # iterate through each row of app_list, confined by start and stop
+        for index, row in zip(range(start, stop), rows):
+            print('Current index: {}'.format(index), end='\r')
+
+            # retrive app data for a row, handled by supplied parser
+            results.append(get_row_data(row, parser, download_appid, last_modified))
+
+            time.sleep(pause) # prevent overloading api with requests
+            metrics.registry.inc('pause_seconds_total', pause)
+
+    app_data = []
+    for row, (data, error) in zip(rows, results):
+        appid = row['download_appid']
+        if error is None:
+            app_data.append(data)
+            if done_list is not None:
+                done_list.append(appid)
+        else:
+            errors_list.append(appid)
+            if collection_journal is not None:
+                collection_journal.mark_error(appid, error)
 
     return app_data
 
 
-def process_batches(parser, app_list, download_path, data_filename, index_filename,
+def process_batches(parser, app_list, download_path, data_filename, journal_filename,
                     errors_list, columns,
-                    begin=0, end=-1, batchsize=100, pause=1,
-                    download_appid = False, last_modified = False):
+                    batchsize=100, pause=1,
+                    download_appid = False, last_modified = False, workers = 1,
+                    reset = False, max_attempts = None, requeue = False):
     """Process app data in batches, writing directly to file.
-    
+
+    Progress is recorded for each appid in the journal, so a restarted
+    download continues with exactly the apps that were not written yet.
+
+    If data_filename is an NDJSON file (.ndjson, .ndjson.gz, .ndjson.zst),
+    the whole responses are written as json lines instead of the csv columns.
     
     Parameters
     ----------
@@ -234,31 +671,44 @@ def process_batches(parser, app_list, download_path, data_filename, index_filena
     app_list : dataframe of appid and name
     download_path : path to store data
     data_filename : filename to save app data
-    index_filename : filename to store highest index written
+    journal_filename : filename of the collection journal
     errors_list : list to store appid errors
-    columns : column names for file
+    columns : column names for file (ignored for NDJSON files)
     
     Keyword arguments
     -----------------
-    begin : starting index (get from index_filename, default 0)
-    end : index to finish (defaults to end of app_list)
     batchsize : number of apps to write in each batch (default 100)
     pause : time to wait after each api request (defualt 1)
     download_appid : add id from app_list for the downloaded app
     last_modified : add last_modified for the downloaded app
+    workers : number of concurrent requests (default 1, serial with pause)
+    reset : clear the journal and download all apps in app_list (default False)
+    max_attempts : skip apps that failed this many times (default None, retry all)
+    requeue : download the apps in app_list again even if they are done in the
+        journal, keeping the records of the other apps (default False)
     
     Returns
     -------
     none
     """
-    print('Starting at index {}:\n'.format(begin))
-    
-    # by default, process all apps in app_list
-    if end == -1:
-        end = len(app_list) + 1
+    collection_journal = journal.Journal(os.path.join(download_path, journal_filename))
+    if reset:
+        collection_journal.reset()
+
+    # registering the apps and keeping only the unfinished ones
+    if requeue:
+        collection_journal.requeue(app_list['download_appid'])
+    else:
+        collection_journal.add(app_list['download_appid'])
+    pending_ids = collection_journal.pending(max_attempts)
+    app_list = app_list[app_list['download_appid'].isin(pending_ids)]
+
+    print('Starting with {} pending apps:\n'.format(len(app_list)))
+    metrics.registry.set('queue_depth', len(app_list))
     
     # generate array of batch begin and end points
-    batches = np.arange(begin, end, batchsize)
+    end = len(app_list)
+    batches = np.arange(0, end, batchsize)
     batches = np.append(batches, end)
     
     apps_written = 0
@@ -270,29 +720,21 @@ def process_batches(parser, app_list, download_path, data_filename, index_filena
         start = batches[i]
         stop = batches[i+1]
         
-        app_data = get_app_data(app_list, start, stop, parser, pause, errors_list, download_appid, last_modified)
-        
-        rel_path = os.path.join(download_path, data_filename)
+        done_ids = []
+        app_data = get_app_data(app_list, start, stop, parser, pause, errors_list,
+                                download_appid, last_modified, workers,
+                                done_ids, collection_journal)
         
-        # writing app data to file
-        with open(rel_path, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
-            
-            for j in range(3,0,-1):
-                print("\rAbout to write data, don't stop script! ({})".format(j), end='')
-                time.sleep(0.5)
-            
-            writer.writerows(app_data)
-            print('\rExported lines {}-{} to {}.'.format(start, stop-1, data_filename), end=' ')
+        # writing app data to file, then marking the apps as done in the journal
+        append_data_file(download_path, data_filename, app_data, columns)
+        collection_journal.mark_done(done_ids, data_filename)
+        metrics.registry.inc('apps_total', len(done_ids), status='done')
+        metrics.registry.inc('apps_total', (stop - start) - len(done_ids), status='error')
+        metrics.registry.set('queue_depth', end - stop)
+        metrics.registry.write()
+        print('\rExported lines {}-{} to {}.'.format(start, stop-1, data_filename), end=' ')
             
         apps_written += len(app_data)
-        
-        idx_path = os.path.join(download_path, index_filename)
-        
-        # writing last index to file
-        with open(idx_path, 'w') as f:
-            index = stop
-            print(index, file=f)
             
         # logging time taken
         end_time = time.time()
@@ -308,5 +750,7 @@ def process_batches(parser, app_list, download_path, data_filename, index_filena
         mean_td = dt.timedelta(seconds=round(mean_time))
         
         print('Batch {} time: {} (avg: {}, remaining: {})'.format(i, time_td, mean_td, remaining_td))
-            
+
+    collection_journal.close()
+    metrics.registry.write(force=True)
     print('\nProcessing batches complete. {} apps written'.format(apps_written))
\ No newline at end of file
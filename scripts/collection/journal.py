@@ -0,0 +1,136 @@
+"""
+Per-appid collection journal
+"""
+
+# standard library imports
+import os
+import sqlite3
+import threading
+import time
+
+# Journal statuses
+PENDING = 'pending'
+DONE = 'done'
+ERROR = 'error'
+
+
+class Journal:
+    """
+    Transactional record of the collection progress for each appid, kept in
+    SQLite (WAL mode) so that an interrupted download resumes exactly at the
+    unfinished appids, whatever order they were completed in.
+
+    Parameters
+    ----------
+    path : path to the journal file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS journal (
+                appid INTEGER PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error_class TEXT,
+                payload_ref TEXT,
+                updated REAL
+            )''')
+        self.connection.commit()
+
+    def add(self, appids):
+        """
+        Register appids as pending, keeping the ones already in the journal.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO journal (appid, status, updated) VALUES (?, ?, ?)',
+                ((int(appid), PENDING, now) for appid in appids))
+
+    def requeue(self, appids):
+        """
+        Mark appids as pending to collect them again, registering the new ones.
+        The attempts of the failed appids are kept.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR IGNORE INTO journal (appid, status, updated) VALUES (?, ?, ?)',
+                ((int(appid), PENDING, now) for appid in appids))
+            self.connection.executemany(
+                'UPDATE journal SET status = ?, updated = ? WHERE appid = ?',
+                ((PENDING, now, int(appid)) for appid in appids))
+
+    def reset(self):
+        """
+        Remove all the records to start the collection over.
+        """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM journal')
+
+    def pending(self, max_attempts=None):
+        """
+        Return the list of unfinished appids.
+
+        Parameters
+        ----------
+        max_attempts : skip appids that already failed this many times (default None, no limit)
+        """
+        query = 'SELECT appid FROM journal WHERE status != ?'
+        parameters = [DONE]
+        if max_attempts is not None:
+            query += ' AND attempts < ?'
+            parameters.append(max_attempts)
+        with self.lock:
+            return [row[0] for row in self.connection.execute(query + ' ORDER BY appid', parameters)]
+
+    def mark_done(self, appids, payload_ref):
+        """
+        Mark appids as collected, with the reference to where their data was written.
+        """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                '''UPDATE journal
+                   SET status = ?, attempts = attempts + 1, error_class = NULL, payload_ref = ?, updated = ?
+                   WHERE appid = ?''',
+                ((DONE, payload_ref, now, int(appid)) for appid in appids))
+
+    def mark_error(self, appid, error_class):
+        """
+        Record a failed attempt for the appid.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                '''UPDATE journal
+                   SET status = ?, attempts = attempts + 1, error_class = ?, updated = ?
+                   WHERE appid = ?''',
+                (ERROR, error_class, time.time(), int(appid)))
+
+    def counts(self):
+        """
+        Return the number of appids for each status.
+        """
+        with self.lock:
+            return dict(self.connection.execute('SELECT status, COUNT(*) FROM journal GROUP BY status'))
+
+    def errors(self):
+        """
+        Return list of (appid, error_class, attempts) for the failed appids.
+        """
+        with self.lock:
+            return self.connection.execute(
+                'SELECT appid, error_class, attempts FROM journal WHERE status = ? ORDER BY appid',
+                (ERROR,)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,229 @@
+"""
+Collection metrics in Prometheus text format
+"""
+
+# standard library imports
+import bisect
+import os
+import threading
+import time
+
+# Upper bounds of the request latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Prefix of the exported metric names
+PREFIX = 'steam_collection'
+
+# Help strings and types of the exported metrics
+METRICS = {
+    'requests_total': ('counter', 'HTTP requests by endpoint and status'),
+    'request_duration_seconds': ('histogram', 'HTTP request latency by endpoint'),
+    'errors_total': ('counter', 'Failed request attempts by endpoint and error class'),
+    'retries_total': ('counter', 'Retried request attempts by endpoint'),
+    'response_bytes_total': ('counter', 'Response body bytes received by endpoint'),
+    'cache_hits_total': ('counter', 'Responses served from the cache by endpoint'),
+    'rate_limit_wait_seconds_total': ('counter', 'Time spent waiting for the endpoint rate limit'),
+    'pause_seconds_total': ('counter', 'Time spent in the pauses between requests'),
+    'apps_total': ('counter', 'Collected apps by status'),
+    'in_flight_requests': ('gauge', 'Requests currently in flight'),
+    'queue_depth': ('gauge', 'Apps left in the collection queue'),
+}
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, value) for name, value in labels) + '}'
+
+
+class Histogram:
+    """
+    Cumulative latency histogram with fixed buckets.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Return the quantile estimated as the upper bound of its bucket, None if empty.
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+class Metrics:
+    """
+    Thread-safe registry of the collection counters, gauges and latency
+    histograms, labelled by endpoint.
+
+    Keyword arguments
+    -----------------
+    path : file to write the metrics to (default None, not written)
+    interval : minimum seconds between the metrics file updates (default 10)
+    """
+    def __init__(self, path=None, interval=10):
+        self.path = path
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all the metrics and restart the run timer.
+        """
+        with self.lock:
+            self.values = {}
+            self.histograms = {}
+            self.started = time.time()
+            self.written = 0
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase the counter by value.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Set the gauge value.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Add the value to the histogram.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    def observe_request(self, endpoint, duration, status, size=0):
+        """
+        Record a completed HTTP request.
+
+        Parameters
+        ----------
+        endpoint : endpoint name from common.ENDPOINTS
+        duration : request latency in seconds
+        status : HTTP status code or error class if there was no response
+        size : response body size in bytes
+        """
+        endpoint = endpoint or 'other'
+        self.observe('request_duration_seconds', duration, endpoint=endpoint)
+        self.inc('requests_total', endpoint=endpoint, status=status)
+        if size:
+            self.inc('response_bytes_total', size, endpoint=endpoint)
+
+    def total(self, name, **labels):
+        """
+        Return the sum of the metric values matching the labels.
+        """
+        with self.lock:
+            return sum(value for (key, key_labels), value in self.values.items()
+                       if (key == name) and set(labels.items()) <= set(key_labels))
+
+    def to_prometheus(self):
+        """
+        Return the metrics in Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            for name, (kind, description) in METRICS.items():
+                full_name = '{}_{}'.format(PREFIX, name)
+                if kind == 'histogram':
+                    series = [(labels, histogram) for (key, labels), histogram in self.histograms.items()
+                              if key == name]
+                else:
+                    series = [(labels, value) for (key, labels), value in self.values.items()
+                              if key == name]
+                if not series:
+                    continue
+                # label values can be both status codes and strings
+                series.sort(key=lambda item: str(item[0]))
+                lines.append('# HELP {} {}'.format(full_name, description))
+                lines.append('# TYPE {} {}'.format(full_name, kind))
+                for labels, value in series:
+                    if kind != 'histogram':
+                        lines.append('{}{} {}'.format(full_name, _format_labels(labels), value))
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + ('+Inf',), value.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(
+                            full_name, _format_labels(labels + (('le', bound),)), cumulative))
+                    lines.append('{}_sum{} {}'.format(full_name, _format_labels(labels), value.sum))
+                    lines.append('{}_count{} {}'.format(full_name, _format_labels(labels), value.count))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, force=False):
+        """
+        Replace the metrics file with the current values, at most once per interval
+        unless forced.
+        """
+        if self.path is None:
+            return
+        now = time.time()
+        if (not force) and (now - self.written < self.interval):
+            return
+        self.written = now
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, self.path)
+
+    def summary(self):
+        """
+        Return dict with the run summary: duration, requests and apps counts,
+        request rate, errors by class, retries, received bytes and p50/p95
+        latency for each endpoint.
+        """
+        duration = time.time() - self.started
+        requests_count = self.total('requests_total')
+        summary = {
+            'duration': round(duration, 1),
+            'requests': requests_count,
+            'requests_per_second': round(requests_count / duration, 3) if duration > 0 else 0,
+            'apps_done': self.total('apps_total', status='done'),
+            'apps_failed': self.total('apps_total', status='error'),
+            'retries': self.total('retries_total'),
+            'cache_hits': self.total('cache_hits_total'),
+            'response_bytes': self.total('response_bytes_total'),
+            'rate_limit_wait': round(self.total('rate_limit_wait_seconds_total'), 1),
+            'pause': round(self.total('pause_seconds_total'), 1),
+        }
+        with self.lock:
+            error_kinds = sorted({dict(labels)['kind'] for (key, labels) in self.values if key == 'errors_total'})
+            histograms = sorted(((dict(labels)['endpoint'], histogram) for (key, labels), histogram
+                                 in self.histograms.items() if key == 'request_duration_seconds'),
+                                key=lambda item: item[0])
+        for kind in error_kinds:
+            summary['errors_' + kind] = self.total('errors_total', kind=kind)
+        for endpoint, histogram in histograms:
+            summary[endpoint + '_latency_p50'] = histogram.quantile(0.5)
+            summary[endpoint + '_latency_p95'] = histogram.quantile(0.95)
+        return summary
+
+
+# Registry used by common.get_request and common.process_batches
+registry = Metrics()
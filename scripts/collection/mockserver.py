@@ -0,0 +1,290 @@
+"""
+Local stand-in for the Steam and SteamSpy APIs replaying recorded responses
+"""
+
+# standard library imports
+import json
+import os
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# project imports
+import common
+
+# Fixture files in the fixtures directory, one for each endpoint
+FIXTURES = {
+    'appdetails': 'appdetails.json',
+    'appreviews': 'appreviews.json',
+    'steamspy': 'steamspy.json',
+    'applist': 'applist.json',
+}
+
+# Apps in a page of the SteamSpy 'all' listing
+STEAMSPY_PAGE_SIZE = 1000
+
+GENRES = ['Action', 'Adventure', 'Casual', 'Indie', 'RPG', 'Simulation', 'Strategy']
+CATEGORIES = ['Single-player', 'Multi-player', 'Steam Achievements', 'Steam Cloud', 'Full controller support']
+
+
+def load_fixtures(fixtures_path):
+    """
+    Return {'endpoint': {appid: response}} from the fixtures directory.
+    Missing fixture files give empty dicts.
+    """
+    fixtures = {}
+    for endpoint, filename in FIXTURES.items():
+        try:
+            with open(os.path.join(fixtures_path, filename), encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        fixtures[endpoint] = {int(appid): value for appid, value in data.items()}
+    return fixtures
+
+
+def record_fixtures(fixtures_path, appids, verbose=False):
+    """
+    Record live responses of all the endpoints for the appids to the fixtures directory.
+
+    Parameters
+    ----------
+    fixtures_path : directory to write the fixture files to
+    appids : list of application IDs
+
+    Keyword arguments
+    -----------------
+    verbose : print progress, default to False
+    """
+    urls = {
+        'appdetails': ('http://store.steampowered.com/api/appdetails/', lambda appid: {'appids': appid}),
+        'appreviews': ('https://store.steampowered.com/appreviews/{}',
+                       lambda appid: {'json': 1, 'num_per_page': '0', 'language': 'all', 'purchase_type': 'all'}),
+        'steamspy': ('https://steamspy.com/api.php', lambda appid: {'request': 'appdetails', 'appid': appid}),
+    }
+    os.makedirs(fixtures_path, exist_ok=True)
+    fixtures = load_fixtures(fixtures_path)
+    for appid in appids:
+        appid = int(appid)
+        for endpoint, (url, get_parameters) in urls.items():
+            try:
+                fixtures[endpoint][appid] = common.get_request(url.format(appid), parameters=get_parameters(appid))
+            except common.RequestError as e:
+                print(e)
+        fixtures['applist'][appid] = {'appid': appid, 'last_modified': int(time.time()), 'price_change_number': 0}
+        if verbose:
+            print(f'Recorded {appid}')
+    for endpoint, filename in FIXTURES.items():
+        with open(os.path.join(fixtures_path, filename), 'w', encoding='utf-8') as f:
+            json.dump({str(appid): value for appid, value in sorted(fixtures[endpoint].items())}, f)
+
+
+def generate_appdetails(appid):
+    """
+    Return synthetic Storefront appdetails response for the appid.
+    """
+    rng = random.Random(appid)
+    price = rng.choice([0, 199, 499, 999, 1999, 5999])
+    description = ' '.join(rng.choice(['game', 'world', 'play', 'story', 'enemy', 'level', 'quest'])
+                           for _ in range(rng.randint(50, 400)))
+    data = {
+        'type': rng.choice(['game', 'game', 'dlc', 'demo']),
+        'name': f'App {appid}',
+        'steam_appid': appid,
+        'required_age': rng.choice([0, 0, 0, 16, 18]),
+        'is_free': price == 0,
+        'detailed_description': description,
+        'about_the_game': description,
+        'short_description': description[:200],
+        'supported_languages': 'English<strong>*</strong>, French, German',
+        'header_image': f'https://cdn.akamai.steamstatic.com/steam/apps/{appid}/header.jpg',
+        'developers': [f'Developer {appid % 97}'],
+        'publishers': [f'Publisher {appid % 53}'],
+        'platforms': {'windows': True, 'mac': rng.random() < 0.3, 'linux': rng.random() < 0.2},
+        'categories': [{'id': i, 'description': name} for i, name in enumerate(CATEGORIES) if rng.random() < 0.4],
+        'genres': [{'id': str(i), 'description': name} for i, name in enumerate(GENRES) if rng.random() < 0.3],
+        'release_date': {'coming_soon': False, 'date': '{} {}, {}'.format(
+            rng.randint(1, 28), rng.choice(['Jan', 'Mar', 'Jun', 'Oct']), rng.randint(2005, 2021))},
+        'recommendations': {'total': rng.randint(0, 100000)},
+    }
+    if price:
+        data['price_overview'] = {'currency': 'EUR', 'initial': price, 'final': price, 'discount_percent': 0}
+    return {str(appid): {'success': True, 'data': data}}
+
+
+def generate_appreviews(appid):
+    """
+    Return synthetic appreviews response for the appid.
+    """
+    rng = random.Random(appid)
+    positive, negative = rng.randint(0, 50000), rng.randint(0, 10000)
+    return {'success': 1, 'query_summary': {
+        'num_reviews': 0, 'review_score': rng.randint(0, 9), 'review_score_desc': 'Mixed',
+        'total_positive': positive, 'total_negative': negative, 'total_reviews': positive + negative}}
+
+
+def generate_steamspy(appid, details=True):
+    """
+    Return synthetic SteamSpy app data, with languages, genre and tags if details.
+    """
+    rng = random.Random(appid)
+    data = {
+        'appid': appid, 'name': f'App {appid}', 'developer': f'Developer {appid % 97}',
+        'publisher': f'Publisher {appid % 53}', 'score_rank': '', 'positive': rng.randint(0, 50000),
+        'negative': rng.randint(0, 10000), 'userscore': 0, 'owners': '20,000 .. 50,000',
+        'average_forever': rng.randint(0, 3000), 'average_2weeks': 0, 'median_forever': rng.randint(0, 3000),
+        'median_2weeks': 0, 'price': '999', 'initialprice': '999', 'discount': '0', 'ccu': rng.randint(0, 500),
+    }
+    if details:
+        data.update({'languages': 'English, French, German', 'genre': rng.choice(GENRES),
+                     'tags': {rng.choice(GENRES): rng.randint(1, 500) for _ in range(5)}})
+    return data
+
+
+class MockSteamServer:
+    """
+    Threaded HTTP server answering the Storefront appdetails, appreviews,
+    SteamSpy and IStoreService GetAppList requests from the fixtures,
+    with synthetic responses for the appids that were not recorded.
+
+    Use common.set_base_url(server.url) to send the collection requests to it.
+
+    Keyword arguments
+    -----------------
+    fixtures_path : directory with the recorded fixtures (default None, synthetic only)
+    app_count : number of apps in the synthetic app list (default 1000)
+    latency : seconds added to every response, or (min, max) for a uniform random latency (default 0)
+    rate_limit_rate : share of the requests answered with 429 (default 0)
+    error_rate : share of the requests answered with 500 (default 0)
+    retry_after : Retry-After header of the 429 responses in seconds (default 0)
+    seed : random seed of the injected errors (default None)
+    """
+    def __init__(self, fixtures_path=None, app_count=1000, latency=0, rate_limit_rate=0, error_rate=0,
+                 retry_after=0, seed=None):
+        self.fixtures = load_fixtures(fixtures_path) if fixtures_path else {endpoint: {} for endpoint in FIXTURES}
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.requests = 0
+
+        apps = dict(self.fixtures['applist'])
+        for appid in range(10, 10 * (app_count - len(apps)) + 10, 10):
+            apps.setdefault(appid, {'appid': appid, 'last_modified': 1600000000 + appid, 'price_change_number': appid})
+        self.apps = [apps[appid] for appid in sorted(apps)]
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+    def start(self):
+        """
+        Start serving in a background thread, return the server url.
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def get_status(self):
+        """
+        Return the injected error status for the next request, None to answer normally.
+        """
+        with self.random_lock:
+            self.requests += 1
+            value = self.random.random()
+            latency = self.random.uniform(*self.latency) if isinstance(self.latency, tuple) else self.latency
+        if latency:
+            time.sleep(latency)
+        if value < self.rate_limit_rate:
+            return 429
+        if value < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def get_response(self, path, parameters):
+        """
+        Return json response for the request path and parameters, None if not found.
+        """
+        parameter = lambda name, default=None: parameters.get(name, [default])[0]
+        if path.startswith('/api/appdetails'):
+            appid = int(parameter('appids'))
+            response = self.fixtures['appdetails'].get(appid) or generate_appdetails(appid)
+            if parameter('filters') == 'price_overview':
+                data = response[str(appid)].get('data') or {}
+                price = {'price_overview': data['price_overview']} if 'price_overview' in data else []
+                response = {str(appid): {'success': response[str(appid)]['success'], 'data': price}}
+            return response
+        if path.startswith('/appreviews/'):
+            appid = int(path.rstrip('/').rsplit('/', 1)[1])
+            return self.fixtures['appreviews'].get(appid) or generate_appreviews(appid)
+        if path.startswith('/api.php'):
+            if parameter('request') == 'all':
+                page = int(parameter('page', 0))
+                apps = self.apps[page * STEAMSPY_PAGE_SIZE:(page + 1) * STEAMSPY_PAGE_SIZE]
+                return {str(app['appid']): generate_steamspy(app['appid'], details=False) for app in apps}
+            appid = int(parameter('appid'))
+            return self.fixtures['steamspy'].get(appid) or generate_steamspy(appid)
+        if path.startswith('/IStoreService/GetAppList'):
+            max_results = int(parameter('max_results', 10000))
+            last_appid = int(parameter('last_appid', 0) or 0)
+            apps = [app for app in self.apps if app['appid'] > last_appid][:max_results + 1]
+            response = {'apps': apps[:max_results]}
+            if len(apps) > max_results:
+                response.update({'have_more_results': True, 'last_appid': apps[max_results - 1]['appid']})
+            return {'response': response}
+        return None
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # headers and body are written separately, avoiding the delayed ACK stalls on keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_GET(self):
+                status = mock.get_status()
+                body = b''
+                if status is None:
+                    parsed = urlparse(self.path)
+                    response = mock.get_response(parsed.path, parse_qs(parsed.query))
+                    if response is None:
+                        status = 404
+                    else:
+                        status = 200
+                        body = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', str(mock.retry_after))
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
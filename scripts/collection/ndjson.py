@@ -0,0 +1,212 @@
+"""
+Compressed NDJSON storage for the raw API responses
+"""
+
+# standard library imports
+import gzip
+import io
+import json
+import os
+
+# third-party imports
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File extensions of the NDJSON files, with the compression
+EXTENSIONS = ('.ndjson', '.ndjson.gz', '.ndjson.zst')
+
+# Compression levels used for writing
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def is_ndjson(filename):
+    """
+    Return True if the filename is an (optionally compressed) NDJSON file.
+    """
+    return str(filename).endswith(EXTENSIONS)
+
+
+def get_compression(filename):
+    """
+    Return compression of the NDJSON file from its extension: 'zstd', 'gzip' or None.
+    """
+    filename = str(filename)
+    if filename.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError('zstandard package is required for .ndjson.zst files, use .ndjson.gz instead')
+        return 'zstd'
+    if filename.endswith('.gz'):
+        return 'gzip'
+    return None
+
+
+def encode_records(records):
+    """
+    Return records serialized as NDJSON bytes, one json object per line.
+    """
+    return b''.join(
+        json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8') + b'\n'
+        for record in records
+    )
+
+
+def json_default(value):
+    """
+    json.dumps default for the numpy scalars from the app lists (download_appid, last_modified).
+    """
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def write_records(path, records, mode='a'):
+    """
+    Write records to the NDJSON file.
+
+    Each call is written as a separate gzip member / zstd frame, so appending
+    batches keeps the file readable as a single stream.
+
+    Parameters
+    ----------
+    path : path to the NDJSON file
+    records : iterable of dict-like records
+
+    Keyword arguments
+    -----------------
+    mode : 'a' to append (default), 'w' to overwrite
+
+    Returns
+    -------
+    int :
+        number of bytes written
+    """
+    data = encode_records(records)
+    compression = get_compression(path)
+    if data:
+        if compression == 'gzip':
+            data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        elif compression == 'zstd':
+            data = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+    with open(path, mode + 'b') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return len(data)
+
+
+def open_ndjson(path):
+    """
+    Return text stream reading the (decompressed) NDJSON file.
+    """
+    compression = get_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if compression == 'zstd':
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(stream, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_records(path):
+    """
+    Generate records from the NDJSON file, skipping empty lines.
+    """
+    with open_ndjson(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def records_to_frame(records, columns=None, dtype=None):
+    """
+    Return dataframe from records, nested objects are kept as dicts and lists.
+
+    Parameters
+    ----------
+    records : list of dict-like records
+
+    Keyword arguments
+    -----------------
+    columns : columns to keep (default None, all keys)
+    dtype : dtype or {'column': dtype} to cast the columns to
+    """
+    df = pd.DataFrame.from_records(records, columns=columns)
+    if dtype is not None:
+        if isinstance(dtype, dict):
+            dtype = {column: value for column, value in dtype.items() if column in df.columns}
+        df = df.astype(dtype)
+    return df
+
+
+def _read_chunks(path, chunksize, columns, dtype):
+    chunk = []
+    for record in iter_records(path):
+        chunk.append(record)
+        if len(chunk) == chunksize:
+            yield records_to_frame(chunk, columns, dtype)
+            chunk = []
+    if chunk:
+        yield records_to_frame(chunk, columns, dtype)
+
+
+def read_ndjson(path, columns=None, dtype=None, chunksize=None):
+    """
+    Read NDJSON file to a dataframe.
+
+    Parameters
+    ----------
+    path : path to the NDJSON file
+
+    Keyword arguments
+    -----------------
+    columns : columns to keep (default None, all keys)
+    dtype : dtype or {'column': dtype} to cast the columns to
+    chunksize : return iterator of dataframes with chunksize rows each (default None, single dataframe)
+
+    Returns
+    -------
+    dataframe or iterator of dataframes
+    """
+    if chunksize is not None:
+        return _read_chunks(path, chunksize, columns, dtype)
+    return records_to_frame(list(iter_records(path)), columns, dtype)
+
+
+def write_ndjson(df, path, mode='w'):
+    """
+    Write dataframe to the NDJSON file, one row per line. Missing values are
+    written as nulls.
+
+    Parameters
+    ----------
+    df : dataframe
+    path : path to the NDJSON file
+
+    Keyword arguments
+    -----------------
+    mode : 'w' to overwrite (default), 'a' to append
+    """
+    df = df.astype(object).where(df.notna(), None)
+    return write_records(path, df.to_dict('records'), mode=mode)
+
+
+def append_file(source_path, target_path):
+    """
+    Append contents of one NDJSON file to another with the same compression.
+    """
+    if get_compression(source_path) != get_compression(target_path):
+        raise ValueError('Cannot append {} to {}: different compression'.format(source_path, target_path))
+    with open(source_path, 'rb') as source, open(target_path, 'ab') as target:
+        while True:
+            block = source.read(1024 * 1024)
+            if not block:
+                break
+            target.write(block)
+        target.flush()
+        os.fsync(target.fileno())
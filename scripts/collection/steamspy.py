@@ -0,0 +1,234 @@
+"""
+Functions to get the Application data from SteamSpy
+"""
+
+# standard library imports
+import os
+import time
+
+# third-party imports
+import pandas as pd
+
+# project imports
+import common
+import journal
+import ndjson
+
+proxies = common.get_proxies()
+
+STEAMSPY_URL = 'https://steamspy.com/api.php'
+
+steamspy_columns = [
+    'appid', 'name', 'developer', 'publisher', 'score_rank', 'positive',
+    'negative', 'userscore', 'owners', 'average_forever', 'average_2weeks',
+    'median_forever', 'median_2weeks', 'price', 'initialprice', 'discount',
+    'languages', 'genre', 'ccu', 'tags'
+]
+
+# Columns that are not a part of the paged 'all' listing, only in appdetails
+DETAILS_COLUMNS = ['languages', 'genre', 'tags']
+
+
+def parse_steamspy_request(appid):
+    """
+    Parser to handle SteamSpy API appdetails data.
+
+    Parameters
+    ----------
+    appid : application ID
+
+    Returns
+    -------
+    json formatted data (dict-like)
+    """
+    parameters = {'request': 'appdetails', 'appid': appid}
+
+    json_data = common.get_request(STEAMSPY_URL, parameters=parameters, proxies=proxies)
+    return json_data
+
+
+def get_steamspy_page(page):
+    """
+    Get a page of the SteamSpy 'all' listing (1000 apps per page).
+
+    Parameters
+    ----------
+    page : page number, starting from 0
+
+    Returns
+    -------
+    list of app data dicts, None if there are no more pages
+    """
+    parameters = {'request': 'all', 'page': page}
+
+    json_data = common.get_request(STEAMSPY_URL, parameters=parameters, steamspy=True, proxies=proxies)
+    if (json_data == 'stop') or (not json_data):
+        return None
+    return list(json_data.values())
+
+
+def download_steamspy_pages(download_path, data_filename, max_pages=None, verbose=False):
+    """
+    Stream the paged SteamSpy 'all' listing to the data file.
+
+    Pages are requested until SteamSpy returns no data. The listing has no
+    languages, genre and tags, these columns are left empty.
+
+    Parameters
+    ----------
+    download_path : the path where the data is downloaded to
+    data_filename : csv or NDJSON file to append the apps to
+
+    Keyword arguments
+    -----------------
+    max_pages : maximum number of pages to request (default None, all pages)
+    verbose : print progress for each page, default to False
+
+    Returns
+    -------
+    set of downloaded appids
+    """
+    appids = set()
+    page = 0
+    while (max_pages is None) or (page < max_pages):
+        app_data = get_steamspy_page(page)
+        if app_data is None:
+            break
+        common.append_data_file(download_path, data_filename, app_data, steamspy_columns)
+        appids.update(int(app['appid']) for app in app_data)
+        if verbose:
+            print(f'Page {page}: {len(app_data)} apps, {len(appids)} total')
+        page += 1
+
+    print(f'SteamSpy listing complete: {page} pages, {len(appids)} apps\n')
+    return appids
+
+
+def read_steamspy_data(path):
+    """
+    Read SteamSpy data file (csv or NDJSON) to a dataframe.
+    """
+    if ndjson.is_ndjson(path):
+        return ndjson.read_ndjson(path)
+    return pd.read_csv(path)
+
+
+def get_details_ids(details, app_list, listed_ids, data_path):
+    """
+    Return dataframe with download_appid of the apps to request appdetails for.
+
+    Parameters
+    ----------
+    details : 'tags', 'missing', 'all' or dataframe, see download_steamspy
+    app_list : dataframe with download_appid of the apps to collect
+    listed_ids : set of the appids of the listing
+    data_path : path to the data file with the listing rows
+    """
+    missing_ids = app_list[~app_list['download_appid'].isin(listed_ids)][['download_appid']]
+    if isinstance(details, pd.DataFrame):
+        details_ids = pd.concat([missing_ids, details[['download_appid']]], ignore_index=True)
+    elif details == 'all':
+        details_ids = pd.concat([app_list[['download_appid']],
+                                 pd.DataFrame({'download_appid': sorted(listed_ids)})], ignore_index=True)
+    elif details == 'tags':
+        listing = read_steamspy_data(data_path).reindex(columns=['appid', 'tags'])
+        untagged = listing.loc[listing['tags'].isna(), 'appid'].astype('int64')
+        details_ids = pd.concat([missing_ids, pd.DataFrame({'download_appid': untagged.to_numpy()})],
+                                ignore_index=True)
+    else:
+        details_ids = missing_ids
+    return details_ids.drop_duplicates().reset_index(drop=True)
+
+
+def download_steamspy(download_path, app_list=None, details='tags', workers=1, max_pages=None,
+                      data_format='csv', verbose=False):
+    """
+    Download SteamSpy data, using the paged 'all' listing and requesting
+    appdetails for the apps that need the per-app fields.
+
+    The appdetails requests are recorded in the journal: if they were
+    interrupted, the next call keeps the listing rows and requests only the
+    unfinished apps.
+
+    Parameters
+    ----------
+    download_path : the path where the data is downloaded to
+
+    Keyword arguments
+    -----------------
+    app_list : dataframe with download_appid of the apps to collect (default None, listing only)
+    details : apps to request appdetails for, which also adds languages, genre and tags:
+        'tags' - apps from app_list and the listing without tags (default)
+        'missing' - apps from app_list not present in the listing
+        'all' - all apps from app_list and the listing
+        dataframe - apps with download_appid from the dataframe and the missing ones
+    workers : number of concurrent appdetails requests, default to 1
+    max_pages : maximum number of listing pages to request (default None, all pages)
+    data_format : 'csv' or 'ndjson.gz'/'ndjson.zst', default to 'csv'
+    verbose : verbose output, default to False
+
+    Returns
+    -------
+    bool :
+        True if no errors, False if errors raised
+    """
+    steamspy_data = f'steamspy_data.{data_format}'
+    steamspy_journal = 'steamspy_journal.sqlite'
+    rel_path = os.path.join(download_path, steamspy_data)
+
+    steamspy_errors = []
+
+    log_time = []
+    log_time.append(['SteamSpy download start', time.time()])
+    collection_metrics = common.set_metrics_file(os.path.join(download_path, 'collection_metrics.prom'))
+    collection_metrics.reset()
+
+    # The apps are registered as pending only after the listing is written, so they mark an interrupted tail
+    collection_journal = journal.Journal(os.path.join(download_path, steamspy_journal))
+    resume = (collection_journal.counts().get(journal.PENDING, 0) > 0) and os.path.isfile(rel_path)
+    pending_ids = collection_journal.pending() if resume else []
+    collection_journal.close()
+
+    if resume:
+        print(f'Resuming appdetails for {len(pending_ids)} apps.\n')
+        details_ids = pd.DataFrame({'download_appid': pending_ids})
+    else:
+        # Listing goes first, the appdetails rows are written after it and replace the listing ones
+        common.reset_journal(download_path, steamspy_journal)
+        common.prepare_data_file(download_path, steamspy_data, 0, steamspy_columns)
+        listed_ids = download_steamspy_pages(download_path, steamspy_data, max_pages, verbose)
+        if app_list is None:
+            app_list = pd.DataFrame(columns=['download_appid'])
+        details_ids = get_details_ids(details, app_list, listed_ids, rel_path)
+        print(f'Requesting appdetails for {len(details_ids)} apps.\n')
+
+    if len(details_ids) > 0:
+        common.process_batches(
+            parser=parse_steamspy_request,
+            app_list=details_ids,
+            download_path=download_path,
+            data_filename=steamspy_data,
+            journal_filename=steamspy_journal,
+            errors_list=steamspy_errors,
+            columns=steamspy_columns,
+            batchsize=300,
+            pause=1,
+            workers=workers
+        )
+
+    # Removing the listing rows replaced by appdetails, keeping only the last one
+    steam_spy_data = read_steamspy_data(rel_path)
+    steam_spy_data = steam_spy_data.drop_duplicates(subset='appid', keep='last')
+    if ndjson.is_ndjson(steamspy_data):
+        ndjson.write_ndjson(steam_spy_data, rel_path)
+    else:
+        steam_spy_data.to_csv(rel_path, index=False)
+
+    log_time.append(['SteamSpy download end', time.time()])
+
+    # Saving errors and download times
+    steamspy_errors_df = pd.DataFrame(steamspy_errors, columns=['appid'])
+    steamspy_errors_df.to_csv(os.path.join(download_path, 'steamspy_errors.csv'), index=False)
+
+    common.append_download_log(download_path, log_time, collection_metrics.summary())
+    return len(steamspy_errors) == 0
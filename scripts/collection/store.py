@@ -0,0 +1,255 @@
+"""
+Appid-keyed store for the collected application data
+"""
+
+# standard library imports
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# third-party imports
+import pandas as pd
+
+# project imports
+import ndjson
+
+# Rows read from the data files and written to the store in one transaction
+CHUNKSIZE = 10000
+
+
+class AppStore:
+    """
+    Application data kept in SQLite (WAL mode), one json record per appid.
+
+    Upserts are last-write-wins and each batch is committed in a single
+    transaction, so merging a download delta costs O(delta) and readers
+    never see a partially merged store.
+
+    Parameters
+    ----------
+    path : path to the store file
+
+    Keyword arguments
+    -----------------
+    key : record field with the appid (default 'download_appid')
+    """
+    def __init__(self, path, key='download_appid'):
+        self.path = path
+        self.key = key
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS apps (
+                appid INTEGER PRIMARY KEY,
+                last_modified INTEGER,
+                updated REAL,
+                data TEXT NOT NULL
+            )''')
+        self.connection.commit()
+
+    @staticmethod
+    def _clean(record):
+        # NaN from the csv files is stored as null
+        return {name: (None if (isinstance(value, float) and value != value) else value)
+                for name, value in record.items()}
+
+    def _encode(self, record):
+        record = self._clean(record)
+        last_modified = record.get('last_modified')
+        return (int(record[self.key]),
+                None if last_modified is None else int(last_modified),
+                json.dumps(record, ensure_ascii=False, default=ndjson.json_default))
+
+    def upsert(self, records, newer_only=False):
+        """
+        Insert the records, replacing the stored ones with the same appid.
+
+        Parameters
+        ----------
+        records : iterable of dict-like records with the key field
+
+        Keyword arguments
+        -----------------
+        newer_only : replace the stored records only if the new last_modified is
+            the same or later, missing last_modified counts as the oldest (default False)
+
+        Returns
+        -------
+        int :
+            number of records written
+        """
+        now = time.time()
+        rows = [self._encode(record) + (now,) for record in records]
+        query = '''INSERT INTO apps (appid, last_modified, data, updated) VALUES (?, ?, ?, ?)
+                   ON CONFLICT (appid) DO UPDATE SET
+                   last_modified = excluded.last_modified, data = excluded.data, updated = excluded.updated'''
+        if newer_only:
+            query += ' WHERE COALESCE(excluded.last_modified, -1) >= COALESCE(apps.last_modified, -1)'
+        with self.lock, self.connection:
+            self.connection.executemany(query, rows)
+        return len(rows)
+
+    def update(self, records):
+        """
+        Update fields of the stored records with the values from the records.
+        Records for appids missing from the store are skipped.
+
+        Parameters
+        ----------
+        records : iterable of dict-like records with the key field
+
+        Returns
+        -------
+        int :
+            number of updated records
+        """
+        records = {int(record[self.key]): self._clean(record) for record in records}
+        now = time.time()
+        updated = 0
+        with self.lock, self.connection:
+            for appid, data in self._select(list(records)):
+                data.update(records[appid])
+                self.connection.execute(
+                    'UPDATE apps SET last_modified = ?, data = ?, updated = ? WHERE appid = ?',
+                    self._encode(data)[1:] + (now, appid))
+                updated += 1
+        return updated
+
+    def _select(self, appids):
+        # SQLite limits the number of query parameters, selecting in slices
+        for i in range(0, len(appids), 500):
+            part = appids[i:i+500]
+            query = 'SELECT appid, data FROM apps WHERE appid IN ({})'.format(','.join('?' * len(part)))
+            for appid, data in self.connection.execute(query, part).fetchall():
+                yield appid, json.loads(data)
+
+    def upsert_file(self, path, chunksize=CHUNKSIZE):
+        """
+        Upsert the records from a csv or NDJSON data file in chunks.
+
+        Returns
+        -------
+        int :
+            number of records written
+        """
+        if ndjson.is_ndjson(path):
+            chunks = ndjson.read_ndjson(path, chunksize=chunksize)
+        else:
+            chunks = pd.read_csv(path, chunksize=chunksize)
+        return sum(self.upsert(chunk.to_dict('records')) for chunk in chunks)
+
+    def update_file(self, path, chunksize=CHUNKSIZE):
+        """
+        Update the stored records with the fields from a csv or NDJSON data file in chunks.
+
+        Returns
+        -------
+        int :
+            number of updated records
+        """
+        if ndjson.is_ndjson(path):
+            chunks = ndjson.read_ndjson(path, chunksize=chunksize)
+        else:
+            chunks = pd.read_csv(path, chunksize=chunksize)
+        return sum(self.update(chunk.to_dict('records')) for chunk in chunks)
+
+    def merge(self, other, chunksize=CHUNKSIZE):
+        """
+        Merge the records of another AppStore, keeping the record with the
+        latest last_modified for each appid. On equal last_modified the
+        merged record wins, so merging the stores in a fixed order gives the
+        same result on every run.
+
+        Returns
+        -------
+        int :
+            number of records read from the other store
+        """
+        return sum(self.upsert(records, newer_only=True) for records in other.iter_records(chunksize))
+
+    def keys(self):
+        """
+        Return list of the stored appids.
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT appid FROM apps ORDER BY appid')]
+
+    def count(self):
+        """
+        Return number of the stored apps.
+        """
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM apps').fetchone()[0]
+
+    def iter_records(self, chunksize=CHUNKSIZE):
+        """
+        Generate lists of the stored records ordered by appid, chunksize records each.
+        """
+        last_appid = None
+        while True:
+            with self.lock:
+                if last_appid is None:
+                    rows = self.connection.execute(
+                        'SELECT appid, data FROM apps ORDER BY appid LIMIT ?', (chunksize,)).fetchall()
+                else:
+                    rows = self.connection.execute(
+                        'SELECT appid, data FROM apps WHERE appid > ? ORDER BY appid LIMIT ?',
+                        (last_appid, chunksize)).fetchall()
+            if not rows:
+                break
+            last_appid = rows[-1][0]
+            yield [json.loads(data) for _, data in rows]
+
+    def read_frame(self, columns=None, chunksize=None):
+        """
+        Read the stored records to a dataframe.
+
+        Keyword arguments
+        -----------------
+        columns : columns to keep (default None, all fields)
+        chunksize : return iterator of dataframes with chunksize rows each (default None, single dataframe)
+
+        Returns
+        -------
+        dataframe or iterator of dataframes
+        """
+        if chunksize is not None:
+            return (ndjson.records_to_frame(records, columns) for records in self.iter_records(chunksize))
+        records = [record for chunk in self.iter_records() for record in chunk]
+        return ndjson.records_to_frame(records, columns)
+
+    def export(self, path, columns=None):
+        """
+        Write the stored records to a csv or NDJSON file. The file is written
+        next to the target and swapped in atomically.
+
+        Keyword arguments
+        -----------------
+        columns : columns to write (default None, all fields)
+        """
+        directory, filename = os.path.split(path)
+        temp_path = os.path.join(directory, '.tmp-' + filename)
+        if ndjson.is_ndjson(path):
+            open(temp_path, 'wb').close()
+            for chunk in self.read_frame(columns, chunksize=CHUNKSIZE):
+                ndjson.write_ndjson(chunk, temp_path, mode='a')
+        else:
+            header = True
+            for chunk in self.read_frame(columns, chunksize=CHUNKSIZE):
+                chunk.to_csv(temp_path, mode='w' if header else 'a', header=header, index=False)
+                header = False
+            if header:
+                # empty store, writing only the headers
+                pd.DataFrame(columns=columns or []).to_csv(temp_path, index=False)
+        os.replace(temp_path, path)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -19,10 +19,25 @@ import requests.auth
 # project imports
 import common
 import applist
+import store
 
 APIKey = common.get_api_key()
 proxies = common.get_proxies()
 
+steam_columns = [
+    'type', 'name', 'steam_appid', 'required_age', 'is_free', 'controller_support',
+    'dlc', 'detailed_description', 'about_the_game', 'short_description', 'fullgame',
+    'supported_languages', 'header_image', 'website', 'pc_requirements', 'mac_requirements',
+    'linux_requirements', 'legal_notice', 'drm_notice', 'ext_user_account_notice',
+    'developers', 'publishers', 'demos', 'price_overview', 'packages', 'package_groups',
+    'platforms', 'metacritic', 'reviews', 'categories', 'genres', 'screenshots',
+    'movies', 'recommendations', 'achievements', 'release_date', 'support_info',
+    'background', 'content_descriptors',
+    'download_appid', 'last_modified'
+]
+steam_price_columns = ['steam_appid', 'price_overview', 'download_appid', 'last_modified']
+
+
 def parse_steam_request(appid):
     """
     Unique parser to handle data from Steam Store API.
@@ -49,75 +64,117 @@ def parse_steam_request(appid):
     return data
 
 
-def download_storefront(download_path, full_download = True, refresh_ids = False, verbose = False):
+def parse_steam_price_request(appid):
+    """
+    Parser to handle the price-only data from Steam Store API.
+
+    Parameters
+    ----------
+    appid : application ID
+
+    Returns
+    -------
+    json formatted data (dict-like) with steam_appid and price_overview
+    """
+    url = 'http://store.steampowered.com/api/appdetails/'
+    parameters = {'appids': appid, 'filters': 'price_overview', 'key': APIKey}
+
+    json_data = common.get_request(url, parameters=parameters, proxies=proxies)
+    json_app_data = json_data[str(appid)]
+
+    data = {'steam_appid': appid, 'price_overview': None}
+    # free apps return an empty list instead of the dictionary
+    if json_app_data['success'] and isinstance(json_app_data['data'], dict):
+        data['price_overview'] = json_app_data['data'].get('price_overview')
+
+    return data
+
+
+def download_storefront(download_path, full_download = True, refresh_ids = False, verbose = False,
+                        workers = 1, incremental = False, data_format = 'csv', export_data = False,
+                        pause = 1):
     """
     Download data for Steam storefront
 
     Parameters
     ----------
-    download_path : the path where the data is downloaded to (and 'full_steam_ids.csv' is located)
+    download_path : the path where the data is downloaded to (and 'full_steam_ids.csv' or
+        'full_steam_ids.parquet' is located)
 
     Keyword arguments
     -----------------
     full_download : download all apps available in ids table, default to True
     refresh_ids : refresh the ids table, default to False
     verbose : verbose output, default to False
+    workers : number of concurrent requests to the Storefront API, default to 1
+    incremental : refresh the ids table and download only new and changed apps, comparing
+        last_modified and price_change_number with the stored ids table. Apps with
+        only the price changed get a price-only refetch. Default to False
+    data_format : 'csv' or 'ndjson.gz'/'ndjson.zst' to store the whole responses as
+        compressed json lines (read with ndjson.read_ndjson). Default to 'csv'
+    export_data : write the whole 'steam_app_data' file from the store after the
+        download, default to False (the data is read from 'steam_app_data.sqlite')
+    pause : time to wait after each request with a single worker, default to 1
 
     Returns
     -------
     bool :
         True if no errors, False if errors raised
     """
-    steam_app_data = 'steam_app_data.csv'
-    steam_app_data_delta = 'steam_app_data_delta.csv'
-    steam_index = 'steam_index.txt'
-
-    steam_columns = [
-        'type', 'name', 'steam_appid', 'required_age', 'is_free', 'controller_support',
-        'dlc', 'detailed_description', 'about_the_game', 'short_description', 'fullgame',
-        'supported_languages', 'header_image', 'website', 'pc_requirements', 'mac_requirements',
-        'linux_requirements', 'legal_notice', 'drm_notice', 'ext_user_account_notice',
-        'developers', 'publishers', 'demos', 'price_overview', 'packages', 'package_groups',
-        'platforms', 'metacritic', 'reviews', 'categories', 'genres', 'screenshots',
-        'movies', 'recommendations', 'achievements', 'release_date', 'support_info',
-        'background', 'content_descriptors',
-        'download_appid', 'last_modified'
-    ]
+    steam_app_data = f'steam_app_data.{data_format}'
+    steam_app_store = 'steam_app_data.sqlite'
+    steam_app_data_delta = f'steam_app_data_delta.{data_format}'
+    steam_journal = 'steam_journal.sqlite'
+    steam_price_delta = f'steam_app_price_delta.{data_format}'
+    steam_price_journal = 'steam_price_journal.sqlite'
 
     steam_errors = []
+    app_list_path = applist.get_app_list_path(download_path)
 
     # Redownload IDs
-    if (refresh_ids):
+    if (refresh_ids) or (incremental):
+        if (incremental):
+            # Keeping the stored ids table to detect the changes
+            old_steam_ids = applist.read_app_list(app_list_path)
         # Here we get the list of appids from steam
         full_steam_ids = applist.get_app_list()
-        full_download = True
+        if not (incremental):
+            full_download = True
     else:
-        full_steam_ids = pd.read_csv(f'{download_path}full_steam_ids.csv')
+        full_steam_ids = applist.read_app_list(app_list_path)
 
-    if (os.path.isfile(download_path+steam_app_data_delta) == False) or (full_download):
-        # Download all apps
-        common.reset_index(download_path, steam_index)
-        index = 0
-    else:
-        # Retrieve last index downloaded from file
-        index = common.get_index(download_path, steam_index)
-        
-    # Wipe or create data file and write headers if no previous file present
-    if (os.path.isfile(download_path+steam_app_data) == False):
-        common.prepare_data_file(download_path, steam_app_data, index, steam_columns)
-        
-    # Wipe or create data file delta and write headers if index is 0
-    if (os.path.isfile(download_path+steam_app_data_delta) == False) or (index == 0):
+    # Download all apps from scratch, otherwise resume the unfinished ones from the journal.
+    # Incremental runs keep the journal, so the failed apps are retried by the next run
+    resume = os.path.isfile(download_path+steam_app_data_delta)
+    reset = ((resume == False) or (full_download)) and not (incremental)
+
+    # Appid-keyed store with the downloaded data, filled from the data file on the first run
+    app_store = store.AppStore(download_path+steam_app_store)
+    if (app_store.count() == 0) and (os.path.isfile(download_path+steam_app_data)):
+        print(f'Importing {steam_app_data} to {steam_app_store}\n')
+        app_store.upsert_file(download_path+steam_app_data)
+
+    # Wipe or create data file delta and write headers if starting over
+    if (reset) or (resume == False):
         common.prepare_data_file(download_path, steam_app_data_delta, 0, steam_columns)
               
-    # Here we get the real list of ids not yet in our dataframe. If this is the first time we are downloading the data, we can skip
-    # This step and instead use the full app_list.
-    try:
-        oldlist = pd.read_csv('../data/download/steam_app_data.csv', usecols = ['name','download_appid'])
-        steam_ids = applist.get_update_ids(full_steam_ids, oldlist)
-    except FileNotFoundError:
-        print('Pre-existing file not found. Downloading data for all IDs\n')
-        steam_ids = full_steam_ids
+    price_ids = full_steam_ids.iloc[0:0]
+    if (incremental):
+        # New and modified apps get the full appdetails, price changes get the price-only request
+        changed_ids = applist.get_changed_ids(full_steam_ids, old_steam_ids)
+        steam_ids = pd.concat([changed_ids['new'], changed_ids['metadata']], ignore_index=True)
+        price_ids = changed_ids['price']
+        print(f"Detected {len(changed_ids['new'])} new, {len(changed_ids['metadata'])} modified "
+              f"and {len(price_ids)} price changed ids.\n")
+    else:
+        # Here we get the real list of ids not yet in our dataframe. If this is the first time we are downloading the data, we can skip
+        # This step and instead use the full app_list.
+        oldlist = pd.DataFrame({'download_appid': app_store.keys()})
+        if (len(oldlist) > 0):
+            steam_ids = applist.get_update_ids(full_steam_ids, oldlist)
+        else:
+            print('Pre-existing data not found. Downloading data for all IDs\n')
+            steam_ids = full_steam_ids
 
     # I separated the long process to be able to debug it better.
     # Set end and chunksize for demonstration - remove to run through entire app list
@@ -128,6 +185,8 @@ def download_storefront(download_path, full_download = True, refresh_ids = False
     # Adding download start timestamp
     log_time = []
     log_time.append(['Storefront download start', time.time()])
+    collection_metrics = common.set_metrics_file(os.path.join(download_path, 'collection_metrics.prom'))
+    collection_metrics.reset()
 
     # Downloadidng in batches to the delta file
     common.process_batches(
@@ -135,44 +194,66 @@ def download_storefront(download_path, full_download = True, refresh_ids = False
         app_list=steam_ids,
         download_path=download_path,
         data_filename=steam_app_data_delta,
-        index_filename=steam_index,
+        journal_filename=steam_journal,
         errors_list=steam_errors,
         columns=steam_columns,
-        begin=index,
         #pause=0.5
         batchsize=100,
-        pause=1,
+        pause=pause,
         download_appid = True,
-        last_modified = True
+        last_modified = True,
+        workers = workers,
+        reset = reset,
+        # a new incremental run collects the changed apps again, an interrupted one resumes
+        requeue = (incremental) and (resume == False)
     )
 
+    # Price-only refetch for the apps with changed price_change_number
+    if len(price_ids) > 0:
+        common.prepare_data_file(download_path, steam_price_delta, 0, steam_price_columns)
+        common.process_batches(
+            parser=parse_steam_price_request,
+            app_list=price_ids,
+            download_path=download_path,
+            data_filename=steam_price_delta,
+            journal_filename=steam_price_journal,
+            errors_list=steam_errors,
+            columns=steam_price_columns,
+            batchsize=100,
+            pause=pause,
+            download_appid = True,
+            last_modified = True,
+            workers = workers,
+            requeue = True
+        )
+
     log_time.append(['Storefront download end', time.time()])
 
-    # Saving the file, making a backup first
-    try:
-        oldlist = pd.read_csv('../data/download/steam_app_data.csv')
-        # We change the old file to backup, so remove any backup named this way before...
-        os.replace('../data/download/steam_app_data.csv', '../data/download/steam_app_data_backup.csv')
-        newlist = pd.read_csv('../data/download/steam_app_data_delta.csv')
-        oldlist = oldlist.append(newlist, ignore_index=True)
-        oldlist.to_csv('../data/download/steam_app_data.csv', index=False)
-    except FileNotFoundError:
-        os.rename('../data/download/steam_app_data_delta.csv', '../data/download/steam_app_data.csv')
-
-    # Removing downloaded duplicates, keeping only the last one
-    steam_app_data = steam_app_data.drop_duplicates(subset='download_appid', keep='last')
-    steam_app_data.to_csv('../data/download/steam_app_data.csv', index=False)
+    # Merging the delta to the store, the last downloaded record wins
+    merged = app_store.upsert_file(download_path+steam_app_data_delta)
+    os.remove(download_path+steam_app_data_delta)
+
+    # Applying price-only updates to the stored data
+    if len(price_ids) > 0:
+        merged += app_store.update_file(download_path+steam_price_delta)
+        os.remove(download_path+steam_price_delta)
+    print(f'Merged {merged} apps, {app_store.count()} apps in {steam_app_store}\n')
+
+    if (export_data):
+        app_store.export(download_path+steam_app_data, steam_columns if data_format == 'csv' else None)
+    app_store.close()
+
+    # Saving the ids table the changes were detected against, the failed apps keep
+    # their old change markers to be fetched again by the next run
+    if (incremental):
+        full_steam_ids = applist.restore_failed_ids(full_steam_ids, old_steam_ids, steam_errors)
+    if (refresh_ids) or (incremental):
+        applist.write_app_list(full_steam_ids, app_list_path)
 
     # Saving errors and download times
     steam_errors_df = pd.DataFrame(steam_errors, columns=['appid'])
-    steam_errors_df.to_csv('../data/download/steam_errors.csv', index=False)
+    steam_errors_df.to_csv(os.path.join(download_path, 'steam_errors.csv'), index=False)
 
-    log_columns = ['operation', 'timestamp']
-    try:
-        log_df = pd.read_csv('../data/download/download_log.csv', header=0)
-    except:
-        log_df = pd.DataFrame(columns=log_columns)
+    common.append_download_log(download_path, log_time, collection_metrics.summary())
+    return len(steam_errors) == 0
 
-    log_df = log_df.append(pd.DataFrame(columns=log_columns, data=log_time), ignore_index=True)
-    log_df.to_csv('../data/download/download_log.csv', index=False)
-    return True
\ No newline at end of file
@@ -11,6 +11,9 @@ import requests.auth
 # project imports
 import applist
 import common
+import mockserver
+import steamspy
+import storefront
 
 download_path = './scripts/test/'
 
@@ -61,6 +64,66 @@ def storefront_download(short = False, verbose = False):
     bool : 
         True if no errors, otherwise False
     """
+    # Downloading from the local mock API with injected 429 responses
+    app_count = 100 if short else 1000
+    appdetails_limit = common.RATE_LIMITS['appdetails']
+    common.set_rate_limit('appdetails', None)
+    try:
+        with mockserver.MockSteamServer(app_count = app_count, rate_limit_rate = 0.02, seed = 0) as server:
+            common.set_base_url(server.url)
+            full_ids = applist.get_app_list()
+            full_ids.to_csv(f'{download_path}full_steam_ids.csv', index=False)
+            storefront.download_storefront(download_path, workers = 16, pause = 0, export_data = True)
+    except Exception as e:
+        if (verbose):
+            print(e)
+        return False
+    finally:
+        common.set_base_url(None)
+        common.set_rate_limit('appdetails', *appdetails_limit)
+    # Checking the downloaded data
+    steam_app_data = pd.read_csv(f'{download_path}steam_app_data.csv')
+    ids_count = steam_app_data.drop_duplicates(subset='download_appid').shape[0]
+    if (verbose):
+        print(f'Storefront apps: {ids_count} of {app_count}')
+    if (ids_count != app_count) or (steam_app_data['name'].isna().sum() > 0):
+        return False
+    return True
+
+def steamspy_download(verbose = False):
+    """
+    Testing SteamSpy paged listing download with the appdetails of the untagged apps
+
+    Parameters
+    ----------
+    verbose : verbose output
+
+    Returns
+    bool : 
+        True if no errors, otherwise False
+    """
+    # Downloading from the local mock API, the listing has no tags
+    app_count = 1500
+    steamspy_limits = {endpoint: common.RATE_LIMITS[endpoint] for endpoint in ('steamspy', 'steamspy_all')}
+    for endpoint in steamspy_limits:
+        common.set_rate_limit(endpoint, None)
+    try:
+        with mockserver.MockSteamServer(app_count = app_count, seed = 0) as server:
+            common.set_base_url(server.url)
+            steamspy.download_steamspy(download_path, workers = 16, verbose = verbose)
+    except Exception as e:
+        if (verbose):
+            print(e)
+        return False
+    finally:
+        common.set_base_url(None)
+        for endpoint, limit in steamspy_limits.items():
+            common.set_rate_limit(endpoint, *limit)
+    steam_spy_data = pd.read_csv(f'{download_path}steamspy_data.csv')
+    if (verbose):
+        print(f'SteamSpy apps: {steam_spy_data.shape[0]}, without tags: {steam_spy_data.tags.isna().sum()}')
+    if (steam_spy_data.shape[0] != app_count) or (steam_spy_data.tags.isna().sum() > 0):
+        return False
     return True
 
 def all(verbose = False):
@@ -70,8 +133,16 @@ def all(verbose = False):
     else:
         print('App list download test FAILED')
     # Steam apps download
+    if (storefront_download(short = True, verbose = verbose)):
+        print('Storefront download test PASSED')
+    else:
+        print('Storefront download test FAILED')
 
     # SteamSpy apps download
+    if (steamspy_download(verbose)):
+        print('SteamSpy download test PASSED')
+    else:
+        print('SteamSpy download test FAILED')
 
     # Steam Reviews download
     return True
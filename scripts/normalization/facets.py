@@ -0,0 +1,411 @@
+"""
+In-process bitmap index of the normalized tables for the faceted queries
+(filter, count and top values of tags, genres, categories, platforms and
+languages) without the database
+
+Each facet is a matrix with a bitmap of the apps for each value, in 64-bit
+words, the numeric columns (price, scores, release year) are kept with
+their sort order for the range filters. The index is saved compressed and
+updated only for the apps whose rows changed, the rows of the removed apps
+are dropped once they are a quarter of the index.
+
+Usage (from the repository root):
+    python scripts/normalization/facets.py --export-path ./data/export/ --top tags --where metacritic_score=91:
+    python scripts/normalization/facets.py --export-path ./data/export/ --no-update --top genres
+    python scripts/normalization/facets.py --export-path ./data/export/ --count --where genres=RPG platforms=linux
+"""
+
+# standard library imports
+import argparse
+import os
+import sys
+import time
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import interning
+import loader
+import normalize
+
+# Facets: (bridge table, dimension table)
+FACETS = {
+    'tags': ('app_tag', 'tags'),
+    'genres': ('app_genre', 'genres'),
+    'categories': ('app_category', 'categories'),
+    'languages': ('app_language', 'languages'),
+    'steamspy_tags': ('app_steamspy_tag', 'tags_steamspy'),
+    'platforms': ('platforms', None),
+}
+
+PLATFORMS = ['windows', 'mac', 'linux']
+
+# Numeric columns: game_data column, None for the computed ones
+NUMERIC = {
+    'price': 'price_eu',
+    'review_score': 'review_score',
+    'metacritic_score': 'metacritic_score',
+    'release_year': None,
+}
+
+WORD_BITS = 64
+
+# Share of the removed apps rows that triggers the compaction of the index
+COMPACT_RATIO = 0.25
+
+
+def _to_words(bits):
+    """
+    Return uint64 words of the boolean array, bit i of the array is bit i % 64 of word i // 64.
+    """
+    size = -(-len(bits) // WORD_BITS) * WORD_BITS
+    padded = np.zeros(size, dtype=bool)
+    padded[:len(bits)] = bits
+    return np.packbits(padded, bitorder='little').view('<u8').astype(np.uint64)
+
+
+def _from_words(words, size):
+    """
+    Return boolean array of the first size bits of the words.
+    """
+    bits = np.unpackbits(words.astype('<u8').view(np.uint8), bitorder='little')
+    return bits[:size].astype(bool)
+
+
+def _take_bits(words, rows):
+    """
+    Return the words of the bitmaps (the last axis) with only the bits of the rows, in their order.
+    """
+    bits = np.unpackbits(words.astype('<u8').view(np.uint8), axis=-1, bitorder='little')[..., rows]
+    padded = np.zeros((*bits.shape[:-1], -(-len(rows) // WORD_BITS) * WORD_BITS), dtype=np.uint8)
+    padded[..., :len(rows)] = bits
+    return np.packbits(padded, axis=-1, bitorder='little').view('<u8').astype(np.uint64)
+
+
+def _popcount(words, axis=None):
+    if hasattr(np, 'bitwise_count'):
+        counts = np.bitwise_count(words)
+    else:
+        counts = np.unpackbits(words.view(np.uint8), axis=-1).reshape(*words.shape, 64).sum(axis=-1)
+    return counts.sum(axis=axis, dtype=np.int64)
+
+
+class FacetIndex:
+    """
+    Bitmap index of the apps, one row (bit) for each app in the order they
+    were added.
+
+    Build it with update (or load a saved one), then query it with count,
+    get_appids and top. The filters are keyword arguments:
+        facet=value or facet=[values], the apps with all the values
+        numeric=(low, high), the apps with the value in the inclusive
+            range, None for an open end
+    """
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all the apps and values from the index.
+        """
+        self.appids = np.empty(0, dtype=np.int64)
+        self.alive = np.empty(0, dtype=np.uint64)
+        self.hashes = np.empty(0, dtype='<U16')
+        self.values = {facet: [] for facet in FACETS}
+        self.bitmaps = {facet: np.empty((0, 0), dtype=np.uint64) for facet in FACETS}
+        self.numeric = {column: np.empty(0, dtype=np.float64) for column in NUMERIC}
+        self._sorted = {}
+
+    def __len__(self):
+        return int(_popcount(self.alive))
+
+    @property
+    def words(self):
+        return len(self.alive)
+
+    def _resize(self, rows):
+        # grow the bitmaps to the number of rows, and the facet matrices to the number of values
+        words = -(-rows // WORD_BITS)
+        self.alive = np.pad(self.alive, (0, words - len(self.alive)))
+        for facet, matrix in self.bitmaps.items():
+            self.bitmaps[facet] = np.pad(matrix, ((0, len(self.values[facet]) - matrix.shape[0]),
+                                                  (0, words - matrix.shape[1])))
+        for column, values in self.numeric.items():
+            self.numeric[column] = np.pad(values, (0, rows - len(values)), constant_values=np.nan)
+        self.hashes = np.pad(self.hashes, (0, rows - len(self.hashes)), constant_values='')
+
+    def compact(self):
+        """
+        Drop the rows of the removed apps, the other apps keep their order.
+        """
+        rows = np.flatnonzero(_from_words(self.alive, len(self.appids)))
+        self.appids = self.appids[rows]
+        self.hashes = self.hashes[rows]
+        self.alive = _to_words(np.ones(len(rows), dtype=bool))
+        for facet, matrix in self.bitmaps.items():
+            self.bitmaps[facet] = _take_bits(matrix, rows)
+        for column, values in self.numeric.items():
+            self.numeric[column] = values[rows]
+        self._sorted = {}
+
+    def _rows(self, appids):
+        return pd.Index(self.appids).get_indexer(np.asarray(appids, dtype=np.int64))
+
+    def _get_bridges(self, tables):
+        # (appid, value id - 1) arrays of each facet
+        bridges = {}
+        for facet, (bridge, dimension) in FACETS.items():
+            df = tables[bridge]
+            if dimension is None:
+                appids = [df.loc[df[platform].fillna(False).astype(bool), 'appid'] for platform in PLATFORMS]
+                ids = [np.full(len(values), i) for i, values in enumerate(appids)]
+                bridges[facet] = (np.concatenate(appids).astype(np.int64), np.concatenate(ids).astype(np.int64))
+            else:
+                id_column = normalize.DIMENSIONS[dimension][0]
+                bridges[facet] = (df['appid'].to_numpy(dtype=np.int64), df[id_column].to_numpy(dtype=np.int64) - 1)
+        return bridges
+
+    def update(self, tables, full=False):
+        """
+        Update the index with the normalized tables: the rows of the new and
+        changed apps are replaced, the removed apps are dropped. The index is
+        compacted on the full update or when the removed apps rows pass
+        COMPACT_RATIO of the rows.
+
+        Parameters
+        ----------
+        tables : {table: dataframe} of the normalized tables, from
+            normalize.normalize. With the tables normalized without a
+            DictionaryStore the dimension ids may change between the runs,
+            the index is rebuilt when the known values don't keep their ids
+
+        Keyword arguments
+        -----------------
+        full : replace the rows of all the apps and compact the index (default False)
+
+        Returns
+        -------
+        {'changed': number of the updated apps, 'removed': number of the removed apps}
+        """
+        tables = loader.cast_tables(tables)
+        hashes = loader.get_app_hashes(tables)
+        game_data = tables['game_data']
+        appids = game_data['appid'].to_numpy(dtype=np.int64)
+
+        values = {facet: PLATFORMS if dimension is None
+                  else tables[dimension][normalize.DIMENSIONS[dimension][1]].tolist()
+                  for facet, (_, dimension) in FACETS.items()}
+        # the known values keep their rows only if the dimension ids are append-only
+        if any(values[facet][:len(self.values[facet])] != self.values[facet] for facet in FACETS):
+            self.clear()
+        self.values = values
+
+        rows = self._rows(appids)
+        new = appids[rows < 0]
+        self.appids = np.concatenate([self.appids, new])
+        self._resize(len(self.appids))
+
+        rows = self._rows(appids)
+        alive = _from_words(self.alive, len(self.appids))
+        app_hashes = hashes.reindex(appids).fillna('').to_numpy(dtype='<U16')
+        changed = np.ones(len(rows), dtype=bool) if full else (~alive[rows] | (self.hashes[rows] != app_hashes))
+        removed = alive.copy()
+        removed[rows] = False
+        changed_rows = rows[changed]
+
+        # clear the bits of the changed and removed apps and set the bits of the changed ones
+        cleared = np.zeros(len(self.appids), dtype=bool)
+        cleared[changed_rows] = True
+        cleared |= removed
+        keep = ~_to_words(cleared)
+        for facet, matrix in self.bitmaps.items():
+            matrix &= keep
+        changed_appids = appids[changed]
+        for facet, (bridge_appids, ids) in self._get_bridges(tables).items():
+            selected = np.isin(bridge_appids, changed_appids)
+            bits = self._rows(bridge_appids[selected])
+            np.bitwise_or.at(self.bitmaps[facet], (ids[selected], bits // WORD_BITS),
+                             np.left_shift(np.uint64(1), (bits % WORD_BITS).astype(np.uint64)))
+
+        alive = (alive & ~removed)
+        alive[rows] = True
+        self.alive = _to_words(alive)
+        self.hashes[changed_rows] = app_hashes[changed]
+        self.hashes[removed] = ''
+        changed_data = game_data[changed]
+        for column, source in NUMERIC.items():
+            if source is None:
+                values = pd.to_datetime(changed_data['release_date'], errors='coerce').dt.year
+            else:
+                values = changed_data[source]
+            self.numeric[column][changed_rows] = pd.to_numeric(values, errors='coerce').to_numpy(
+                dtype=np.float64, na_value=np.nan)
+            self.numeric[column][removed] = np.nan
+        self._sorted = {}
+        if full or (len(self.appids) - len(self) > COMPACT_RATIO * len(self.appids)):
+            self.compact()
+        return {'changed': int(changed.sum()), 'removed': int(removed.sum())}
+
+    def _get_sorted(self, column):
+        # rows sorted by the column value, the missing values last
+        if column not in self._sorted:
+            values = self.numeric[column]
+            order = np.argsort(values, kind='stable')
+            self._sorted[column] = (order, values[order], int(np.count_nonzero(~np.isnan(values))))
+        return self._sorted[column]
+
+    def _range(self, column, low, high):
+        order, values, present = self._get_sorted(column)
+        start = 0 if low is None else np.searchsorted(values[:present], low, side='left')
+        end = present if high is None else np.searchsorted(values[:present], high, side='right')
+        bits = np.zeros(len(self.appids), dtype=bool)
+        bits[order[start:end]] = True
+        return _to_words(bits)
+
+    def _value_bitmap(self, facet, value):
+        try:
+            return self.bitmaps[facet][self.values[facet].index(value)]
+        except ValueError:
+            return np.zeros(self.words, dtype=np.uint64)
+
+    def mask(self, **filters):
+        """
+        Return the bitmap words of the apps matching the filters.
+        """
+        words = self.alive.copy()
+        for name, condition in filters.items():
+            if name in NUMERIC:
+                low, high = condition
+                words &= self._range(name, low, high)
+            elif name in FACETS:
+                for value in ([condition] if isinstance(condition, str) else condition):
+                    words &= self._value_bitmap(name, value)
+            else:
+                raise KeyError(f'Unknown facet {name}, one of {list(FACETS) + list(NUMERIC)}')
+        return words
+
+    def count(self, **filters):
+        """
+        Return the number of the apps matching the filters.
+        """
+        return int(_popcount(self.mask(**filters)))
+
+    def get_appids(self, **filters):
+        """
+        Return sorted appids of the apps matching the filters.
+        """
+        return np.sort(self.appids[_from_words(self.mask(**filters), len(self.appids))])
+
+    def top(self, facet, k=10, **filters):
+        """
+        Return the k facet values with the most apps matching the filters.
+
+        Parameters
+        ----------
+        facet : facet name, key of FACETS
+
+        Keyword arguments
+        -----------------
+        k : number of the values (default 10, None for all)
+        filters : filters of the apps
+
+        Returns
+        -------
+        list of (value, number of apps), the most common first
+        """
+        counts = _popcount(self.bitmaps[facet] & self.mask(**filters), axis=1)
+        order = np.lexsort((np.arange(len(counts)), -counts))
+        order = order[counts[order] > 0][:k]
+        return [(self.values[facet][i], int(counts[i])) for i in order]
+
+    def save(self, path):
+        """
+        Save the index to a compressed npz file.
+        """
+        arrays = {'appids': self.appids, 'alive': self.alive, 'hashes': self.hashes}
+        for facet in FACETS:
+            arrays[f'bitmap_{facet}'] = self.bitmaps[facet]
+            arrays[f'values_{facet}'] = np.array(self.values[facet], dtype=str)
+        for column in NUMERIC:
+            arrays[f'numeric_{column}'] = self.numeric[column]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = path + '.tmp.npz'
+        np.savez_compressed(temp_path, **arrays)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Return the index saved to the file, empty if there is none.
+        """
+        index = cls()
+        if not os.path.isfile(path):
+            return index
+        with np.load(path, allow_pickle=False) as arrays:
+            index.appids = arrays['appids']
+            index.alive = arrays['alive']
+            index.hashes = arrays['hashes']
+            for facet in FACETS:
+                index.bitmaps[facet] = arrays[f'bitmap_{facet}']
+                index.values[facet] = arrays[f'values_{facet}'].tolist()
+            for column in NUMERIC:
+                index.numeric[column] = arrays[f'numeric_{column}']
+        return index
+
+
+def parse_filter(string):
+    """
+    Return (name, condition) of the --where filter: facet=value[,value...] or numeric=low:high.
+    """
+    name, _, value = string.partition('=')
+    if name in NUMERIC:
+        low, _, high = value.partition(':')
+        return name, (float(low) if low else None, float(high) if high else None)
+    return name, value.split(',')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Faceted queries of the exported dataset')
+    parser.add_argument('--export-path', default='./data/export/')
+    parser.add_argument('--index-path', help="saved index, default 'facets.npz' in the export path")
+    parser.add_argument('--dictionary-path',
+                        help="SQLite file of the dimension ids, default 'dimensions.sqlite' in the export path")
+    parser.add_argument('--where', nargs='*', default=[], help='facet=value[,value...] or numeric=low:high filters')
+    parser.add_argument('--top', help='facet of the top values')
+    parser.add_argument('-k', type=int, default=10, help='number of the top values')
+    parser.add_argument('--count', action='store_true', help='print the number of the matching apps')
+    parser.add_argument('--full', action='store_true', help='rebuild the index')
+    parser.add_argument('--no-update', action='store_true', help="query the saved index without updating it")
+    args = parser.parse_args(args)
+
+    index_path = args.index_path or os.path.join(args.export_path, 'facets.npz')
+    index = FacetIndex.load(index_path)
+    if not args.no_update:
+        store = interning.DictionaryStore(args.dictionary_path or
+                                          os.path.join(args.export_path, 'dimensions.sqlite'))
+        try:
+            tables = normalize.normalize(normalize.read_export(args.export_path), store)
+        finally:
+            store.close()
+        result = index.update(tables, full=args.full)
+        if args.full or result['changed'] or result['removed']:
+            index.save(index_path)
+            print(f'Updated {result["changed"]} apps, removed {result["removed"]} apps of the index')
+
+    filters = dict(parse_filter(string) for string in args.where)
+    start = time.time()
+    if args.top:
+        for value, count in index.top(args.top, args.k, **filters):
+            print(f'{count:8d}  {value}')
+    if args.count or not args.top:
+        print(f'{index.count(**filters)} apps')
+    print(f'Query time {1000 * (time.time() - start):.1f} ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Persistent interning dictionaries of the dimension values (developers,
+publishers, languages, tags...) with append-only stable ids
+
+A value keeps its id between the runs, the new values get the next ids,
+so a refresh adds only the new names to the dimension tables and the
+bridge rows of the unchanged apps keep their ids. The list columns are
+encoded to (appid, id) bridge arrays in one vectorized pass.
+"""
+
+# standard library imports
+import itertools
+import os
+import sqlite3
+import threading
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+
+class Dictionary:
+    """
+    Append-only value to id dictionary of a dimension, ids start from 1.
+
+    Parameters
+    ----------
+    name : dimension name
+
+    Keyword arguments
+    -----------------
+    values : values of the ids 1, 2, ... (default (), empty dictionary)
+    """
+    def __init__(self, name, values=()):
+        self.name = name
+        self.values = list(values)
+        self.ids = {value: i for i, value in enumerate(self.values, start=1)}
+        # number of the values already persisted
+        self.saved = len(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def encode(self, values):
+        """
+        Return int64 array of the ids of the values, the new values are
+        appended to the dictionary in sorted order.
+
+        Parameters
+        ----------
+        values : array of the values, without missing values
+        """
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        new_values = sorted(value for value in uniques if value not in self.ids)
+        for value in new_values:
+            self.values.append(value)
+            self.ids[value] = len(self.values)
+        ids = np.fromiter((self.ids[value] for value in uniques), dtype=np.int64, count=len(uniques))
+        return ids[codes]
+
+    def to_frame(self, id_column, value_column):
+        """
+        Return (id_column, value_column) dataframe of the dictionary.
+        """
+        return pd.DataFrame({id_column: np.arange(1, len(self.values) + 1, dtype=np.int64),
+                             value_column: pd.Series(self.values, dtype='object')})
+
+
+class DictionaryStore:
+    """
+    SQLite file with the interning dictionaries.
+
+    Parameters
+    ----------
+    path : path to the SQLite file
+    """
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('''
+            CREATE TABLE IF NOT EXISTS dimension_values (
+                dimension TEXT,
+                id INTEGER,
+                value TEXT,
+                PRIMARY KEY (dimension, id)
+            )''')
+        self.connection.commit()
+
+    def get(self, name):
+        """
+        Return the Dictionary of the dimension, empty if it isn't stored.
+        """
+        with self.lock:
+            rows = self.connection.execute('SELECT id, value FROM dimension_values WHERE dimension = ? ORDER BY id',
+                                           (name,)).fetchall()
+        for expected, (i, _) in enumerate(rows, start=1):
+            if i != expected:
+                raise ValueError(f'Dictionary {name} of "{self.path}" has a gap at id {expected}')
+        return Dictionary(name, [value for _, value in rows])
+
+    def save(self, dictionary):
+        """
+        Store the values added to the dictionary since it was read.
+        """
+        rows = [(dictionary.name, i, value)
+                for i, value in enumerate(dictionary.values[dictionary.saved:], start=dictionary.saved + 1)]
+        if not rows:
+            return
+        with self.lock, self.connection:
+            # a plain INSERT, the stored ids are never reassigned
+            self.connection.executemany('INSERT INTO dimension_values (dimension, id, value) VALUES (?, ?, ?)', rows)
+        dictionary.saved = len(dictionary.values)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def flatten_lists(series):
+    """
+    Return (index, items) arrays of the list series: the index value of each
+    item and the items, without the missing items. Non-list values are empty lists.
+    """
+    lists = [value if isinstance(value, list) else [] for value in series]
+    lengths = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    items = np.empty(int(lengths.sum()), dtype=object)
+    items[:] = list(itertools.chain.from_iterable(lists))
+    index = np.repeat(series.index.to_numpy(), lengths)
+    present = pd.notna(items)
+    return index[present], items[present]
+
+
+def encode_lists(df, columns, dictionary, index_name='appid', id_column='id'):
+    """
+    Encode the list columns with the dictionary to the bridge arrays.
+
+    Parameters
+    ----------
+    df : dataframe with the list columns
+    columns : list columns sharing the dictionary
+    dictionary : Dictionary of their values
+
+    Keyword arguments
+    -----------------
+    index_name : column name of the df index in the bridges (default 'appid')
+    id_column : column name of the ids in the bridges (default 'id')
+
+    Returns
+    -------
+    {column: (index_name, id_column) dataframe} sorted, without duplicated rows
+    """
+    flat = {column: flatten_lists(df[column]) for column in columns}
+    # all the columns are encoded at once, so the new values get the same ids in any column order
+    items = np.concatenate([values for _, values in flat.values()]) if flat else np.empty(0, dtype=object)
+    ids = dictionary.encode(items)
+    bridges = {}
+    start = 0
+    for column, (index, values) in flat.items():
+        bridge = pd.DataFrame({index_name: index, id_column: ids[start:start + len(values)]})
+        start += len(values)
+        bridges[column] = bridge.drop_duplicates().sort_values([index_name, id_column]).reset_index(drop=True)
+    return bridges
@@ -0,0 +1,215 @@
+"""
+Normalized tables of the SQL database built from the exported dataset,
+ported from the 5-df-normalization notebook
+
+The dimension values are interned to append-only stable ids (see
+interning.py), the dimension tables hold the ids and the values and the
+bridge tables hold the appid and the dimension id.
+"""
+
+# standard library imports
+import ast
+import os
+import sys
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import interning
+
+# the dataset loader and the transforms of the clean-up scripts
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cleanup'))
+import dataset  # noqa: E402
+import transforms  # noqa: E402
+
+# Exported columns used by the normalized tables
+EXPORT_COLUMNS = {
+    'steam': ['type', 'name', 'required_age', 'achievements', 'release_date', 'last_modified', 'coming_soon',
+              'price', 'review_score', 'owners', 'average_forever', 'median_forever', 'supported_languages',
+              'supported_audio', 'developers', 'publishers', 'categories', 'genres', 'tags', 'dlc', 'platforms'],
+    'steam_description_data': ['short_description', 'detailed_description'],
+    'steam_optional': ['content_descriptors', 'metacritic_score'],
+    'steam_support_info': ['website'],
+    'steam_requirements_data': ['pc_minimum', 'pc_recommended', 'mac_minimum', 'mac_recommended'],
+    'steamspy_tag_data': None,
+}
+
+LIST_COLUMNS = ['supported_languages', 'supported_audio', 'developers', 'publishers', 'categories', 'genres',
+                'tags', 'dlc', 'platforms']
+
+GAME_DATA_COLUMNS = [
+    'appid', 'type', 'name', 'required_age', 'achievements', 'release_date', 'last_modified', 'coming_soon',
+    'price_eu', 'review_score', 'owners_estimate_from', 'owners_estimate_to', 'average_forever', 'median_forever',
+    'short_description', 'detailed_description', 'content_descriptors', 'website', 'metacritic_score',
+]
+
+# Dimension tables: (id column, value column)
+DIMENSIONS = {
+    'languages': ('language_id', 'language'),
+    'developers': ('developer_id', 'developer'),
+    'publishers': ('publisher_id', 'publisher'),
+    'categories': ('category_id', 'category'),
+    'genres': ('genre_id', 'genre'),
+    'tags': ('tag_id', 'tag'),
+    'tags_steamspy': ('sptag_id', 'sptag'),
+}
+
+# Bridge tables of the steam list columns: (dimension, steam list column)
+BRIDGES = {
+    'app_language': ('languages', 'supported_languages'),
+    'app_language_audio': ('languages', 'supported_audio'),
+    'app_developer': ('developers', 'developers'),
+    'app_publisher': ('publishers', 'publishers'),
+    'app_category': ('categories', 'categories'),
+    'app_genre': ('genres', 'genres'),
+    'app_tag': ('tags', 'tags'),
+}
+
+
+def list_check(value):
+    """
+    Parse the list string of the csv export, a single item list if it isn't one.
+    """
+    if isinstance(value, list):
+        return value
+    if not isinstance(value, str):
+        return []
+    try:
+        result = ast.literal_eval(value)
+    except (ValueError, SyntaxError):
+        result = [value]
+    return result if isinstance(result, list) else [result]
+
+
+def read_csv_export(export_path, table, columns=None):
+    """
+    Read the csv export of the table, indexed by appid, with the list columns
+    parsed (each distinct list string once).
+    """
+    usecols = None if columns is None else ['appid', *columns]
+    df = pd.read_csv(os.path.join(export_path, table + '.csv'), usecols=usecols).set_index('appid')
+    for column in df.columns.intersection(LIST_COLUMNS):
+        df[column] = transforms.map_unique(df[column], list_check, persistent=False)
+    return df
+
+
+def read_export(export_path='./data/export/'):
+    """
+    Return {table: dataframe} of the exported tables used by the normalized
+    tables, from the typed Parquet/Feather export or the csv files.
+    """
+    data = {}
+    for table, columns in EXPORT_COLUMNS.items():
+        try:
+            data[table] = dataset.load_dataset(table, columns=columns, export_path=export_path)
+        except FileNotFoundError:
+            data[table] = read_csv_export(export_path, table, columns)
+    return data
+
+
+def get_game_data(data):
+    """
+    Return game_data table: steam columns merged with descriptions, optional
+    columns and website.
+    """
+    steam = data['steam']
+    df = steam[['type', 'name', 'required_age', 'achievements', 'release_date', 'last_modified', 'coming_soon',
+                'price', 'review_score', 'average_forever', 'median_forever']].copy()
+    df['release_date'] = pd.to_datetime(df['release_date'], errors='coerce').dt.date
+    # last_modified is a unix timestamp
+    df['last_modified'] = pd.to_datetime(df['last_modified'], unit='s', errors='coerce').dt.date
+    owners = steam['owners'].astype('object').str.split('-', n=1, expand=True).reindex(columns=[0, 1])
+    df['owners_estimate_from'] = pd.to_numeric(owners[0], errors='coerce').astype('Int64')
+    df['owners_estimate_to'] = pd.to_numeric(owners[1], errors='coerce').astype('Int64')
+    df = df.join(data['steam_description_data'][['short_description', 'detailed_description']])
+    df = df.join(data['steam_optional'][['content_descriptors', 'metacritic_score']])
+    df = df.join(data['steam_support_info'][['website']])
+    df['metacritic_score'] = pd.to_numeric(df['metacritic_score'], errors='coerce').astype('Int64')
+    df = df.rename(columns={'price': 'price_eu'})
+    df.index.name = 'appid'
+    return df.reset_index()[GAME_DATA_COLUMNS]
+
+
+def get_platforms(data):
+    """
+    Return platforms table: boolean column for each platform with the pc and mac requirements.
+    """
+    steam = data['steam']
+    platforms = steam['platforms'].map(lambda value: value if isinstance(value, list) else [])
+    df = pd.DataFrame({platform: platforms.map(lambda value: platform in value)
+                       for platform in ['windows', 'mac', 'linux']}, index=steam.index)
+    df = df.join(data['steam_requirements_data'][['pc_minimum', 'pc_recommended', 'mac_minimum',
+                                                  'mac_recommended']])
+    df.index.name = 'appid'
+    return df.reset_index()
+
+
+def get_dlcs(data):
+    """
+    Return dlcs table: (dlc_id, fullgame_id) for the DLCs in the data.
+    """
+    fullgame_ids, dlc_ids = interning.flatten_lists(data['steam']['dlc'])
+    df = pd.DataFrame({'dlc_id': pd.to_numeric(pd.Series(dlc_ids, dtype='object'), errors='coerce').astype('Int64'),
+                       'fullgame_id': fullgame_ids}).drop_duplicates()
+    df = df[df['dlc_id'].isin(data['steam'].index)]
+    return df.reset_index(drop=True)
+
+
+def get_steamspy_tags(data, dictionary):
+    """
+    Return app_steamspy_tag table: the SteamSpy tag ids and the user counts of the apps.
+    """
+    tag_data = data['steamspy_tag_data']
+    tag_data = tag_data[tag_data.index.isin(data['steam'].index)]
+    ids = dictionary.encode(tag_data.columns.astype(str))
+    users = tag_data.to_numpy(dtype='float64', na_value=0)
+    rows, columns = np.nonzero(users > 0)
+    df = pd.DataFrame({'appid': tag_data.index.to_numpy()[rows], 'sptag_id': ids[columns],
+                       'users': users[rows, columns].astype(np.int64)})
+    return df.sort_values(['appid', 'sptag_id']).reset_index(drop=True)
+
+
+def get_dictionaries(store=None):
+    """
+    Return {dimension: Dictionary} read from the DictionaryStore, empty
+    dictionaries without a store.
+    """
+    return {dimension: store.get(dimension) if store is not None else interning.Dictionary(dimension)
+            for dimension in DIMENSIONS}
+
+
+def normalize(data, store=None):
+    """
+    Return {table: dataframe} of the normalized tables.
+
+    Parameters
+    ----------
+    data : {table: dataframe} of the exported tables, from read_export
+
+    Keyword arguments
+    -----------------
+    store : DictionaryStore of the dimension ids, the new values are added
+        to it (default None, the ids are assigned in sorted order)
+    """
+    steam = data['steam']
+    dictionaries = get_dictionaries(store)
+    tables = {'game_data': get_game_data(data)}
+
+    for dimension, (id_column, _) in DIMENSIONS.items():
+        columns = {column: bridge for bridge, (name, column) in BRIDGES.items() if name == dimension}
+        if not columns:
+            continue
+        bridges = interning.encode_lists(steam, list(columns), dictionaries[dimension], id_column=id_column)
+        for column, bridge in columns.items():
+            tables[bridge] = bridges[column]
+
+    tables['app_steamspy_tag'] = get_steamspy_tags(data, dictionaries['tags_steamspy'])
+    tables['dlcs'] = get_dlcs(data)
+    tables['platforms'] = get_platforms(data)
+    for dimension, (id_column, value) in DIMENSIONS.items():
+        tables[dimension] = dictionaries[dimension].to_frame(id_column, value)
+        if store is not None:
+            store.save(dictionaries[dimension])
+    return tables
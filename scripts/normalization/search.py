@@ -0,0 +1,381 @@
+"""
+On-disk BM25 full-text index of the app descriptions
+(steam_description_data)
+
+The descriptions are stripped of the HTML, tokenized and written to index
+segments: sorted 64-bit term hashes with the offsets of their postings
+(document rows and term frequencies), memory-mapped by the queries. An
+update writes the new and changed apps to a new segment and marks their
+old documents deleted; the segments are merged when there are too many.
+
+Usage (from the repository root):
+    python scripts/normalization/search.py --export-path ./data/export/ "open world survival"
+"""
+
+# standard library imports
+import argparse
+import hashlib
+import html
+import itertools
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+# third-party imports
+import numpy as np
+import pandas as pd
+
+# project imports
+import normalize
+
+# Indexed description columns, about_the_game is a part of detailed_description
+FIELDS = ['short_description', 'detailed_description']
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Segments kept before they are merged into one
+MAX_SEGMENTS = 8
+
+# Longer tokens (urls, base64 images) are skipped
+MAX_TOKEN_LENGTH = 40
+
+INDEX_FILE = 'index.json'
+SEGMENT_ARRAYS = ['terms', 'offsets', 'docs', 'freqs', 'appids', 'lengths', 'hashes']
+
+TAG_RE = re.compile(r'<[^>]*>')
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+
+def strip_html(text):
+    """
+    Return the text without the HTML tags and entities.
+    """
+    if not isinstance(text, str):
+        return ''
+    return html.unescape(TAG_RE.sub(' ', text))
+
+
+def tokenize(text):
+    """
+    Return lowercase word tokens of the text, HTML stripped.
+    """
+    return [token for token in TOKEN_RE.findall(strip_html(text).lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+
+def term_hash(term):
+    """
+    Return the 64-bit hash of the term, the key of the terms in the index.
+    """
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def get_documents(df):
+    """
+    Return (appids, texts, hashes) of the descriptions dataframe (appid index).
+    """
+    texts = df[FIELDS[0]].fillna('').astype(str)
+    for field in FIELDS[1:]:
+        texts = texts + '\n' + df[field].fillna('').astype(str)
+    hashes = pd.util.hash_pandas_object(texts, index=False).to_numpy(dtype=np.uint64)
+    return df.index.to_numpy(dtype=np.int64), texts.tolist(), hashes
+
+
+def build_postings(texts):
+    """
+    Return (terms, offsets, docs, freqs, lengths) of the texts: sorted term
+    hashes, the postings range of each term and the document lengths.
+    """
+    tokens = [tokenize(text) for text in texts]
+    lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=len(tokens))
+    flat = np.empty(int(lengths.sum()), dtype=object)
+    flat[:] = list(itertools.chain.from_iterable(tokens))
+    codes, uniques = pd.factorize(flat)
+    hashes = np.fromiter((term_hash(term) for term in uniques), dtype=np.uint64, count=len(uniques))
+    docs = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    # (term, document) pairs with their frequencies
+    pairs, freqs = np.unique(codes.astype(np.int64) * max(len(texts), 1) + docs, return_counts=True)
+    term_hashes = hashes[pairs // max(len(texts), 1)]
+    return merge_postings(term_hashes, pairs % max(len(texts), 1), freqs, lengths)
+
+
+def merge_postings(term_hashes, docs, freqs, lengths):
+    """
+    Return (terms, offsets, docs, freqs, lengths) of the postings, given as
+    the term hash, the document row and the frequency of each posting.
+    """
+    order = np.lexsort((docs, term_hashes))
+    term_hashes = term_hashes[order]
+    terms, starts = np.unique(term_hashes, return_index=True)
+    offsets = np.append(starts, len(term_hashes)).astype(np.int64)
+    return terms, offsets, docs[order].astype(np.int32), freqs[order].astype(np.int32), lengths.astype(np.int32)
+
+
+class Segment:
+    """
+    Index segment directory with the memory-mapped arrays.
+
+    Parameters
+    ----------
+    path : segment directory
+    """
+    def __init__(self, path):
+        self.path = path
+        self.arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in SEGMENT_ARRAYS}
+        deleted_path = os.path.join(path, 'deleted.npy')
+        if os.path.isfile(deleted_path):
+            self.deleted = np.load(deleted_path)
+        else:
+            self.deleted = np.zeros(len(self.arrays['appids']), dtype=bool)
+
+    def __getattr__(self, name):
+        if name in SEGMENT_ARRAYS:
+            return self.arrays[name]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return len(self.arrays['appids'])
+
+    @property
+    def live(self):
+        return ~self.deleted
+
+    def postings(self, term):
+        """
+        Return (docs, freqs) of the term hash, empty if it isn't in the segment.
+        """
+        i = np.searchsorted(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            return self.docs[start:end], self.freqs[start:end]
+        return self.docs[:0], self.freqs[:0]
+
+    def save_deleted(self):
+        temp_path = os.path.join(self.path, 'deleted.tmp.npy')
+        np.save(temp_path, self.deleted)
+        os.replace(temp_path, os.path.join(self.path, 'deleted.npy'))
+
+    @staticmethod
+    def write(path, arrays):
+        """
+        Write the segment arrays to the directory and return the Segment.
+        """
+        temp_path = path + '.tmp'
+        shutil.rmtree(temp_path, ignore_errors=True)
+        os.makedirs(temp_path)
+        for name in SEGMENT_ARRAYS:
+            np.save(os.path.join(temp_path, name + '.npy'), arrays[name])
+        os.replace(temp_path, path)
+        return Segment(path)
+
+
+class SearchIndex:
+    """
+    BM25 index of the descriptions in the index directory.
+
+    Parameters
+    ----------
+    path : index directory, created if it doesn't exist
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, INDEX_FILE)
+        state = {'segments': [], 'next_segment': 0}
+        if os.path.isfile(index_path):
+            with open(index_path, 'r') as f:
+                state = json.load(f)
+        self.next_segment = state['next_segment']
+        self.segments = [Segment(os.path.join(path, name)) for name in state['segments']]
+
+    def _write_state(self):
+        state = {'segments': [os.path.basename(segment.path) for segment in self.segments],
+                 'next_segment': self.next_segment}
+        index_path = os.path.join(self.path, INDEX_FILE)
+        with open(index_path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(index_path + '.tmp', index_path)
+
+    def _new_segment(self, arrays):
+        # the segments written by an interrupted run are not in index.json, their names are skipped
+        while os.path.exists(os.path.join(self.path, f'segment-{self.next_segment:05d}')):
+            self.next_segment += 1
+        name = f'segment-{self.next_segment:05d}'
+        self.next_segment += 1
+        return Segment.write(os.path.join(self.path, name), arrays)
+
+    def __len__(self):
+        return sum(int(segment.live.sum()) for segment in self.segments)
+
+    def get_hashes(self):
+        """
+        Return appid-indexed series of the text hashes of the indexed apps.
+        """
+        appids = [segment.appids[segment.live] for segment in self.segments]
+        hashes = [segment.hashes[segment.live] for segment in self.segments]
+        if not appids:
+            return pd.Series(dtype=np.uint64)
+        return pd.Series(np.concatenate(hashes), index=np.concatenate(appids))
+
+    def update(self, df, full=False):
+        """
+        Index the new and changed descriptions and delete the removed apps.
+
+        Parameters
+        ----------
+        df : dataframe of the descriptions (FIELDS columns), indexed by appid
+
+        Keyword arguments
+        -----------------
+        full : rebuild the index from all the descriptions (default False)
+
+        Returns
+        -------
+        {'changed': number of the indexed apps, 'removed': number of the deleted apps}
+        """
+        appids, texts, hashes = get_documents(df)
+        indexed = pd.Series(dtype=np.uint64) if full else self.get_hashes()
+        positions = indexed.index.get_indexer(appids)
+        changed = positions < 0
+        changed[~changed] = indexed.to_numpy()[positions[~changed]] != hashes[~changed]
+        removed = indexed.index.difference(appids)
+
+        old_segments = list(self.segments) if full else []
+        if not full:
+            stale = np.concatenate([appids[changed], removed.to_numpy(dtype=np.int64)])
+            for segment in self.segments:
+                deleted = np.isin(segment.appids, stale) & segment.live
+                if deleted.any():
+                    segment.deleted |= deleted
+                    segment.save_deleted()
+
+        segments = [] if full else list(self.segments)
+        if changed.any():
+            terms, offsets, docs, freqs, lengths = build_postings([text for text, flag in zip(texts, changed) if flag])
+            segments.append(self._new_segment({
+                'terms': terms, 'offsets': offsets, 'docs': docs, 'freqs': freqs, 'lengths': lengths,
+                'appids': appids[changed], 'hashes': hashes[changed]}))
+        self.segments = segments
+        if len(self.segments) > MAX_SEGMENTS:
+            old_segments += self.segments
+            self.segments = [self.merge(self.segments)]
+        self._write_state()
+        for segment in old_segments:
+            if segment not in self.segments:
+                shutil.rmtree(segment.path, ignore_errors=True)
+        return {'changed': int(changed.sum()), 'removed': len(removed)}
+
+    def merge(self, segments):
+        """
+        Return a new segment with the live documents of the segments.
+        """
+        term_hashes, docs, freqs, lengths, appids, hashes = [], [], [], [], [], []
+        base = 0
+        for segment in segments:
+            live = segment.live
+            # new rows of the live documents, -1 for the deleted ones
+            rows = np.cumsum(live) - 1 + base
+            rows[~live] = -1
+            posting_terms = np.repeat(np.asarray(segment.terms), np.diff(segment.offsets))
+            posting_rows = rows[segment.docs]
+            kept = posting_rows >= 0
+            term_hashes.append(posting_terms[kept])
+            docs.append(posting_rows[kept])
+            freqs.append(np.asarray(segment.freqs)[kept])
+            lengths.append(np.asarray(segment.lengths)[live])
+            appids.append(np.asarray(segment.appids)[live])
+            hashes.append(np.asarray(segment.hashes)[live])
+            base += int(live.sum())
+        terms, offsets, docs, freqs, lengths = merge_postings(
+            np.concatenate(term_hashes), np.concatenate(docs), np.concatenate(freqs), np.concatenate(lengths))
+        return self._new_segment({'terms': terms, 'offsets': offsets, 'docs': docs, 'freqs': freqs,
+                                  'lengths': lengths, 'appids': np.concatenate(appids),
+                                  'hashes': np.concatenate(hashes)})
+
+    def search(self, query, k=10):
+        """
+        Return the k apps with the best BM25 score of the query.
+
+        Parameters
+        ----------
+        query : query text
+
+        Keyword arguments
+        -----------------
+        k : number of the results (default 10)
+
+        Returns
+        -------
+        list of (appid, score), the best first
+        """
+        terms = [term_hash(token) for token in dict.fromkeys(tokenize(query))]
+        if not terms or not self.segments:
+            return []
+        documents = len(self)
+        total_length = sum(float(segment.lengths[segment.live].sum()) for segment in self.segments)
+        average_length = total_length / max(documents, 1)
+        postings = [[segment.postings(term) for segment in self.segments] for term in terms]
+        # document frequencies of the live documents only
+        frequencies = [sum(int(np.count_nonzero(segment.live[docs])) for segment, (docs, _) in
+                           zip(self.segments, term_postings)) for term_postings in postings]
+
+        results = []
+        for i, segment in enumerate(self.segments):
+            scores = np.zeros(len(segment), dtype=np.float64)
+            norms = K1 * (1 - B + B * np.asarray(segment.lengths, dtype=np.float64) / max(average_length, 1))
+            for term_postings, frequency in zip(postings, frequencies):
+                idf = np.log(1 + (documents - frequency + 0.5) / (frequency + 0.5))
+                docs, freqs = term_postings[i]
+                freqs = np.asarray(freqs, dtype=np.float64)
+                scores[docs] += idf * freqs * (K1 + 1) / (freqs + norms[docs])
+            scores[segment.deleted] = 0
+            top = np.flatnonzero(scores)
+            if len(top) > k:
+                # all the ties of the k-th score are kept, the results are cut by (score, appid)
+                kth = -np.partition(-scores[top], k - 1)[k - 1]
+                top = top[scores[top] >= kth]
+            results.extend(zip(segment.appids[top].tolist(), scores[top].tolist()))
+        return sorted(results, key=lambda result: (-result[1], result[0]))[:k]
+
+
+def read_descriptions(export_path):
+    """
+    Return the description columns of the export, indexed by appid.
+    """
+    try:
+        return normalize.dataset.load_dataset('steam_description_data', columns=FIELDS, export_path=export_path)
+    except FileNotFoundError:
+        return normalize.read_csv_export(export_path, 'steam_description_data', FIELDS)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Full-text search of the app descriptions')
+    parser.add_argument('query', nargs='?', help='search query')
+    parser.add_argument('--export-path', default='./data/export/')
+    parser.add_argument('--index-path', help="index directory, default 'search/' in the export path")
+    parser.add_argument('-k', type=int, default=10, help='number of the results')
+    parser.add_argument('--full', action='store_true', help='rebuild the index')
+    parser.add_argument('--no-update', action='store_true', help="query the index without updating it")
+    args = parser.parse_args(args)
+
+    index = SearchIndex(args.index_path or os.path.join(args.export_path, 'search'))
+    if not args.no_update:
+        result = index.update(read_descriptions(args.export_path), full=args.full)
+        if result['changed'] or result['removed']:
+            print(f'Indexed {result["changed"]} apps, removed {result["removed"]} apps')
+    if args.query:
+        start = time.time()
+        results = index.search(args.query, args.k)
+        elapsed = time.time() - start
+        for appid, score in results:
+            print(f'{appid:10d}  {score:.3f}')
+        print(f'{len(results)} results in {1000 * elapsed:.1f} ms')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
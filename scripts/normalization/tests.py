@@ -0,0 +1,192 @@
+"""
+Normalization tests
+"""
+
+# standart library imports
+import os
+import random
+import shutil
+import tempfile
+
+# third party imports
+import pandas as pd
+
+# project imports
+import loader
+import normalize
+import search
+
+GENRES = ['Action', 'Adventure', 'Casual', 'Indie', 'RPG', 'Simulation', 'Strategy']
+WORDS = ['space', 'dungeon', 'farm', 'racing', 'puzzle', 'zombie', 'pixel', 'castle', 'ocean', 'robot']
+
+def get_export(app_count = 200, seed = 0):
+    """
+    Return synthetic {table: dataframe} of the exported tables, as from normalize.read_export
+
+    Parameters
+    ----------
+    app_count : number of the apps
+    seed : random seed
+    """
+    rng = random.Random(seed)
+    appids = pd.Index(range(10, 10 * app_count + 10, 10), name = 'appid')
+    pick = lambda values, count: sorted(rng.sample(values, rng.randint(0, count)))
+    steam = pd.DataFrame({
+        'type': 'game',
+        'name': [f'App {appid}' for appid in appids],
+        'required_age': 0,
+        'achievements': [rng.randint(0, 50) for _ in appids],
+        'release_date': [f'20{rng.randint(10, 21)}-0{rng.randint(1, 9)}-1{rng.randint(0, 9)}' for _ in appids],
+        'last_modified': [1600000000 + rng.randint(0, 10 ** 7) for _ in appids],
+        'coming_soon': False,
+        'price': [round(rng.uniform(0, 60), 2) for _ in appids],
+        'review_score': [rng.randint(0, 9) for _ in appids],
+        'owners': '20000-50000',
+        'average_forever': [rng.randint(0, 3000) for _ in appids],
+        'median_forever': [rng.randint(0, 3000) for _ in appids],
+        'supported_languages': [['English'] + pick(['French', 'German', 'Russian'], 3) for _ in appids],
+        'supported_audio': [pick(['English', 'German'], 2) for _ in appids],
+        'developers': [[f'Developer {appid % 17}'] for appid in appids],
+        'publishers': [[f'Publisher {appid % 11}'] for appid in appids],
+        'categories': [pick(['Single-player', 'Multi-player', 'Steam Cloud'], 3) for _ in appids],
+        'genres': [pick(GENRES, 3) for _ in appids],
+        'tags': [pick(GENRES, 4) for _ in appids],
+        'dlc': [[] for _ in appids],
+        'platforms': [['windows'] + pick(['mac', 'linux'], 2) for _ in appids],
+    }, index = appids)
+    descriptions = pd.DataFrame({
+        'short_description': [' '.join(rng.choices(WORDS, k = 5)) for _ in appids],
+        'detailed_description': [' '.join(rng.choices(WORDS, k = 30)) for _ in appids],
+    }, index = appids)
+    optional = pd.DataFrame({'content_descriptors': None,
+                             'metacritic_score': [rng.choice([None, rng.randint(50, 95)]) for _ in appids]},
+                            index = appids)
+    support = pd.DataFrame({'website': [f'https://example.com/{appid}' for appid in appids]}, index = appids)
+    requirements = pd.DataFrame({column: 'OS: Windows 10' for column in
+                                 ['pc_minimum', 'pc_recommended', 'mac_minimum', 'mac_recommended']},
+                                index = appids)
+    tag_data = pd.DataFrame({genre: [rng.choice([0, rng.randint(1, 500)]) for _ in appids] for genre in GENRES},
+                            index = appids)
+    return {'steam': steam, 'steam_description_data': descriptions, 'steam_optional': optional,
+            'steam_support_info': support, 'steam_requirements_data': requirements, 'steamspy_tag_data': tag_data}
+
+def drop_apps(data, appids):
+    """
+    Return the exported tables without the apps
+    """
+    return {table: df[~df.index.isin(appids)] for table, df in data.items()}
+
+def loader_incremental(verbose = False):
+    """
+    Testing incremental loads to a temporary SQLite database: an unchanged
+    export loads no apps, a changed app replaces its bridge rows, a removed
+    app is deleted with its bridge rows
+
+    Parameters
+    ----------
+    verbose : verbose output
+
+    Returns
+    bool :
+        True if no errors, otherwise False
+    """
+    temp_path = tempfile.mkdtemp(prefix = 'steam_loader_')
+    database = loader.SQLiteDatabase(os.path.join(temp_path, 'steam.sqlite'))
+    data = get_export()
+    try:
+        first = loader.load(database, normalize.normalize(data))
+        second = loader.load(database, normalize.normalize(data))
+
+        data['steam'].at[20, 'genres'] = ['Strategy']
+        changed = loader.load(database, normalize.normalize(data))
+        genres = database.fetch('''SELECT genre FROM app_genre JOIN genres USING (genre_id)
+                                   WHERE appid = 20''')
+
+        removed = loader.load(database, normalize.normalize(drop_apps(data, [30])))
+        bridge_rows = sum(database.fetch(f'SELECT COUNT(*) FROM {table} WHERE appid = 30')[0][0]
+                          for table in [*normalize.BRIDGES, 'app_steamspy_tag', 'platforms'])
+        apps = database.fetch('SELECT COUNT(*) FROM game_data')[0][0]
+    except Exception as e:
+        if (verbose):
+            print(e)
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(temp_path, ignore_errors = True)
+    if (verbose):
+        print(f'Loads: {first}, {second}, {changed}, {removed}')
+        print(f'Bridge rows of the removed app: {bridge_rows}')
+    return (first['changed'] == len(data['steam'])) and (second == {'changed': 0, 'removed': 0}) \
+        and (changed == {'changed': 1, 'removed': 0}) and (genres == [('Strategy',)]) \
+        and (removed == {'changed': 0, 'removed': 1}) and (bridge_rows == 0) and (apps == len(data['steam']) - 1)
+
+def search_updates(verbose = False):
+    """
+    Testing search index updates merged past search.MAX_SEGMENTS: the new
+    terms of the updated apps are found, their old terms and the removed
+    apps are not, and the scores match a freshly built index
+
+    Parameters
+    ----------
+    verbose : verbose output
+
+    Returns
+    bool :
+        True if no errors, otherwise False
+    """
+    temp_path = tempfile.mkdtemp(prefix = 'steam_search_')
+    descriptions = get_export()['steam_description_data'].copy()
+    updates = search.MAX_SEGMENTS + 4
+    for i in range(updates):
+        descriptions.iloc[i, 0] = f'blimp{i}'
+    removed_appid = descriptions.index[-1]
+    descriptions.iloc[-1, 0] = 'gondola'
+    queries = [*WORDS, 'hangar', 'space robot', 'airship3 castle']
+    try:
+        index = search.SearchIndex(os.path.join(temp_path, 'index'))
+        index.update(descriptions)
+        # each update adds a segment with the changed app
+        for i in range(updates):
+            descriptions.iloc[i, 0] = f'airship{i} hangar'
+            index.update(descriptions)
+        descriptions = descriptions.drop(removed_appid)
+        index.update(descriptions)
+        segments = len(index.segments)
+
+        found = [[appid for appid, _ in index.search(f'airship{i}')] for i in range(updates)]
+        old_terms = [index.search(f'blimp{i}') for i in range(updates)] + [index.search('gondola')]
+        results = [index.search(query, k = 20) for query in queries]
+        reindexed = search.SearchIndex(os.path.join(temp_path, 'fresh'))
+        reindexed.update(descriptions)
+        expected = [reindexed.search(query, k = 20) for query in queries]
+    except Exception as e:
+        if (verbose):
+            print(e)
+        return False
+    finally:
+        shutil.rmtree(temp_path, ignore_errors = True)
+    found = found == [[int(appid)] for appid in descriptions.index[:updates]]
+    old_terms = sum(map(len, old_terms))
+    same = [[appid for appid, _ in result] for result in results] == \
+        [[appid for appid, _ in result] for result in expected]
+    same = same and max(abs(score - fresh_score) for result, fresh in zip(results, expected)
+                        for (_, score), (_, fresh_score) in zip(result, fresh)) < 1e-9
+    if (verbose):
+        print(f'Search segments: {segments} of {search.MAX_SEGMENTS}, updated terms found: {found}, '
+              f'old terms found: {old_terms}, same as rebuilt: {same}')
+    return (segments <= search.MAX_SEGMENTS) and found and (old_terms == 0) and same
+
+def all(verbose = False):
+    # Incremental loads
+    if (loader_incremental(verbose)):
+        print('Loader incremental test PASSED')
+    else:
+        print('Loader incremental test FAILED')
+    # Search index updates and merges
+    if (search_updates(verbose)):
+        print('Search updates test PASSED')
+    else:
+        print('Search updates test FAILED')
+    return True
+
+all(verbose = True)